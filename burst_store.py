@@ -0,0 +1,199 @@
+# Converts the burst data of a downloaded burst export file (a zip archive of CSV files) into a
+# burst store: a flat binary file of samples plus a small index of the bursts in it. A burst store
+# is converted once, and is then opened instantly with BurstStore, which memory-maps the samples
+# and returns each burst as a NumPy view into the mapped file. Nothing is parsed or copied when a
+# burst is read, and processes that read the same store share the operating system's page cache.
+# Used by export-account-data.py and export-group-data.py when they are run with --burst-store.
+#
+# A burst store is a folder with two files:
+#  - samples.f32: The samples of every burst, back to back, as little-endian 32-bit floats.
+#  - index.json: The bursts in the store, ordered by node, sensor type and time, with the structure:
+#
+#  {
+#    "version": 1,
+#    "sampleCount": Number,
+#    "bursts": [{
+#      "nodeId": String,
+#      "sensorType": String,
+#      # Time of the burst, represented as milliseconds from the unix epoch.
+#      "timeMillis": Number,
+#      # Position of the first sample of the burst in samples.f32, counted in samples.
+#      "offset": Number,
+#      "sampleCount": Number
+#    }, ...]
+#  }
+#
+# Each row of a burst CSV file is expected to hold a timestamp followed by one or more samples.
+# Any columns before the timestamp are taken as the node id and sensor type (burst group exports
+# write them in the first two columns when EmbedMetadata is True). Without those columns, the
+# node id is the name of the CSV file within the zip archive. Consecutive rows with the same node,
+# sensor type and timestamp are joined into one burst, so files with one sample per row are
+# supported as well.
+
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+import bisect
+import csv
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import zipfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+samplesFileName = 'samples.f32'
+indexFileName = 'index.json'
+
+# Number of samples that are buffered in memory before they are appended to samples.f32.
+sampleBufferCount = 1024 * 1024
+
+# Returns the default path of the burst store for an export file, which is the path of the export
+# file with '.burst' in place of '.zip'.
+def get_burst_store_path(exportFilePath):
+    return str(Path(exportFilePath).with_suffix('.burst'))
+
+# Converts the burst CSV files in the export zip file at exportFilePath into a burst store at
+# storeFolderPath, replacing any existing store there. The zip archive is never extracted to disk;
+# each CSV file is streamed out of the archive a row at a time. The store is written to a temporary
+# folder that is renamed once it is complete, so a store is never left partially written. Returns
+# the number of bursts in the store.
+def convert_burst_export(exportFilePath, storeFolderPath):
+    partFolderPath = storeFolderPath + '.part'
+    shutil.rmtree(partFolderPath, ignore_errors = True)
+    os.makedirs(partFolderPath)
+
+    bursts = []
+    sampleCount = 0
+    sampleBuffer = array('f')
+    with open(os.path.join(partFolderPath, samplesFileName), 'wb') as samplesFile:
+        with zipfile.ZipFile(exportFilePath) as exportZipFile:
+            for memberInfo in exportZipFile.infolist():
+                if memberInfo.is_dir() or not memberInfo.filename.lower().endswith('.csv'):
+                    continue
+                with exportZipFile.open(memberInfo) as memberFile:
+                    rows = csv.reader(io.TextIOWrapper(memberFile, encoding = 'utf-8-sig', newline = ''))
+                    for nodeId, sensorType, timeMillis, samples in read_burst_rows(rows, Path(memberInfo.filename).stem):
+                        lastBurst = bursts[-1] if bursts else None
+                        if lastBurst is not None and (lastBurst['nodeId'], lastBurst['sensorType'], lastBurst['timeMillis']) == (nodeId, sensorType, timeMillis):
+                            lastBurst['sampleCount'] += len(samples)
+                        else:
+                            bursts.append({ 'nodeId': nodeId, 'sensorType': sensorType, 'timeMillis': timeMillis, 'offset': sampleCount, 'sampleCount': len(samples) })
+                        sampleBuffer.extend(samples)
+                        sampleCount += len(samples)
+                        if len(sampleBuffer) >= sampleBufferCount:
+                            write_samples(samplesFile, sampleBuffer)
+                            sampleBuffer = array('f')
+        write_samples(samplesFile, sampleBuffer)
+
+    bursts.sort(key = get_burst_key)
+    with open(os.path.join(partFolderPath, indexFileName), 'w') as indexFile:
+        json.dump({ 'version': 1, 'sampleCount': sampleCount, 'bursts': bursts }, indexFile)
+
+    shutil.rmtree(storeFolderPath, ignore_errors = True)
+    os.replace(partFolderPath, storeFolderPath)
+    return len(bursts)
+
+# Yields the node id, sensor type, time (in milliseconds) and samples of each row of a burst CSV
+# file. A header row and rows without a timestamp or samples are skipped.
+#  - memberStem: The name of the CSV file, used as the node id if the rows have no node id column.
+def read_burst_rows(rows, memberStem):
+    timeColumnIndex = None
+    for row in rows:
+        if timeColumnIndex is None:
+            # The timestamp is the first column that holds a time, within the first three columns.
+            timeColumnIndex = next((index for index, item in enumerate(row[:3]) if parse_time_millis(item) is not None), None)
+            if timeColumnIndex is None:
+                continue
+        if len(row) <= timeColumnIndex + 1:
+            continue
+        timeMillis = parse_time_millis(row[timeColumnIndex])
+        if timeMillis is None:
+            continue
+        try:
+            samples = [float(item) for item in row[timeColumnIndex + 1:] if item != '']
+        except ValueError:
+            continue
+        metadata = row[:timeColumnIndex]
+        nodeId = metadata[0] if len(metadata) > 0 else memberStem
+        sensorType = metadata[1] if len(metadata) > 1 else ''
+        yield nodeId, sensorType, timeMillis, samples
+
+# Converts a timestamp from a CSV file to milliseconds from the unix epoch. The timestamp can be
+# milliseconds from the unix epoch or an ISO 8601 date/time, which is taken to be in UTC if it has
+# no time zone. Returns None if item is not a timestamp.
+def parse_time_millis(item):
+    item = item.strip()
+    try:
+        number = float(item)
+        # Small numbers are samples or ids rather than times (1e11 milliseconds is in 1973).
+        return int(number) if math.isfinite(number) and number >= 1e11 else None
+    except ValueError:
+        pass
+    try:
+        dateTime = datetime.fromisoformat(item.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dateTime.tzinfo is None:
+        dateTime = dateTime.replace(tzinfo = timezone.utc)
+    return int(dateTime.timestamp() * 1000)
+
+def write_samples(samplesFile, sampleBuffer):
+    if sys.byteorder != 'little':
+        sampleBuffer.byteswap()
+    sampleBuffer.tofile(samplesFile)
+
+def get_burst_key(burst):
+    return (burst['nodeId'], burst['sensorType'], burst['timeMillis'])
+
+# Reads a burst store written by convert_burst_export. The samples file is memory-mapped read-only,
+# so opening a store only reads its index, and each burst is returned as a NumPy view into the
+# mapped file. Requires the numpy package.
+class BurstStore:
+    def __init__(self, storeFolderPath):
+        if np is None:
+            raise ImportError('Reading a burst store requires the numpy package. Install it with "pip install numpy".')
+        with open(os.path.join(storeFolderPath, indexFileName), 'r') as indexFile:
+            index = json.load(indexFile)
+        self.bursts = index['bursts']
+        self.burstKeys = [get_burst_key(burst) for burst in self.bursts]
+        if index['sampleCount'] > 0:
+            self.samples = np.memmap(os.path.join(storeFolderPath, samplesFileName), dtype = '<f4', mode = 'r', shape = (index['sampleCount'],))
+        else:
+            # A zero-length file cannot be memory-mapped.
+            self.samples = np.empty(0, dtype = '<f4')
+
+    def __len__(self):
+        return len(self.bursts)
+
+    # Returns the index entries of the bursts that match all of the given filters, ordered by node,
+    # sensor type and time.
+    #  - startMillis, endMillis: Only include bursts with startMillis <= time < endMillis.
+    def find_bursts(self, nodeId = None, sensorType = None, startMillis = None, endMillis = None):
+        if nodeId is not None and sensorType is not None:
+            # The bursts of a node and sensor type are contiguous and ordered by time.
+            first = bisect.bisect_left(self.burstKeys, (nodeId, sensorType, -math.inf if startMillis is None else startMillis))
+            last = bisect.bisect_left(self.burstKeys, (nodeId, sensorType, math.inf if endMillis is None else endMillis))
+            return self.bursts[first:last]
+        return [burst for burst in self.bursts
+            if (nodeId is None or burst['nodeId'] == nodeId)
+            and (sensorType is None or burst['sensorType'] == sensorType)
+            and (startMillis is None or burst['timeMillis'] >= startMillis)
+            and (endMillis is None or burst['timeMillis'] < endMillis)]
+
+    # Returns the samples of a burst (an entry returned by find_bursts) as a read-only NumPy array
+    # that is a view into the memory-mapped samples file.
+    def get_samples(self, burst):
+        return self.samples[burst['offset']:burst['offset'] + burst['sampleCount']]
+
+    # Returns the samples of the burst of a node and sensor type at timeMillis, or None if there is
+    # no such burst.
+    def get_burst_samples(self, nodeId, sensorType, timeMillis):
+        bursts = self.find_bursts(nodeId, sensorType, timeMillis, timeMillis + 1)
+        return self.get_samples(bursts[0]) if bursts else None
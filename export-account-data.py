@@ -1,224 +1,303 @@
 # Sample code for exporting an entire account's indicator data and burst data from SmartDiagnostics.
 
-from urllib import request
-from urllib.request import HTTPError
-from datetime import datetime
-from pathlib import Path
-import json
+from urllib.error import HTTPError
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import http.client
 import time
 import os
 import argparse
+import export_cache
+import export_common
+import export_parquet
+import export_planner
+import pipeline_metrics
+import sd_client
 
 # Initiates a burst data export.
 #  - startMillis: Indicates the start date, represented as milliseconds from the unix epoch,
 #                 within which export data will be included.
 #  - endMillis: Indicates the end date, represented as milliseconds from the unix epoch,
 #                 within which export data will be included.
-#  - apiKey: The api key for the account that contains the data to be exported.
+#  - apiClient: The sd_client.SmartDiagnosticsClient, created with the api key for the account
+#               that contains the data to be exported.
 #  - localExportFolderPath: A path on the local file system where exported data will be placed
 #                 upon export completion.
-def export_account_burst_data(startMillis, endMillis, apiKey, localExportFolderPath):
-    print(f'Exporting burst data between "{get_filename_friendly_date(startMillis)}" UTC and "{get_filename_friendly_date(endMillis)}" UTC')
+#  - downloadConnections: The number of parallel connections used to download the export file.
+def export_account_burst_data(startMillis, endMillis, apiClient, localExportFolderPath, downloadConnections = 1):
+    print(f'Exporting burst data between "{export_common.get_filename_friendly_date(startMillis)}" UTC and "{export_common.get_filename_friendly_date(endMillis)}" UTC')
     
-    requestData = {
-        "StartTime": startMillis,
-        "EndTime": endMillis,
-        # Specific node serial numbers for which export data will be included in the export. If this is
-        # empty, the export will include all nodes for the account associated with the API key.
-        "NodeSerialNumbers": [],
-        # Number of chronological burst samples, starting from earliest date, to include in the export
-        # within the specified time range. If set to 0, all samples in the time range are included.
-        "SampleSize": 0,
-        # Set to True to include the node id and the sensor type in the first two columns, respectively,
-        # of the exported data set files.
-        "EmbedMetadata": False
-    }
-
-    # Send the request to the web API.
-    httpResponse = request.urlopen(request.Request(
-        f'https://sd.kcftech.com/public/exports/burstData?apiKey={apiKey}',
-        # Convert the requestData dictionary to a JSON string that is represented as an array of bytes
-        # that is suitable for sending in this http request.
-        data = json.dumps(requestData).encode('utf-8'),
-        headers = { 'content-type': 'application/json', 'Accept': 'application/json' }
-    ))
-    # Read the export id from the http response.
-    exportId = httpResponse.read().decode('UTF-8').strip('"')
-    exportStatusResult = wait_for_export_completion(apiKey, exportId)
+    exportRequest = sd_client.get_burst_export_request(startMillis, endMillis)
     # Build the full path to where the file should be output locally. The filename will include
     # the time range of the export request.
-    exportFilePath = os.path.join(localExportFolderPath, f'{get_filename_friendly_date(startMillis)}--{get_filename_friendly_date(endMillis)}_burst.zip')
-    handle_export_result(exportStatusResult, exportFilePath)
+    exportFilePath = export_common.get_export_file_path(localExportFolderPath, startMillis, endMillis, 'burst')
+    cacheKey = export_common.get_export_cache_key(exportRequest, apiClient, endMillis)
+    if export_common.restore_cached_export(cacheKey, exportFilePath):
+        return True
+    try:
+        exportId = apiClient.submit_account_burst_export(startMillis, endMillis)
+    except HTTPError as err:
+        # The export is not started when there is no data in the time range.
+        if err.code != 404:
+            raise
+        print(f'** No burst data exists for the specified time frame. **')
+        return True
+    exportStatusResult = apiClient.wait_for_export_completion(exportId, 'burst')
+    return export_common.handle_export_result(apiClient, exportStatusResult, exportFilePath, downloadConnections, cacheKey)
 
 # Initiates an indicator data export.
 #  - startMillis: Indicates the start date, represented as milliseconds from the unix epoch,
 #                 within which export data will be included.
 #  - endMillis: Indicates the end date, represented as milliseconds from the unix epoch,
 #                 within which export data will be included.
-#  - apiKey: The api key for the account that contains the data to be exported.
+#  - apiClient: The sd_client.SmartDiagnosticsClient, created with the api key for the account
+#               that contains the data to be exported.
 #  - localExportFolderPath: A path on the local file system where exported data will be placed
 #           upon export completion.
-def export_account_indicator_data(startMillis, endMillis, apiKey, localExportFolderPath):
-    print(f'Exporting indicator data between "{get_filename_friendly_date(startMillis)}" UTC and "{get_filename_friendly_date(endMillis)}" UTC')
-
-    requestData = {
-        "StartTime": startMillis,
-        "EndTime": endMillis,
-        # Set to True to include the parent group hierarchy ids and names in the first two columns
-        # of the exported data set files. Default value is False.
-        "EmbedMetadata": False,
-        # Specific indicator ids for which data will be included in the export. If this is empty (default),
-        # the request will include all indicators for the account associated with the API key.
-        "IndicatorIds": [],
-        # Specific indicator types that should be either included or excluded from the exported data 
-        # set files. If not specified, all indicator types are included. Valid types are:
-        #
-        #   "Voltage","DamageAccumulationAccel","Temperature","VibrationOverallCrestFactorAccel",
-        #   "VibrationOverallPeakAccel","VibrationOverallRmsAccel","VibrationBandMax","VibrationOverall",
-        #   "VibrationOverallPeak","VibrationOverallRms","RunningSpeed","SignalStrength","Pressure",
-        #   "Flow","Humidity","Power","DifferentialPressure","GeneralizedAtoD","VibrationBandRms",
-        #   "VibrationOverallSkewness","VibrationOverallKurtosis","VibrationOverallCrestFactor",
-        #   "DamageAccumulation","VibrationBandRmsAccel","VibrationBandMaxAccel",
-        #   "VibrationOverallSkewnessAccel", "VibrationOverallKurtosisAccel","VibrationOverallAccel",
-        #   "GeneralTimeSeries","Math","OnStatistics", "OffStatistics","AlarmStatistics",
-        #   "WarningStatistics","PositivePeakPressure","NegativePeakPressure", "RmsPressure",
-        #   "BandPressure","OnPercentStatistics","OffPercentStatistics","AlarmPercentStatistics",
-        #   "WarningPercentStatistics","DamageAccumulationPressure","OilHumidity","OilTemperature",
-        #   "DamageAccumulationAccelRaw","MultiSensorDifferentialPressure","Group"
-        "FilteredIndicatorTypes": [],
-        # If True, the indicator types specified in the FilteredIndicatorTypes property will be excluded
-        # from the exported data. If False (default), the types will be included in the exported data.
-        "FilterExclude": False
-    }
-
-    # Send the request to the web API.
-    httpResponse = request.urlopen(request.Request(
-        f'https://sd.kcftech.com/public/exports/indicatorData?apiKey={apiKey}',
-        # Convert the requestData dictionary to a JSON string that is represented as an array of bytes
-        # that is suitable for sending in this http request.
-        data = json.dumps(requestData).encode('utf-8'),
-        headers = { 'content-type': 'application/json', 'Accept': 'application/json' }
-    ))
-    # Read the export id from the http response.
-    exportId = httpResponse.read().decode('UTF-8').strip('"')
-    exportStatusResult = wait_for_export_completion(apiKey, exportId)
+#  - downloadConnections: The number of parallel connections used to download the export file.
+def export_account_indicator_data(startMillis, endMillis, apiClient, localExportFolderPath, downloadConnections = 1):
+    print(f'Exporting indicator data between "{export_common.get_filename_friendly_date(startMillis)}" UTC and "{export_common.get_filename_friendly_date(endMillis)}" UTC')
+
+    exportRequest = sd_client.get_indicator_export_request(startMillis, endMillis)
     # Build the full path to where the file should be output locally. The filename will include
     # the time range of the export request.
-    exportFilePath = os.path.join(localExportFolderPath, f'{get_filename_friendly_date(startMillis)}--{get_filename_friendly_date(endMillis)}_indicator.zip')
-    handle_export_result(exportStatusResult, exportFilePath)
-
-# Polls the export status API until the export has completed. Once the export has completed,
-# this method returns an object describing whether the final state of the export process. Refer
-# to get_export_status_result for the definition of this object.
-def wait_for_export_completion(apiKey, exportId):
-    exportCompleted = False
-    while not exportCompleted:
-        exportStatusResult = get_export_status_result(exportId, apiKey)
-        exportCompleted = exportStatusResult['exportCompleted']
-        if not exportCompleted:
-            print('Export still in progress...')
-            # Sleep for a few seconds before trying to check the status from the server again.
-            time.sleep(4)
-        else:
-            return exportStatusResult
-
-# Returns an object that describes the current status of a given export.
-# This object structure is:
-#    
-#  {
-#    "downloadUrl": "String",
-#    "exportCompleted": Boolean,
-#    "reportsProgress": Boolean,
-#    "progress": Integer,
-#    "error": "String"
-#  }
-def get_export_status_result(exportId, apiKey):
-    # Send the status request to the web API.
-    httpResponse = request.urlopen(request.Request(
-        f'https://sd.kcftech.com/public/exports/{exportId}/status?apiKey={apiKey}',
-        headers = { 'content-type': 'application/json', 'Accept': 'application/json' }
-    ))
-    # Read the export status JSON string from the http response.
-    stringResult = httpResponse.read().decode('UTF-8')
-    # Convert and return the string result as an object.
-    return json.loads(stringResult)
-
-# Downloads the exported data to the specified localExportFilePath (if the export was successful).
-def handle_export_result(exportStatusResult, localExportFilePath):
-    if 'downloadUrl' in exportStatusResult:
-        # Download the export file to the local exportFilePath.
-        request.urlretrieve(exportStatusResult['downloadUrl'], localExportFilePath)
-        print(f'** Export file downloaded to {localExportFilePath} **')
+    exportFilePath = export_common.get_export_file_path(localExportFolderPath, startMillis, endMillis, 'indicator')
+    cacheKey = export_common.get_export_cache_key(exportRequest, apiClient, endMillis)
+    if export_common.restore_cached_export(cacheKey, exportFilePath):
+        return True
+    try:
+        exportId = apiClient.submit_account_indicator_export(startMillis, endMillis)
+    except HTTPError as err:
+        # The export is not started when there is no data in the time range.
+        if err.code != 404:
+            raise
+        print(f'** No indicator data exists for the specified time frame. **')
+        return True
+    exportStatusResult = apiClient.wait_for_export_completion(exportId, 'indicator')
+    return export_common.handle_export_result(apiClient, exportStatusResult, exportFilePath, downloadConnections, cacheKey)
+
+# Exports the time range between startMillis and endMillis as a series of smaller windows (shards)
+# that run concurrently on the server. At most maxConcurrent exports are in progress at once; the
+# status of all of them is tracked by a single sd_client.ExportStatusPoller, and each shard is downloaded as
+# soon as it completes while the remaining shards keep running.
+# Returns the end of the time range, in milliseconds, up to which every shard has been exported
+# successfully (i.e. the end of the last shard before the first one that failed).
+#  - exportType: Either 'indicator' or 'burst'.
+#  - shardMillis: The length of each export window, in milliseconds (refer to get_shard_windows),
+#                 or 'auto' to let export_common.exportPlanner choose the length of each window.
+#  - maxConcurrent: The maximum number of exports in progress on the server at any one time.
+# Refer to export_account_indicator_data for a description of the remaining parameters.
+def export_account_data_sharded(exportType, startMillis, endMillis, shardMillis, maxConcurrent, apiClient, localExportFolderPath, downloadConnections = 1):
+    plannerScope = get_planner_scope(apiClient.apiKey)
+    if shardMillis == 'auto':
+        print(f'Exporting {exportType} data between "{export_common.get_filename_friendly_date(startMillis)}" UTC and "{export_common.get_filename_friendly_date(endMillis)}" UTC in shards sized from earlier exports')
+        pendingWindows = export_common.exportPlanner.plan_windows(plannerScope, exportType, startMillis, endMillis)
     else:
-        exportErrorText = exportStatusResult["error"]
-        if exportErrorText == 'No data to export.':
-            print(f'** The export completed with an empty data set. No file was downloaded. **')
-        else:
-            print(f'** Something went wrong with the export: "{exportStatusResult["error"]}" **')
+        print(f'Exporting {exportType} data between "{export_common.get_filename_friendly_date(startMillis)}" UTC and "{export_common.get_filename_friendly_date(endMillis)}" UTC in shards of {shardMillis / 60000:g} minutes')
+        pendingWindows = export_common.get_shard_windows(startMillis, endMillis, shardMillis)
+    # Maps the id of each export that is in progress on the server to its (start, end) window, its
+    # key in the export cache and the time it was submitted.
+    exportWindows = {}
+    # Maps the start of each submitted window to its end and the outcome of its export: None when
+    # there is nothing to download, False when the export could not be started, or the future of its
+    # download.
+    windowResults = {}
+    submitFailed = False
+    poller = sd_client.ExportStatusPoller(apiClient)
+    with ThreadPoolExecutor(max_workers = maxConcurrent) as downloadExecutor:
+        while True:
+            # Keep up to maxConcurrent exports in progress on the server.
+            while not submitFailed and len(exportWindows) < maxConcurrent:
+                window = next(pendingWindows, None)
+                if window is None:
+                    break
+                exportRequest = sd_client.get_export_request(exportType, window[0], window[1])
+                cacheKey = export_common.get_export_cache_key(exportRequest, apiClient, window[1])
+                if export_common.restore_cached_export(cacheKey, export_common.get_export_file_path(localExportFolderPath, window[0], window[1], exportType)):
+                    windowResults[window[0]] = (window[1], None)
+                    continue
+                try:
+                    exportId = apiClient.submit_export(exportRequest)
+                except (http.client.HTTPException, OSError) as err:
+                    if isinstance(err, HTTPError) and err.code == 401:
+                        raise
+                    if not isinstance(err, HTTPError) or err.code != 404:
+                        # No later shard is submitted, but the exports already in progress still
+                        # finish, so the shards before this one are recorded as exported.
+                        print(f'** The {exportType} export between "{export_common.get_filename_friendly_date(window[0])}" UTC and "{export_common.get_filename_friendly_date(window[1])}" UTC could not be started: {err} **')
+                        windowResults[window[0]] = (window[1], False)
+                        submitFailed = True
+                        break
+                    # A shard without any data should not stop the remaining shards from exporting.
+                    print(f'** No {exportType} data exists between "{export_common.get_filename_friendly_date(window[0])}" UTC and "{export_common.get_filename_friendly_date(window[1])}" UTC. **')
+                    windowResults[window[0]] = (window[1], None)
+                    if export_common.exportPlanner is not None:
+                        export_common.exportPlanner.record(plannerScope, exportType, window[1] - window[0], 0, 0)
+                    continue
+                exportWindows[exportId] = (window, cacheKey, time.monotonic())
+                poller.track(exportId, exportType)
 
+            if not exportWindows:
+                break
 
-def datetime_to_millis(dateTime):
-    return dateTime.timestamp() * 1000
+            exportId, exportStatusResult = poller.wait_for_next_completion()
+            (windowStart, windowEnd), cacheKey, submittedAt = exportWindows.pop(exportId)
+            exportFilePath = export_common.get_export_file_path(localExportFolderPath, windowStart, windowEnd, exportType)
+            exportCost = (plannerScope, exportType, windowEnd - windowStart, time.monotonic() - submittedAt)
+            # Download in the background so that polling and submitting continue meanwhile.
+            windowResults[windowStart] = (windowEnd, downloadExecutor.submit(export_common.handle_windowed_export_result, apiClient, exportStatusResult, exportFilePath, downloadConnections, cacheKey, exportCost))
 
-def datetime_string_to_millis(dateTimeString):
-    dateTime = datetime.strptime(dateTimeString, '%Y-%m-%d %H:%M:%S')
-    return datetime_to_millis(dateTime)
+    exportedUntilMillis = startMillis
+    for windowStart in sorted(windowResults):
+        windowEnd, downloadResult = windowResults[windowStart]
+        if downloadResult is False:
+            break
+        if downloadResult is not None:
+            # A shard whose download raised an error has failed like a shard whose export failed,
+            # and the shards before it are still recorded as exported.
+            try:
+                if not downloadResult.result():
+                    break
+            except Exception as err:
+                print(f'** The {exportType} export file between "{export_common.get_filename_friendly_date(windowStart)}" UTC and "{export_common.get_filename_friendly_date(windowEnd)}" UTC could not be downloaded: {err} **')
+                break
+        exportedUntilMillis = windowEnd
+    return exportedUntilMillis
 
-def millis_to_datetime(millis):
-    return datetime.fromtimestamp(millis / 1000)
+# Returns the name under which the export planner records the exports of the account. Like the
+# sync state file, it is based on a hash of the API key so that the key itself is not written to disk.
+def get_planner_scope(apiKey):
+    return 'account-' + hashlib.sha256(apiKey.encode('utf-8')).hexdigest()[:16]
 
-# Convert the input millis to a format that is allowed in a filename (something like '2019-07-20_06-12-42')
-def get_filename_friendly_date(millis):
-    dt = millis_to_datetime(millis)
-    return dt.strftime('%Y-%m-%d %H-%M-%S')
+# Returns the path of the file that records how far the account's data has been exported when the
+# script is run with --sync. The file is named after a hash of the API key so that the key itself
+# is not written to disk.
+def get_sync_state_file_path(localExportFolderPath, apiKey):
+    accountHash = hashlib.sha256(apiKey.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(localExportFolderPath, '.sd-sync-state', f'account-{accountHash}.json')
 
 
 
 ap = argparse.ArgumentParser()
 ap.add_argument('-a', '--apikey', required = True,
    help = 'Your account API Key.')
-ap.add_argument('-s', '--start', required = True,
-   help = 'The start date/time of the export range in the format "YYYY-MM-DD HH:mm:ss" (e.g. "2018-09-25 00:00:00").')
+ap.add_argument('-s', '--start', required = False,
+   help = 'The start date/time of the export range in the format "YYYY-MM-DD HH:mm:ss" (e.g. "2018-09-25 00:00:00"). Required unless --sync is specified and a previous sync has been recorded.')
 ap.add_argument('-e', '--end', required = False,
    help = 'The end date/time of the export range in the format "YYYY-MM-DD HH:mm:ss" (e.g. "2018-09-25 00:00:00"). Defaults to the current date/time if omitted.')
 ap.add_argument('-i', '--indicator', required = False, action='store_true',
    help = 'Specify this flag to include indicator data in the export.')
 ap.add_argument('-b', '--burst', required = False, action='store_true',
    help = 'Specify this flag to include burst data in the export.')
+ap.add_argument('--shard-by', required = False, type = export_common.shard_size_to_millis,
+   help = 'Splits the export range into windows of the given size and exports them concurrently. Valid values are "day", "hour", "N-minutes" (e.g. "30-minutes"), or "auto" to size each window from the duration and file size of earlier exports.')
+ap.add_argument('--target-export-mb', required = False, type = float, default = 200,
+   help = 'The export file size that --shard-by auto aims for, in megabytes. Defaults to 200.')
+ap.add_argument('--target-export-minutes', required = False, type = float, default = 10,
+   help = 'The server-side export duration that --shard-by auto aims for, in minutes. Defaults to 10.')
+ap.add_argument('--max-concurrent', required = False, type = int, default = 4,
+   help = 'The maximum number of sharded exports that are in progress on the server at once. Only used with --shard-by. Defaults to 4.')
+ap.add_argument('--download-connections', required = False, type = int, default = 1,
+   help = 'The number of parallel connections used to download each export file. Defaults to 1.')
+ap.add_argument('--parquet-dir', required = False,
+   help = 'A folder to add the rows of each downloaded export file to, as a Parquet dataset partitioned by indicator type or node and by day. Requires the pyarrow package.')
+ap.add_argument('--burst-store', required = False, action='store_true',
+   help = 'Specify this flag to also convert each downloaded burst export file into a burst store, which can be read quickly with burst_store.BurstStore.')
+ap.add_argument('--cache-dir', required = False,
+   help = 'A folder in which to cache downloaded export files. An export that is requested again is copied from the cache instead of running on the server. Only time ranges that ended more than an hour ago are cached.')
+ap.add_argument('--cache-max-gb', required = False, type = float, default = 10,
+   help = 'The maximum size of the export cache in gigabytes. The least recently used files are removed first. Defaults to 10.')
+ap.add_argument('--cache-ttl-days', required = False, type = float, default = 30,
+   help = 'The number of days after which a cached export file expires. Defaults to 30.')
+ap.add_argument('--metrics-file', required = False,
+   help = 'A file to append the timing, size and retry count of every export stage to, as JSON lines.')
+ap.add_argument('--prometheus-file', required = False,
+   help = 'A file to write the totals of every export stage to at the end of the run, in the Prometheus text format.')
+ap.add_argument('--timeout', required = False, type = float, default = 60,
+   help = 'The number of seconds to wait for the web API to respond before a request fails. Defaults to 60.')
+ap.add_argument('--max-requests-per-second', required = False, type = float, default = 10,
+   help = 'The maximum rate of requests to the web API. The rate is lowered automatically while the API is throttling requests. Defaults to 10.')
+ap.add_argument('--sync', required = False, action='store_true',
+   help = 'Specify this flag to export only the data since the end of the previous --sync run. The first --sync run starts at --start.')
 args = vars(ap.parse_args())
 if not args['burst'] and not args['indicator']:
     ap.error('You must specify at least one type of export (i.e. burst or indicator).')
+if args['start'] is None and not args['sync']:
+    ap.error('the following arguments are required: -s/--start')
+if args['max_concurrent'] < 1:
+    ap.error('--max-concurrent must be at least 1.')
+if args['download_connections'] < 1:
+    ap.error('--download-connections must be at least 1.')
+if args['parquet_dir'] is not None and not export_parquet.is_pyarrow_installed():
+    ap.error('--parquet-dir requires the pyarrow package. Install it with "pip install pyarrow".')
 
 apiKey = args['apikey']
-startMillis = datetime_string_to_millis(args['start'])
-endMillis = datetime_to_millis(datetime.utcnow())
+startMillis = None
+endMillis = export_common.get_current_millis()
 includeIndicator = args['indicator']
 includeBurst = args['burst']
+shardMillis = args['shard_by']
+maxConcurrent = args['max_concurrent']
+downloadConnections = args['download_connections']
+syncMode = args['sync']
+export_common.parquetDatasetFolderPath = args['parquet_dir']
+export_common.convertBurstStores = args['burst_store']
+pipelineMetrics = pipeline_metrics.MetricsRecorder(args['metrics_file'], args['prometheus_file'])
+apiClient = sd_client.SmartDiagnosticsClient(apiKey, args['timeout'], args['max_requests_per_second'], pipelineMetrics)
+if shardMillis == 'auto':
+    export_common.exportPlanner = export_planner.ExportPlanner('.sd-export-history.json', args['target_export_mb'] * 1024 * 1024, args['target_export_minutes'] * 60)
+if args['cache_dir'] is not None:
+    export_common.exportCache = export_cache.ExportCache(args['cache_dir'], int(args['cache_max_gb'] * 1024 ** 3), args['cache_ttl_days'] * 24 * 60 * 60)
 
+if args['start'] is not None:
+    startMillis = export_common.datetime_string_to_millis(args['start'])
 if args['end'] is not None:
-    endMillis = datetime_string_to_millis(args['end'])
+    endMillis = export_common.datetime_string_to_millis(args['end'])
     
 # Defaults to outputting the exported files to the current path where this script is run.
 localDataExportFolderPath = '.'
 
-if includeIndicator:
+if syncMode:
+    syncStateFilePath = get_sync_state_file_path(localDataExportFolderPath, apiKey)
+    syncState = export_common.load_sync_state(syncStateFilePath)
+
+for exportType, includeExportType in [('indicator', includeIndicator), ('burst', includeBurst)]:
+    if not includeExportType:
+        continue
+
+    exportStartMillis = startMillis
+    if syncMode:
+        # Continue from where the previous sync of this type of data left off.
+        exportStartMillis = syncState.get(exportType, {}).get('endMillis', startMillis)
+        if exportStartMillis is None:
+            print(f'** No previous {exportType} sync was found. Specify --start for the first --sync run. **')
+            continue
+        if exportStartMillis >= endMillis:
+            print(f'** The {exportType} data is already synced up to "{export_common.get_filename_friendly_date(exportStartMillis)}" UTC. **')
+            continue
+
+    exportedUntilMillis = exportStartMillis
     try:
-       export_account_indicator_data(startMillis, endMillis, apiKey, localDataExportFolderPath)
-    except HTTPError as err:
-       if err.code == 401:
-           print(f'** The specified API key is invalid. **')
-       elif err.code == 404:
-           print(f'** No indicator data exists for the specified time frame. **')
+       if shardMillis is not None:
+           exportedUntilMillis = export_account_data_sharded(exportType, exportStartMillis, endMillis, shardMillis, maxConcurrent, apiClient, localDataExportFolderPath, downloadConnections)
+       elif exportType == 'indicator':
+           if export_account_indicator_data(exportStartMillis, endMillis, apiClient, localDataExportFolderPath, downloadConnections):
+               exportedUntilMillis = endMillis
        else:
-           raise
-if includeBurst:
-    try:
-       export_account_burst_data(startMillis, endMillis, apiKey, localDataExportFolderPath)
+           if export_account_burst_data(exportStartMillis, endMillis, apiClient, localDataExportFolderPath, downloadConnections):
+               exportedUntilMillis = endMillis
     except HTTPError as err:
        if err.code == 401:
            print(f'** The specified API key is invalid. **')
-       elif err.code == 404:
-           print(f'** No burst data exists for the specified time frame. **')
        else:
            raise
-    
+
+    syncedUntilMillis = export_common.get_synced_until_millis(exportedUntilMillis)
+    if syncMode and syncedUntilMillis > exportStartMillis:
+        syncState[exportType] = { 'endMillis': syncedUntilMillis }
+        export_common.save_sync_state(syncStateFilePath, syncState)
+        print(f'** The {exportType} data is now synced up to "{export_common.get_filename_friendly_date(syncedUntilMillis)}" UTC. **')
+
+apiClient.close()
+# Write the Prometheus file, if one was requested.
+pipelineMetrics.close()
@@ -1,156 +1,126 @@
 # Sample code for exporting a group's indicator data and burst data from SmartDiagnostics.
 
-from urllib import request
-from urllib.request import HTTPError
-from datetime import datetime
-from pathlib import Path
-import json
+from urllib.error import HTTPError
+from concurrent.futures import ThreadPoolExecutor
+import http.client
 import time
 import os
 import argparse
+import export_cache
+import export_common
+import export_parquet
+import export_planner
+import pipeline_metrics
+import sd_client
 
-# Initiates a burst data group export.
-#  - groupId: The group to include in the export.
-#  - startMillis: Indicates the start date, represented as milliseconds from the unix epoch,
-#                 within which export data will be included.
-#  - endMillis: Indicates the end date, represented as milliseconds from the unix epoch,
-#                 within which export data will be included.
-#  - apiKey: The api key for the account that contains the data to be exported.
-#  - localExportFolderPath: A path on the local file system where exported data will be placed
-#                 upon export completion.
-def export_group_burst_data(groupId, startMillis, endMillis, apiKey, localExportFolderPath):
-    print(f'Exporting burst data for group {groupId} between "{get_filename_friendly_date(startMillis)}" UTC and "{get_filename_friendly_date(endMillis)}" UTC')
-    
-    requestData = {
-        "StartTime": startMillis,
-        "EndTime": endMillis,
-        # Number of chronological burst samples, starting from earliest date, to include in the export
-        # within the specified time range. If set to 0, all samples in the time range are included.
-        "SampleSize": 0,
-        # Set to True to include the node id and the sensor type in the first two columns, respectively,
-        # of the exported data set files.
-        "EmbedMetadata": False
-    }
-
-    # Send the request to the web API.
-    httpResponse = request.urlopen(request.Request(
-        f'https://sd.kcftech.com/public/exports/group/{groupId}/burstData?apiKey={apiKey}',
-        # Convert the requestData dictionary to a JSON string that is represented as an array of bytes
-        # that is suitable for sending in this http request.
-        data = json.dumps(requestData).encode('utf-8'),
-        headers = { 'content-type': 'application/json', 'Accept': 'application/json' }
-    ))
-    # Read the export id from the http response.
-    exportId = httpResponse.read().decode('UTF-8').strip('"')
-    exportStatusResult = wait_for_export_completion(apiKey, exportId)
-    # Build the full path to where the file should be output locally. The filename will include
-    # the time range of the export request.
-    exportFilePath = os.path.join(localExportFolderPath, f'{get_filename_friendly_date(startMillis)}--{get_filename_friendly_date(endMillis)}_burst.zip')
-    handle_export_result(exportStatusResult, exportFilePath)
-
-# Initiates an indicator group data export.
-#  - groupId: The group to include in the export.
-#  - startMillis: Indicates the start date, represented as milliseconds from the unix epoch,
-#                 within which export data will be included.
-#  - endMillis: Indicates the end date, represented as milliseconds from the unix epoch,
-#                 within which export data will be included.
-#  - apiKey: The api key for the account that contains the data to be exported.
-#  - localExportFolderPath: A path on the local file system where exported data will be placed
-#           upon export completion.
-def export_group_indicator_data(groupId, startMillis, endMillis, apiKey, localExportFolderPath):
-    print(f'Exporting indicator data for group {groupId} between "{get_filename_friendly_date(startMillis)}" UTC and "{get_filename_friendly_date(endMillis)}" UTC')
-
-    requestData = {
-        "StartTime": startMillis,
-        "EndTime": endMillis,
-        # Set to True to include the parent group hierarchy ids and names in the first two columns
-        # of the exported data set files. Default value is False.
-        "EmbedMetadata": False,
-        # Specific indicator types that should be either included or excluded from the exported data 
-        # set files. If not specified, all indicator types are included. Valid types are:
-        #
-        #   "Voltage","DamageAccumulationAccel","Temperature","VibrationOverallCrestFactorAccel",
-        #   "VibrationOverallPeakAccel","VibrationOverallRmsAccel","VibrationBandMax","VibrationOverall",
-        #   "VibrationOverallPeak","VibrationOverallRms","RunningSpeed","SignalStrength","Pressure",
-        #   "Flow","Humidity","Power","DifferentialPressure","GeneralizedAtoD","VibrationBandRms",
-        #   "VibrationOverallSkewness","VibrationOverallKurtosis","VibrationOverallCrestFactor",
-        #   "DamageAccumulation","VibrationBandRmsAccel","VibrationBandMaxAccel",
-        #   "VibrationOverallSkewnessAccel", "VibrationOverallKurtosisAccel","VibrationOverallAccel",
-        #   "GeneralTimeSeries","Math","OnStatistics", "OffStatistics","AlarmStatistics",
-        #   "WarningStatistics","PositivePeakPressure","NegativePeakPressure", "RmsPressure",
-        #   "BandPressure","OnPercentStatistics","OffPercentStatistics","AlarmPercentStatistics",
-        #   "WarningPercentStatistics","DamageAccumulationPressure","OilHumidity","OilTemperature",
-        #   "DamageAccumulationAccelRaw","MultiSensorDifferentialPressure","Group"
-        "FilteredIndicatorTypes": [],
-        # If True, the indicator types specified in the FilteredIndicatorTypes property will be excluded
-        # from the exported data. If False (default), the types will be included in the exported data.
-        "FilterExclude": False
-    }
-
-    # Send the request to the web API.
-    httpResponse = request.urlopen(request.Request(
-        f'https://sd.kcftech.com/public/exports/group/{groupId}/indicatorData?apiKey={apiKey}',
-        # Convert the requestData dictionary to a JSON string that is represented as an array of bytes
-        # that is suitable for sending in this http request.
-        data = json.dumps(requestData).encode('utf-8'),
-        headers = { 'content-type': 'application/json', 'Accept': 'application/json' }
-    ))
-    # Read the export id from the http response.
-    exportId = httpResponse.read().decode('UTF-8').strip('"')
-    exportStatusResult = wait_for_export_completion(apiKey, exportId)
-    # Build the full path to where the file should be output locally. The filename will include
-    # the time range of the export request.
-    exportFilePath = os.path.join(localExportFolderPath, f'{get_filename_friendly_date(startMillis)}--{get_filename_friendly_date(endMillis)}_indicator.zip')
-    handle_export_result(exportStatusResult, exportFilePath)
-
-# Polls the export status API until the export has completed. Once the export has completed,
-# this method returns an object describing whether the final state of the export process. Refer
-# to get_export_status_result for the definition of this object.
-def wait_for_export_completion(apiKey, exportId):
-    exportCompleted = False
-    while not exportCompleted:
-        exportStatusResult = get_export_status_result(exportId, apiKey)
-        exportCompleted = exportStatusResult['exportCompleted']
-        if not exportCompleted:
-            print('Export still in progress...')
-            # Sleep for a few seconds before trying to check the status from the server again.
-            time.sleep(4)
-        else:
-            return exportStatusResult
-
-# Returns an object that describes the current status of a given export.
-# This object structure is:
-#    
-#  {
-#    "downloadUrl": "String",
-#    "exportCompleted": Boolean,
-#    "reportsProgress": Boolean,
-#    "progress": Integer,
-#    "error": "String"
-#  }
-def get_export_status_result(exportId, apiKey):
-    # Send the status request to the web API.
-    httpResponse = request.urlopen(request.Request(
-        f'https://sd.kcftech.com/public/exports/{exportId}/status?apiKey={apiKey}',
-        headers = { 'content-type': 'application/json', 'Accept': 'application/json' }
-    ))
-    # Read the export status JSON string from the http response.
-    stringResult = httpResponse.read().decode('UTF-8')
-    # Convert and return the string result as an object.
-    return json.loads(stringResult)
-
-# Downloads the exported data to the specified localExportFilePath (if the export was successful).
-def handle_export_result(exportStatusResult, localExportFilePath):
-    if 'downloadUrl' in exportStatusResult:
-        # Download the export file to the local exportFilePath.
-        request.urlretrieve(exportStatusResult['downloadUrl'], localExportFilePath)
-        print(f'** Export file downloaded to {localExportFilePath} **')
-    else:
-        exportErrorText = exportStatusResult["error"]
-        if exportErrorText == 'No data to export.':
-            print(f'** The export completed with an empty data set. No file was downloaded. **')
+# Exports the same type of data for many groups at once. At most maxConcurrent exports are in
+# progress on the server at once; the status of all of them is tracked by a single
+# sd_client.ExportStatusPoller, and each group's file is downloaded as soon as its export completes while the
+# exports of the remaining groups keep running. A group whose export fails does not stop the
+# exports of the other groups.
+# Returns a dictionary that maps each (groupId, startMillis) pair of groupExports to a tuple with the
+# end of the exported window, whether its data was exported successfully (including when there was
+# no data to export) and a short description of the result.
+#  - exportType: Either 'indicator' or 'burst'.
+#  - groupExports: A list or iterator of (groupId, startMillis, endMillis, localExportFolderPath)
+#                  tuples, one per group to export, or one per window when the export range of a
+#                  group is split into windows (refer to get_group_windows).
+#  - maxConcurrent: The maximum number of exports in progress on the server at any one time.
+#  - apiClient: The sd_client.SmartDiagnosticsClient, created with the api key for the account
+#               that contains the groups to be exported.
+#  - downloadConnections: The number of parallel connections used to download each export file.
+def export_groups_data(exportType, groupExports, maxConcurrent, apiClient, downloadConnections = 1):
+    pendingGroupExports = iter(groupExports)
+    # Maps the id of each export that is in progress on the server to the group export it belongs to,
+    # its key in the export cache and the time it was submitted.
+    exportGroups = {}
+    # Maps each (groupId, startMillis) pair to the end of its window and its result.
+    groupResults = {}
+    # Maps each (groupId, startMillis) pair whose export completed on the server to the end of its
+    # window and the download of its export file.
+    groupDownloads = {}
+    poller = sd_client.ExportStatusPoller(apiClient)
+    with ThreadPoolExecutor(max_workers = maxConcurrent) as downloadExecutor:
+        while True:
+            # Keep up to maxConcurrent exports in progress on the server.
+            while len(exportGroups) < maxConcurrent:
+                groupExport = next(pendingGroupExports, None)
+                if groupExport is None:
+                    break
+                groupId, startMillis, endMillis, localExportFolderPath = groupExport
+                print(f'Exporting {exportType} data for group {groupId} between "{export_common.get_filename_friendly_date(startMillis)}" UTC and "{export_common.get_filename_friendly_date(endMillis)}" UTC')
+                exportRequest = sd_client.get_export_request(exportType, startMillis, endMillis, groupId)
+                cacheKey = export_common.get_export_cache_key(exportRequest, apiClient, endMillis)
+                if export_common.restore_cached_export(cacheKey, export_common.get_export_file_path(localExportFolderPath, startMillis, endMillis, exportType)):
+                    groupResults[(groupId, startMillis)] = (endMillis, True, 'exported from the cache')
+                    continue
+                try:
+                    exportId = apiClient.submit_export(exportRequest)
+                except (http.client.HTTPException, OSError) as err:
+                    # An invalid API key fails every group, so there is no point in continuing.
+                    if isinstance(err, HTTPError) and err.code == 401:
+                        raise
+                    if isinstance(err, HTTPError) and err.code == 404:
+                        print(f'** No {exportType} data exists for group {groupId} for the specified time frame. **')
+                        groupResults[(groupId, startMillis)] = (endMillis, True, 'no data for the time frame')
+                        if export_common.exportPlanner is not None:
+                            export_common.exportPlanner.record(f'group-{groupId}', exportType, endMillis - startMillis, 0, 0)
+                    else:
+                        print(f'** The {exportType} export for group {groupId} could not be started: {err} **')
+                        groupResults[(groupId, startMillis)] = (endMillis, False, f'could not be started ({err})')
+                    continue
+                exportGroups[exportId] = (groupExport, cacheKey, time.monotonic())
+                poller.track(exportId, exportType)
+
+            if not exportGroups:
+                break
+
+            exportId, exportStatusResult = poller.wait_for_next_completion()
+            (groupId, startMillis, endMillis, localExportFolderPath), cacheKey, submittedAt = exportGroups.pop(exportId)
+            exportFilePath = export_common.get_export_file_path(localExportFolderPath, startMillis, endMillis, exportType)
+            exportCost = (f'group-{groupId}', exportType, endMillis - startMillis, time.monotonic() - submittedAt)
+            # Download in the background so that polling and submitting continue meanwhile.
+            groupDownloads[(groupId, startMillis)] = (endMillis, downloadExecutor.submit(export_common.handle_windowed_export_result, apiClient, exportStatusResult, exportFilePath, downloadConnections, cacheKey, exportCost))
+
+    for (groupId, startMillis), (endMillis, downloadResult) in groupDownloads.items():
+        try:
+            if downloadResult.result():
+                groupResults[(groupId, startMillis)] = (endMillis, True, 'exported')
+            else:
+                groupResults[(groupId, startMillis)] = (endMillis, False, 'the export failed')
+        except Exception as err:
+            # Any error while downloading or processing one group's file (e.g. adding it to the
+            # Parquet dataset) fails only that group.
+            print(f'** The {exportType} export file for group {groupId} could not be downloaded or processed: {err} **')
+            groupResults[(groupId, startMillis)] = (endMillis, False, f'download failed ({err})')
+    return groupResults
+
+# Yields the (groupId, startMillis, endMillis, localExportFolderPath) tuples of the windows that
+# the export range of each group export is split into, one group after the other.
+#  - shardMillis: The length of each window in milliseconds (refer to export_common.get_shard_windows),
+#                 'auto' to let export_common.exportPlanner choose the length of each window, or None to
+#                 export the whole range of each group at once.
+def get_group_windows(exportType, groupExports, shardMillis):
+    for groupId, startMillis, endMillis, localExportFolderPath in groupExports:
+        if shardMillis is None:
+            windows = [(startMillis, endMillis)]
+        elif shardMillis == 'auto':
+            windows = export_common.exportPlanner.plan_windows(f'group-{groupId}', exportType, startMillis, endMillis)
         else:
-            print(f'** Something went wrong with the export: "{exportStatusResult["error"]}" **')
+            windows = export_common.get_shard_windows(startMillis, endMillis, shardMillis)
+        for windowStart, windowEnd in windows:
+            yield (groupId, windowStart, windowEnd, localExportFolderPath)
+
+# Reads the group ids listed in a file, one per line. Blank lines and lines that start with '#'
+# are ignored.
+def read_group_ids_file(groupIdsFilePath):
+    with open(groupIdsFilePath, 'r') as groupIdsFile:
+        return [line.strip() for line in groupIdsFile if line.strip() and not line.strip().startswith('#')]
+
+# Returns the path of the file that records how far the group's data has been exported when the
+# script is run with --sync.
+def get_sync_state_file_path(localExportFolderPath, groupId):
+    return os.path.join(localExportFolderPath, '.sd-sync-state', f'group-{groupId}.json')
 
 def winapi_path(dos_path, encoding = None):
     path = os.path.abspath(dos_path)
@@ -160,70 +130,164 @@ def winapi_path(dos_path, encoding = None):
         path = "\\\\?\\" + path 
     return path  
 
-def datetime_to_millis(dateTime):
-    return dateTime.timestamp() * 1000
-
-def datetime_string_to_millis(dateTimeString):
-    dateTime = datetime.strptime(dateTimeString, '%Y-%m-%d %H:%M:%S')
-    return datetime_to_millis(dateTime)
-
-def millis_to_datetime(millis):
-    return datetime.fromtimestamp(millis / 1000)
-
-# Convert the input millis to a format that is allowed in a filename (something like '2019-07-20_06-12-42')
-def get_filename_friendly_date(millis):
-    dt = millis_to_datetime(millis)
-    return dt.strftime('%Y-%m-%d %H-%M-%S')
-
 
 
 ap = argparse.ArgumentParser()
 ap.add_argument('-a', '--apikey', required = True,
    help = 'Your account API Key.')
-ap.add_argument('-s', '--start', required = True,
-   help = 'The start date/time of the export range in the format "YYYY-MM-DD HH:mm:ss" (e.g. "2018-09-25 00:00:00").')
+ap.add_argument('-s', '--start', required = False,
+   help = 'The start date/time of the export range in the format "YYYY-MM-DD HH:mm:ss" (e.g. "2018-09-25 00:00:00"). Required unless --sync is specified and a previous sync has been recorded.')
 ap.add_argument('-e', '--end', required = False,
    help = 'The end date/time of the export range in the format "YYYY-MM-DD HH:mm:ss" (e.g. "2018-09-25 00:00:00"). Defaults to the current date/time if omitted.')
 ap.add_argument('-i', '--indicator', required = False, action='store_true',
    help = 'Specify this flag to include indicator data in the export.')
 ap.add_argument('-b', '--burst', required = False, action='store_true',
    help = 'Specify this flag to include burst data in the export.')
-ap.add_argument('-g', '--groupId', required = True,
-   help = 'The Group ID containing the data to be exported.')
+ap.add_argument('-g', '--groupId', required = False, nargs = '+', default = [],
+   help = 'The Group ID containing the data to be exported. Several group ids can be listed to export them all at once.')
+ap.add_argument('--group-file', required = False,
+   help = 'A file that lists the Group IDs to export, one per line. Can be combined with --groupId.')
+ap.add_argument('--shard-by', required = False, type = export_common.shard_size_to_millis,
+   help = 'Splits the export range of each group into windows of the given size and exports them concurrently. Valid values are "day", "hour", "N-minutes" (e.g. "30-minutes"), or "auto" to size each window from the duration and file size of earlier exports of the group.')
+ap.add_argument('--target-export-mb', required = False, type = float, default = 200,
+   help = 'The export file size that --shard-by auto aims for, in megabytes. Defaults to 200.')
+ap.add_argument('--target-export-minutes', required = False, type = float, default = 10,
+   help = 'The server-side export duration that --shard-by auto aims for, in minutes. Defaults to 10.')
+ap.add_argument('--max-concurrent', required = False, type = int, default = 4,
+   help = 'The maximum number of group exports that are in progress on the server at once. Defaults to 4.')
+ap.add_argument('--download-connections', required = False, type = int, default = 1,
+   help = 'The number of parallel connections used to download each export file. Defaults to 1.')
+ap.add_argument('--parquet-dir', required = False,
+   help = 'A folder to add the rows of each downloaded export file to, as a Parquet dataset partitioned by indicator type or node and by day. Requires the pyarrow package.')
+ap.add_argument('--burst-store', required = False, action='store_true',
+   help = 'Specify this flag to also convert each downloaded burst export file into a burst store, which can be read quickly with burst_store.BurstStore.')
+ap.add_argument('--cache-dir', required = False,
+   help = 'A folder in which to cache downloaded export files. An export that is requested again is copied from the cache instead of running on the server. Only time ranges that ended more than an hour ago are cached.')
+ap.add_argument('--cache-max-gb', required = False, type = float, default = 10,
+   help = 'The maximum size of the export cache in gigabytes. The least recently used files are removed first. Defaults to 10.')
+ap.add_argument('--cache-ttl-days', required = False, type = float, default = 30,
+   help = 'The number of days after which a cached export file expires. Defaults to 30.')
+ap.add_argument('--metrics-file', required = False,
+   help = 'A file to append the timing, size and retry count of every export stage to, as JSON lines.')
+ap.add_argument('--prometheus-file', required = False,
+   help = 'A file to write the totals of every export stage to at the end of the run, in the Prometheus text format.')
+ap.add_argument('--timeout', required = False, type = float, default = 60,
+   help = 'The number of seconds to wait for the web API to respond before a request fails. Defaults to 60.')
+ap.add_argument('--max-requests-per-second', required = False, type = float, default = 10,
+   help = 'The maximum rate of requests to the web API. The rate is lowered automatically while the API is throttling requests. Defaults to 10.')
+ap.add_argument('--sync', required = False, action='store_true',
+   help = 'Specify this flag to export only the group data since the end of the previous --sync run for the group. The first --sync run starts at --start.')
 args = vars(ap.parse_args())
 if not args['burst'] and not args['indicator']:
     ap.error('You must specify at least one type of export (i.e. burst or indicator).')
+if args['start'] is None and not args['sync']:
+    ap.error('the following arguments are required: -s/--start')
+if args['max_concurrent'] < 1:
+    ap.error('--max-concurrent must be at least 1.')
+if args['download_connections'] < 1:
+    ap.error('--download-connections must be at least 1.')
+if args['parquet_dir'] is not None and not export_parquet.is_pyarrow_installed():
+    ap.error('--parquet-dir requires the pyarrow package. Install it with "pip install pyarrow".')
+
+groupIds = list(args['groupId'])
+if args['group_file'] is not None:
+    groupIds += read_group_ids_file(args['group_file'])
+# Remove repeated group ids, keeping the order in which the groups were listed.
+groupIds = list(dict.fromkeys(groupIds))
+if not groupIds:
+    ap.error('the following arguments are required: -g/--groupId (or --group-file)')
 
 apiKey = args['apikey']
-startMillis = datetime_string_to_millis(args['start'])
-endMillis = datetime_to_millis(datetime.utcnow())
+startMillis = None
+endMillis = export_common.get_current_millis()
 includeIndicator = args['indicator']
 includeBurst = args['burst']
-groupId = args['groupId']
+shardMillis = args['shard_by']
+maxConcurrent = args['max_concurrent']
+downloadConnections = args['download_connections']
+syncMode = args['sync']
+export_common.parquetDatasetFolderPath = args['parquet_dir']
+export_common.convertBurstStores = args['burst_store']
+pipelineMetrics = pipeline_metrics.MetricsRecorder(args['metrics_file'], args['prometheus_file'])
+apiClient = sd_client.SmartDiagnosticsClient(apiKey, args['timeout'], args['max_requests_per_second'], pipelineMetrics)
+if shardMillis == 'auto':
+    export_common.exportPlanner = export_planner.ExportPlanner('.sd-export-history.json', args['target_export_mb'] * 1024 * 1024, args['target_export_minutes'] * 60)
+if args['cache_dir'] is not None:
+    export_common.exportCache = export_cache.ExportCache(args['cache_dir'], int(args['cache_max_gb'] * 1024 ** 3), args['cache_ttl_days'] * 24 * 60 * 60)
 
+if args['start'] is not None:
+    startMillis = export_common.datetime_string_to_millis(args['start'])
 if args['end'] is not None:
-    endMillis = datetime_string_to_millis(args['end'])
+    endMillis = export_common.datetime_string_to_millis(args['end'])
     
 # Defaults to outputting the exported files to the current path where this script is run.
 localDataExportFolderPath = '.'
 
-if includeIndicator:
-    try:
-       export_group_indicator_data(groupId, startMillis, endMillis, apiKey, localDataExportFolderPath)
-    except HTTPError as err:
-       if err.code == 401:
-           print(f'** The specified API key is invalid. **')
-       elif err.code == 404:
-           print(f'** No group burst data exists for the specified time frame. **')
-       else:
-           raise
-if includeBurst:
+# Maps each group id to the folder that its export files are output to. When several groups are
+# exported, each group's files go to their own subfolder so that they do not overwrite each other.
+groupExportFolderPaths = {}
+for groupId in groupIds:
+    groupExportFolderPaths[groupId] = localDataExportFolderPath
+    if len(groupIds) > 1:
+        groupExportFolderPaths[groupId] = os.path.join(localDataExportFolderPath, f'group-{groupId}')
+        os.makedirs(groupExportFolderPaths[groupId], exist_ok = True)
+
+# Maps each group id to the results of its exports, for the summary printed at the end.
+summary = { groupId: [] for groupId in groupIds }
+for exportType, includeExportType in [('indicator', includeIndicator), ('burst', includeBurst)]:
+    if not includeExportType:
+        continue
+
+    groupExports = []
+    for groupId in groupIds:
+        exportStartMillis = startMillis
+        if syncMode:
+            # Continue from where the previous sync of this type of data for the group left off.
+            syncState = export_common.load_sync_state(get_sync_state_file_path(localDataExportFolderPath, groupId))
+            exportStartMillis = syncState.get(exportType, {}).get('endMillis', startMillis)
+            if exportStartMillis is None:
+                print(f'** No previous {exportType} sync was found for group {groupId}. Specify --start for the first --sync run. **')
+                summary[groupId].append(f'{exportType}: skipped (no previous sync and no --start)')
+                continue
+            if exportStartMillis >= endMillis:
+                print(f'** The {exportType} data for group {groupId} is already synced up to "{export_common.get_filename_friendly_date(exportStartMillis)}" UTC. **')
+                summary[groupId].append(f'{exportType}: already synced')
+                continue
+        groupExports.append((groupId, exportStartMillis, endMillis, groupExportFolderPaths[groupId]))
+
     try:
-       export_group_burst_data(groupId, startMillis, endMillis, apiKey, localDataExportFolderPath)
+        groupResults = export_groups_data(exportType, get_group_windows(exportType, groupExports, shardMillis), maxConcurrent, apiClient, downloadConnections)
     except HTTPError as err:
-       if err.code == 401:
-           print(f'** The specified API key is invalid. **')
-       elif err.code == 404:
-           print(f'** No group burst data exists for the specified time frame. **')
-       else:
-           raise
+        if err.code == 401:
+            print(f'** The specified API key is invalid. **')
+            break
+        raise
+
+    for groupId, exportStartMillis, exportEndMillis, localExportFolderPath in groupExports:
+        windowResults = sorted((windowStart, windowResult) for (windowGroupId, windowStart), windowResult in groupResults.items() if windowGroupId == groupId)
+        # The group's data is exported up to the end of the last window before the first one that failed.
+        exportedUntilMillis = exportStartMillis
+        resultText = 'nothing to export'
+        for windowStart, (windowEnd, windowSucceeded, resultText) in windowResults:
+            if not windowSucceeded:
+                break
+            exportedUntilMillis = windowEnd
+        if len(windowResults) > 1:
+            succeededCount = sum(1 for windowStart, windowResult in windowResults if windowResult[1])
+            resultText = f'{succeededCount} of {len(windowResults)} windows exported' + ('' if exportedUntilMillis == exportEndMillis else f' (first failure: {resultText})')
+        summary[groupId].append(f'{exportType}: {resultText}')
+        syncedUntilMillis = export_common.get_synced_until_millis(exportedUntilMillis)
+        if syncMode and syncedUntilMillis > exportStartMillis:
+            syncStateFilePath = get_sync_state_file_path(localDataExportFolderPath, groupId)
+            syncState = export_common.load_sync_state(syncStateFilePath)
+            syncState[exportType] = { 'endMillis': syncedUntilMillis }
+            export_common.save_sync_state(syncStateFilePath, syncState)
+            print(f'** The {exportType} data for group {groupId} is now synced up to "{export_common.get_filename_friendly_date(syncedUntilMillis)}" UTC. **')
+
+print(f'** Summary of the exports of {len(groupIds)} group(s): **')
+for groupId, groupSummary in summary.items():
+    print(f'  Group {groupId}: {", ".join(groupSummary)}')
+
+apiClient.close()
+# Write the Prometheus file, if one was requested.
+pipelineMetrics.close()
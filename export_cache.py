@@ -0,0 +1,151 @@
+# A local cache of downloaded export files, used by export-account-data.py and
+# export-group-data.py when they are run with --cache-dir. Each export file is stored under a key
+# that is derived from everything that determines its contents: the export endpoint (which
+# includes the group id of group exports), the account (API key) and the export request data (time
+# window, indicator ids, filtered indicator types, node serial numbers, sample size, embedded
+# metadata, ...). When the same export is requested again, the file is copied from the cache
+# instead of running a new export job on the server and downloading its file again.
+#
+# The cache folder has the structure:
+#  - objects/<key>.zip: The cached export files.
+#  - index.json: The cached entries, with the structure:
+#
+#  {
+#    "<key>": {
+#      # Size and SHA-256 checksum of the cached file, verified before the file is used.
+#      "size": Number,
+#      "sha256": "String",
+#      # True if the export had no data (no file is stored for such entries).
+#      "empty": Boolean,
+#      # Times the entry was stored and last used, in seconds from the unix epoch.
+#      "storedAt": Number,
+#      "usedAt": Number
+#    }, ...
+#  }
+#
+# Entries expire ttlSeconds after they are stored, and the least recently used entries are evicted
+# once the cached files take up more than maxBytes.
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+# Size of each block that is read while computing a checksum.
+checksumBlockBytes = 8 * 1024 * 1024
+
+class ExportCache:
+    def __init__(self, cacheFolderPath, maxBytes, ttlSeconds):
+        self.cacheFolderPath = cacheFolderPath
+        self.maxBytes = maxBytes
+        self.ttlSeconds = ttlSeconds
+        self.indexFilePath = os.path.join(cacheFolderPath, 'index.json')
+        # Sharded and multi-group exports use the cache from several download threads at once.
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(cacheFolderPath, 'objects'), exist_ok = True)
+        self.entries = {}
+        if os.path.exists(self.indexFilePath):
+            with open(self.indexFilePath, 'r') as indexFile:
+                self.entries = json.load(indexFile)
+
+    # Returns the cache key of an export request.
+    #  - endpointPath: The path of the export endpoint, without the query string (e.g.
+    #                  '/public/exports/group/123/indicatorData').
+    #  - requestData: The export request data that is posted to the endpoint.
+    #  - apiKey: The api key of the account. Only a hash of the key is part of the cache key.
+    @staticmethod
+    def get_key(endpointPath, requestData, apiKey):
+        accountHash = hashlib.sha256(apiKey.encode('utf-8')).hexdigest()
+        keyData = json.dumps([endpointPath, accountHash, requestData], sort_keys = True)
+        return hashlib.sha256(keyData.encode('utf-8')).hexdigest()
+
+    # Looks up an export in the cache. If the export is cached and the cached file is intact, the file
+    # is copied to localFilePath. Returns 'file' if a file was copied, 'empty' if the cached export
+    # had no data, or None if the export is not cached.
+    def restore(self, key, localFilePath):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry['storedAt'] > self.ttlSeconds:
+                self.remove_entry(key)
+                self.save_index()
+                return None
+            if entry['empty']:
+                result = 'empty'
+            else:
+                objectFilePath = self.get_object_file_path(key)
+                if not os.path.exists(objectFilePath) or os.path.getsize(objectFilePath) != entry['size'] or get_file_sha256(objectFilePath) != entry['sha256']:
+                    # The cached file is missing or damaged; export the data again instead.
+                    self.remove_entry(key)
+                    self.save_index()
+                    return None
+                # Copy to a temporary file first so that localFilePath never holds a partial file.
+                shutil.copyfile(objectFilePath, localFilePath + '.part')
+                os.replace(localFilePath + '.part', localFilePath)
+                result = 'file'
+            entry['usedAt'] = time.time()
+            self.save_index()
+            return result
+
+    # Stores a downloaded export file in the cache, evicting the least recently used entries if
+    # the cache grows larger than maxBytes. Files larger than maxBytes are not cached.
+    def store(self, key, localFilePath):
+        size = os.path.getsize(localFilePath)
+        if size > self.maxBytes:
+            return
+        sha256 = get_file_sha256(localFilePath)
+        with self.lock:
+            objectFilePath = self.get_object_file_path(key)
+            shutil.copyfile(localFilePath, objectFilePath + '.part')
+            os.replace(objectFilePath + '.part', objectFilePath)
+            now = time.time()
+            self.entries[key] = { 'size': size, 'sha256': sha256, 'empty': False, 'storedAt': now, 'usedAt': now }
+            self.evict(key)
+            self.save_index()
+
+    # Records in the cache that an export had no data to export.
+    def store_empty(self, key):
+        with self.lock:
+            now = time.time()
+            self.entries[key] = { 'size': 0, 'sha256': None, 'empty': True, 'storedAt': now, 'usedAt': now }
+            self.save_index()
+
+    # Removes expired entries, then the least recently used entries other than keepKey until the
+    # cached files fit in maxBytes.
+    def evict(self, keepKey):
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if now - entry['storedAt'] > self.ttlSeconds and key != keepKey]:
+            self.remove_entry(key)
+        totalBytes = sum(entry['size'] for entry in self.entries.values())
+        for key in sorted(self.entries, key = lambda key: self.entries[key]['usedAt']):
+            if totalBytes <= self.maxBytes:
+                break
+            if key != keepKey:
+                totalBytes -= self.entries[key]['size']
+                self.remove_entry(key)
+
+    def remove_entry(self, key):
+        entry = self.entries.pop(key)
+        if not entry['empty'] and os.path.exists(self.get_object_file_path(key)):
+            os.remove(self.get_object_file_path(key))
+
+    def get_object_file_path(self, key):
+        return os.path.join(self.cacheFolderPath, 'objects', f'{key}.zip')
+
+    # Saves the index. The index is written to a temporary file first and then renamed, so an
+    # interrupted run can never leave a corrupt index behind.
+    def save_index(self):
+        with open(self.indexFilePath + '.tmp', 'w') as indexFile:
+            json.dump(self.entries, indexFile, indent = 2)
+        os.replace(self.indexFilePath + '.tmp', self.indexFilePath)
+
+# Returns the SHA-256 checksum of a file as a hexadecimal string.
+def get_file_sha256(filePath):
+    sha256 = hashlib.sha256()
+    with open(filePath, 'rb') as file:
+        for block in iter(lambda: file.read(checksumBlockBytes), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
@@ -0,0 +1,186 @@
+# Helpers shared by export-account-data.py, export-group-data.py and sd-daemon.py: the export cache,
+# downloading and post-processing of export files, export windows (shards), sync state files and
+# date conversions. The request data of each type of export is built by sd_client.py.
+#
+# The optional stages that run on every export are configured by the scripts through the settings
+# below (e.g. export_common.exportCache = export_cache.ExportCache(...)).
+
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import time
+import burst_store
+import export_parquet
+import sd_client
+
+# Folder of the Parquet dataset that each downloaded export file is added to (refer to
+# export_parquet.py), or None to only download the export files. Set with --parquet-dir.
+parquetDatasetFolderPath = None
+# Set to True to convert each downloaded burst export file into a memory-mapped burst store (refer
+# to burst_store.py) next to it. Set with --burst-store.
+convertBurstStores = False
+
+# Cache of downloaded export files (refer to export_cache.py), or None to always run a new export.
+# Set with --cache-dir.
+exportCache = None
+# Only exports of time ranges that ended at least this long ago are cached, so that data that
+# arrives late (e.g. from a gateway that was offline) is not hidden by a cached export file.
+closedWindowMarginMillis = 60 * 60 * 1000
+
+# Chooses the length of each window for --shard-by auto from the duration and file size of earlier
+# exports (refer to export_planner.py), or None if fixed windows are used.
+exportPlanner = None
+
+# Returns the key of an export in the export cache, or None if the export should not be cached
+# because no cache is in use or the time range of the export has not closed yet.
+#  - exportRequest: A tuple with the path of the export endpoint and the request data.
+def get_export_cache_key(exportRequest, apiClient, endMillis):
+    if exportCache is None or endMillis > get_current_millis() - closedWindowMarginMillis:
+        return None
+    endpointPath, requestData = exportRequest
+    return exportCache.get_key(endpointPath, requestData, apiClient.apiKey)
+
+# Copies a cached export to localExportFilePath. Returns True if the export was found in the cache,
+# in which case the export does not need to run on the server.
+def restore_cached_export(cacheKey, localExportFilePath):
+    if cacheKey is None:
+        return False
+    cachedResult = exportCache.restore(cacheKey, localExportFilePath)
+    if cachedResult == 'file':
+        print(f'** Export file copied from the cache to {localExportFilePath} **')
+        process_export_file(localExportFilePath)
+    elif cachedResult == 'empty':
+        print(f'** The cached export has an empty data set. No file was copied. **')
+    return cachedResult is not None
+
+# Downloads the exported data to the specified localExportFilePath (if the export was successful).
+# Returns True if the export completed successfully, including when it had no data to download.
+# Refer to sd_client.SmartDiagnosticsClient.download_export_file for a description of
+# downloadConnections. If cacheKey is not None, the result is stored in the export cache under that key.
+def handle_export_result(apiClient, exportStatusResult, localExportFilePath, downloadConnections = 1, cacheKey = None):
+    if 'downloadUrl' in exportStatusResult:
+        # Download the export file to the local exportFilePath.
+        apiClient.download_export_file(exportStatusResult['downloadUrl'], localExportFilePath, downloadConnections)
+        print(f'** Export file downloaded to {localExportFilePath} **')
+        if cacheKey is not None:
+            exportCache.store(cacheKey, localExportFilePath)
+        return process_export_file(localExportFilePath)
+    else:
+        exportErrorText = exportStatusResult["error"]
+        if exportErrorText == 'No data to export.':
+            print(f'** The export completed with an empty data set. No file was downloaded. **')
+            if cacheKey is not None:
+                exportCache.store_empty(cacheKey)
+            return True
+        else:
+            print(f'** Something went wrong with the export: "{exportStatusResult["error"]}" **')
+            return False
+
+# Downloads the result of one window of a windowed export like handle_export_result, and records the
+# duration and file size of the export with exportPlanner (if it is in use) so that later windows
+# can be sized from them.
+#  - exportCost: A tuple with the planner scope, the export type, the window length in milliseconds
+#                and the time the export took on the server in seconds.
+def handle_windowed_export_result(apiClient, exportStatusResult, localExportFilePath, downloadConnections, cacheKey, exportCost):
+    exportSucceeded = handle_export_result(apiClient, exportStatusResult, localExportFilePath, downloadConnections, cacheKey)
+    if exportSucceeded and exportPlanner is not None:
+        byteCount = os.path.getsize(localExportFilePath) if 'downloadUrl' in exportStatusResult else 0
+        exportPlanner.record(*exportCost, byteCount)
+    return exportSucceeded
+
+# Adds an export file to the Parquet dataset and converts it to a burst store, if requested. Returns
+# False if the rows of the file could not be added to the Parquet dataset, in which case the file is
+# kept but the export is reported as failed.
+def process_export_file(localExportFilePath):
+    if parquetDatasetFolderPath is not None:
+        try:
+            rowCount = export_parquet.append_export_to_dataset(localExportFilePath, parquetDatasetFolderPath)
+        except export_parquet.ConversionError as err:
+            print(f'** {err} Nothing was added to the Parquet dataset. **')
+            return False
+        print(f'** Added {rowCount} rows from {localExportFilePath} to the Parquet dataset in {parquetDatasetFolderPath} **')
+    if convertBurstStores and localExportFilePath.endswith('_burst.zip'):
+        burstStorePath = burst_store.get_burst_store_path(localExportFilePath)
+        burstCount = burst_store.convert_burst_export(localExportFilePath, burstStorePath)
+        print(f'** Converted {burstCount} bursts from {localExportFilePath} to the burst store {burstStorePath} **')
+    return True
+
+# Splits the range between startMillis and endMillis into consecutive (start, end) windows that
+# are each shardMillis long. The final window is shortened so that it ends exactly at endMillis.
+def get_shard_windows(startMillis, endMillis, shardMillis):
+    windowStart = startMillis
+    while windowStart < endMillis:
+        windowEnd = min(windowStart + shardMillis, endMillis)
+        yield (windowStart, windowEnd)
+        windowStart = windowEnd
+
+# Converts a shard size given on the command line to milliseconds. Valid values are "day", "hour",
+# a number of minutes in the format "N-minutes" (e.g. "30-minutes"), or "auto", which is returned
+# as it is.
+def shard_size_to_millis(shardSize):
+    if shardSize == 'auto':
+        return shardSize
+    if shardSize == 'day':
+        return 24 * 60 * 60 * 1000
+    if shardSize == 'hour':
+        return 60 * 60 * 1000
+    minutes, separator, unit = shardSize.partition('-')
+    if separator and unit == 'minutes' and minutes.isdigit() and int(minutes) > 0:
+        return int(minutes) * 60 * 1000
+    raise argparse.ArgumentTypeError(f'"{shardSize}" is not a valid shard size. Use "day", "hour", "N-minutes" (e.g. "30-minutes") or "auto".')
+
+# Builds the full path to where an export file should be output locally. The filename will include
+# the time range of the export request and the type of the exported data (i.e. indicator or burst).
+def get_export_file_path(localExportFolderPath, startMillis, endMillis, exportType):
+    return os.path.join(localExportFolderPath, f'{get_filename_friendly_date(startMillis)}--{get_filename_friendly_date(endMillis)}_{exportType}.zip')
+
+# Loads a sync state file of the --sync mode of the export scripts, which has the structure:
+#
+#  {
+#    "indicator": { "endMillis": Number },
+#    "burst": { "endMillis": Number }
+#  }
+#
+# where endMillis is the end of the time range up to which that type of data has been exported
+# completely. Returns an empty object if nothing has been exported yet.
+def load_sync_state(syncStateFilePath):
+    if not os.path.exists(syncStateFilePath):
+        return {}
+    with open(syncStateFilePath, 'r') as syncStateFile:
+        return json.load(syncStateFile)
+
+# Saves the sync state. The state is written to a temporary file first and then renamed, so an
+# interrupted run can never leave a corrupt state file behind.
+def save_sync_state(syncStateFilePath, syncState):
+    os.makedirs(os.path.dirname(syncStateFilePath), exist_ok = True)
+    with open(syncStateFilePath + '.tmp', 'w') as syncStateFile:
+        json.dump(syncState, syncStateFile, indent = 2)
+    os.replace(syncStateFilePath + '.tmp', syncStateFilePath)
+
+# Returns the current time, represented as milliseconds from the unix epoch.
+def get_current_millis():
+    return time.time() * 1000
+
+# Returns the time that a --sync run records as synced when its data was exported up to
+# exportedUntilMillis. Data that arrives late (refer to closedWindowMarginMillis) may still be added
+# to the most recent time range, so the recorded time stays that far behind the current time and
+# the next sync exports the most recent time range again.
+def get_synced_until_millis(exportedUntilMillis):
+    return min(exportedUntilMillis, get_current_millis() - closedWindowMarginMillis)
+
+def datetime_to_millis(dateTime):
+    return dateTime.timestamp() * 1000
+
+# Dates and times given on the command line are in UTC, like the dates and times of the web API.
+def datetime_string_to_millis(dateTimeString):
+    dateTime = datetime.strptime(dateTimeString, '%Y-%m-%d %H:%M:%S').replace(tzinfo = timezone.utc)
+    return datetime_to_millis(dateTime)
+
+def millis_to_datetime(millis):
+    return datetime.fromtimestamp(millis / 1000, timezone.utc)
+
+# Convert the input millis to a format that is allowed in a filename (something like '2019-07-20_06-12-42')
+def get_filename_friendly_date(millis):
+    dt = millis_to_datetime(millis)
+    return dt.strftime('%Y-%m-%d %H-%M-%S')
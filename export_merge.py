@@ -0,0 +1,171 @@
+# Merges the rows of several downloaded export files (zip archives of CSV files) into one zip
+# archive that holds each sample only once. Export files overlap when the same time range is
+# exported more than once, e.g. a re-run of an export, shards whose windows overlap or a sync that
+# catches up on a range that was already exported. Used by merge-exports.py.
+#
+# Every row is identified by a sample key: the time of the row plus the columns that identify its
+# series, which are found by their header names (compared case-insensitively and ignoring spaces and
+# underscores):
+#
+#   indicator data: IndicatorType, Indicator, IndicatorName, IndicatorId, NodeId, Node, NodeName
+#   burst data:     NodeId, Node, NodeName, UniqueId, SensorType, Sensor, SensorRole
+#   time:           Timestamp, Time, DateTime, Date, UtcTime, TimeUtc
+#
+# Every one of these columns that a CSV file has is part of the key. Burst files without a header row
+# are read the same way as in burst_store.py: any columns before the time identify the series. When
+# a CSV file has no series columns or no time column, the name of the CSV file and every column of
+# the row are the key instead, so that rows of different series (or of different CSV files) are never
+# taken for duplicates; only rows that are identical apart from the format of their time are.
+#
+# The keys of the rows written so far are kept in a DedupIndex, an SQLite database on disk, so the
+# memory used does not depend on the number of rows, and the CSV files are streamed out of and into
+# the zip archives a row at a time. Keeping the index file between runs makes later merges skip
+# every sample merged before.
+#
+# The CSV files of the same name in the export files are merged into one CSV file of that name in
+# the merged archive, with the header of the first of them. Rows are written in the order they are
+# read; consecutive rows with the same key (e.g. the samples of one burst written one per row) are
+# kept or skipped together.
+
+from pathlib import Path
+import csv
+import hashlib
+import io
+import itertools
+import os
+import sqlite3
+import zipfile
+import burst_store
+import export_parquet
+
+# Names of the columns (compared the same way as in export_parquet.py) that are part of the sample
+# key of each type of export, besides its series columns in export_parquet.seriesColumnNames.
+sampleKeyColumnNames = {
+    'indicator': ['indicatorid'],
+    'burst': ['sensortype', 'sensor', 'sensorrole'],
+}
+
+# The keys of the samples that have been merged, stored on disk. The keys added during a merge are
+# committed only when the merge completes, so the index never holds the keys of rows that were not
+# written to a merged file.
+class DedupIndex:
+    def __init__(self, databaseFilePath):
+        self.connection = sqlite3.connect(databaseFilePath)
+        self.connection.execute('PRAGMA synchronous=OFF')
+        # Limit the page cache to 64 MB. Larger transactions spill to the database file.
+        self.connection.execute('PRAGMA cache_size=-65536')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS samples (key BLOB PRIMARY KEY) WITHOUT ROWID')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, *exceptionInfo):
+        if exceptionType is None:
+            self.connection.commit()
+        else:
+            self.connection.rollback()
+        self.connection.close()
+
+    # Adds the key of a sample to the index. Returns True if the sample had not been added before.
+    def add(self, sampleKey):
+        return self.connection.execute('INSERT OR IGNORE INTO samples (key) VALUES (?)', (sampleKey,)).rowcount == 1
+
+# Merges the rows of the export files at exportFilePaths into a new zip archive at outputFilePath,
+# skipping every row whose sample is already in dedupIndex. The archive is written to a temporary
+# '.part' file that is renamed once it is complete. Returns the number of rows written and the
+# number of duplicate rows skipped.
+def merge_export_files(exportFilePaths, outputFilePath, dedupIndex):
+    # Maps the name of each CSV file to the export files that contain a CSV file of that name. Only one
+    # file of a zip archive can be written at a time, so each merged CSV file is written in one go.
+    memberFilePaths = {}
+    for exportFilePath in exportFilePaths:
+        with zipfile.ZipFile(exportFilePath) as exportZipFile:
+            for memberInfo in exportZipFile.infolist():
+                if not memberInfo.is_dir() and memberInfo.filename.lower().endswith('.csv'):
+                    memberFilePaths.setdefault(memberInfo.filename, []).append(exportFilePath)
+
+    partFilePath = outputFilePath + '.part'
+    try:
+        rowCount, duplicateCount = write_merged_file(memberFilePaths, partFilePath, dedupIndex)
+    except BaseException:
+        os.remove(partFilePath)
+        raise
+    os.replace(partFilePath, outputFilePath)
+    return rowCount, duplicateCount
+
+# Writes the merged archive for merge_export_files.
+#  - memberFilePaths: Maps the name of each CSV file to the export files that contain it.
+def write_merged_file(memberFilePaths, partFilePath, dedupIndex):
+    rowCount = 0
+    duplicateCount = 0
+    with zipfile.ZipFile(partFilePath, 'w', zipfile.ZIP_DEFLATED) as outputZipFile:
+        for memberName, exportFilePaths in memberFilePaths.items():
+            with outputZipFile.open(memberName, 'w', force_zip64 = True) as outputMemberFile:
+                outputTextFile = io.TextIOWrapper(outputMemberFile, encoding = 'utf-8', newline = '')
+                writer = csv.writer(outputTextFile)
+                headerWritten = False
+                for exportFilePath in exportFilePaths:
+                    exportType = 'burst' if Path(exportFilePath).stem.endswith('_burst') else 'indicator'
+                    with zipfile.ZipFile(exportFilePath) as exportZipFile:
+                        with exportZipFile.open(memberName) as memberFile:
+                            rows = csv.reader(io.TextIOWrapper(memberFile, encoding = 'utf-8-sig', newline = ''))
+                            for header, row, isNew in get_new_rows(rows, exportType, Path(memberName).stem, dedupIndex):
+                                if header is not None:
+                                    if not headerWritten:
+                                        writer.writerow(header)
+                                        headerWritten = True
+                                elif isNew:
+                                    writer.writerow(row)
+                                    rowCount += 1
+                                else:
+                                    duplicateCount += 1
+                outputTextFile.flush()
+                outputTextFile.detach()
+    return rowCount, duplicateCount
+
+# Yields a (header, None, None) tuple for the header row of a CSV file (if it has one), followed by
+# a (None, row, isNew) tuple for each row, where isNew tells whether the sample of the row has not
+# been added to dedupIndex before.
+#  - memberStem: The name of the CSV file, which is part of the sample key of rows that have no
+#                recognized series columns.
+def get_new_rows(rows, exportType, memberStem, dedupIndex):
+    firstRow = next(rows, None)
+    if firstRow is None:
+        return
+    timeColumnIndex = next((index for index, item in enumerate(firstRow[:3]) if burst_store.parse_time_millis(item) is not None), None)
+    if timeColumnIndex is not None:
+        # Files without a header row (burst files) start with any node and sensor type columns,
+        # followed by the timestamp.
+        seriesColumnIndexes = list(range(timeColumnIndex))
+        pendingRows = [firstRow]
+    else:
+        columnNames = [export_parquet.normalize_column_name(name) for name in firstRow]
+        timeColumnIndex = export_parquet.find_column(columnNames, export_parquet.timeColumnNames)
+        seriesColumnIndexes = [index for index, name in enumerate(columnNames) if name in export_parquet.seriesColumnNames[exportType] + sampleKeyColumnNames[exportType]]
+        pendingRows = []
+        yield firstRow, None, None
+
+    lastKey = None
+    isNew = False
+    for row in itertools.chain(pendingRows, rows):
+        sampleKey = get_sample_key(row, exportType, memberStem, timeColumnIndex, seriesColumnIndexes)
+        if sampleKey != lastKey:
+            isNew = dedupIndex.add(sampleKey)
+            lastKey = sampleKey
+        yield None, row, isNew
+
+# Returns the sample key of a row, a 16 byte hash of its export type, series and time. The time is
+# converted to milliseconds so that the same time written in different formats gives the same key.
+# Rows without a recognized time column or without recognized series columns are identified by the
+# name of their CSV file and all of their columns.
+def get_sample_key(row, exportType, memberStem, timeColumnIndex, seriesColumnIndexes):
+    if timeColumnIndex is None or timeColumnIndex >= len(row):
+        keyItems = [memberStem] + row
+    else:
+        timeMillis = burst_store.parse_time_millis(row[timeColumnIndex])
+        timeItem = str(timeMillis) if timeMillis is not None else row[timeColumnIndex]
+        if seriesColumnIndexes:
+            keyItems = [row[index] for index in seriesColumnIndexes if index < len(row)] + [timeItem]
+        else:
+            keyItems = [memberStem] + row[:timeColumnIndex] + [timeItem] + row[timeColumnIndex + 1:]
+    return hashlib.blake2b('\x1f'.join([exportType] + keyItems).encode('utf-8'), digest_size = 16).digest()
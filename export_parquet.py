@@ -0,0 +1,200 @@
+# Converts downloaded indicator and burst export files (zip archives of CSV files) into a
+# partitioned Parquet dataset, so that analytics can read only the columns and partitions that
+# they need instead of unzipping and parsing the raw CSV files again. Used by export-account-data.py
+# and export-group-data.py when they are run with --parquet-dir. Requires the pyarrow package.
+#
+# The dataset is laid out as:
+#
+#  <datasetFolderPath>/<exportType>/series=<series>/day=<YYYY-MM-DD>/<export file name>-<path hash>-<n>.parquet
+#
+# where exportType is indicator or burst, series is the indicator type (indicator data) or node
+# (burst data) of the rows, and day is the UTC date of the rows. When a CSV file has no indicator
+# type or node column, series is the name of the CSV file within the zip archive, which the web API
+# names after the data it holds.
+
+from pathlib import Path
+import hashlib
+import importlib.util
+import itertools
+import os
+import shutil
+import zipfile
+
+# Size of each block of a CSV file that is parsed at a time. Only about this much of each CSV file
+# is held in memory while it is converted.
+csvBlockBytes = 16 * 1024 * 1024
+
+# Names of the columns (compared case-insensitively and ignoring spaces and underscores) that
+# are used for the series partition of each type of export, in order of preference.
+seriesColumnNames = {
+    'indicator': ['indicatortype', 'indicator', 'indicatorname', 'nodeid', 'node', 'nodename'],
+    'burst': ['nodeid', 'node', 'nodename', 'uniqueid'],
+}
+
+# Names of the columns (compared the same way) that hold the time of each row, in order of preference.
+timeColumnNames = ['timestamp', 'time', 'datetime', 'date', 'utctime', 'timeutc']
+
+# Raised when the rows of an export file cannot be converted, e.g. when a later block of a CSV file
+# holds a value that does not fit the column type inferred from its first block. None of the rows of
+# that export file are added to the dataset.
+class ConversionError(ValueError):
+    pass
+
+# Returns True if the pyarrow package, which is required to write the dataset, is installed. The
+# export scripts check this when --parquet-dir is given, before any export runs.
+def is_pyarrow_installed():
+    return importlib.util.find_spec('pyarrow') is not None
+
+# Appends the rows of every CSV file in the export zip file at exportFilePath to the Parquet dataset
+# at datasetFolderPath. The zip archive is never extracted to disk; each CSV file is streamed out of
+# the archive and parsed a block at a time. Returns the number of rows that were written.
+#
+# The files are written to a staging folder in the dataset folder first and moved into the dataset
+# once every CSV file has been converted, so an export file that fails to convert (which raises a
+# ConversionError) never leaves part of its rows in the dataset.
+def append_export_to_dataset(exportFilePath, datasetFolderPath):
+    import pyarrow
+
+    exportFileStem = Path(exportFilePath).stem
+    exportType = 'burst' if exportFileStem.endswith('_burst') else 'indicator'
+    # Export files of different groups have the same name for the same time frame, so a hash of the
+    # full path of the export file is added to the staging folder and Parquet file names.
+    exportFileName = f'{exportFileStem}-{get_path_hash(exportFilePath)}'
+    stagingFolderPath = Path(datasetFolderPath, '.staging', exportFileName)
+    shutil.rmtree(stagingFolderPath, ignore_errors = True)
+    try:
+        rowCount = write_export_files(exportFilePath, stagingFolderPath, exportType, exportFileName)
+    except pyarrow.ArrowInvalid as err:
+        raise ConversionError(f'The rows of {exportFilePath} could not be converted: {err}') from err
+    else:
+        for stagedFilePath in stagingFolderPath.rglob('*.parquet'):
+            datasetFilePath = Path(datasetFolderPath, exportType, stagedFilePath.relative_to(stagingFolderPath))
+            datasetFilePath.parent.mkdir(parents = True, exist_ok = True)
+            os.replace(stagedFilePath, datasetFilePath)
+    finally:
+        shutil.rmtree(stagingFolderPath, ignore_errors = True)
+        try:
+            # Fails while other export files are being added at the same time, which is fine.
+            stagingFolderPath.parent.rmdir()
+        except OSError:
+            pass
+    return rowCount
+
+# Returns a short hash of the full path of the file at filePath.
+def get_path_hash(filePath):
+    return hashlib.blake2b(str(Path(filePath).resolve()).encode('utf-8'), digest_size = 4).hexdigest()
+
+# Writes the rows of every CSV file in the export zip file at exportFilePath as partitioned Parquet
+# files in outputFolderPath, for append_export_to_dataset. The file names start with exportFileName.
+# Returns the number of rows that were written.
+def write_export_files(exportFilePath, outputFolderPath, exportType, exportFileName):
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.dataset
+
+    partitioning = pyarrow.dataset.partitioning(
+        pyarrow.schema([('series', pyarrow.string()), ('day', pyarrow.date32())]), flavor = 'hive')
+    readOptions = pyarrow.csv.ReadOptions(block_size = csvBlockBytes)
+
+    rowCount = 0
+    with zipfile.ZipFile(exportFilePath) as exportZipFile:
+        for memberNumber, memberInfo in enumerate(exportZipFile.infolist()):
+            if memberInfo.is_dir() or not memberInfo.filename.lower().endswith('.csv'):
+                continue
+            # The column types are inferred from the first block only, so they are widened (refer to
+            # get_column_types) and set explicitly for the whole file before it is read.
+            with exportZipFile.open(memberInfo) as memberFile:
+                columnTypes = get_column_types(pyarrow.csv.open_csv(memberFile, read_options = readOptions).schema, exportType)
+            with exportZipFile.open(memberInfo) as memberFile:
+                reader = pyarrow.csv.open_csv(memberFile, read_options = readOptions,
+                    convert_options = pyarrow.csv.ConvertOptions(column_types = columnTypes))
+                batches = add_partition_columns(reader, exportType, Path(memberInfo.filename).stem)
+                firstBatch = next(batches, None)
+                if firstBatch is None:
+                    continue
+                rowCounter = RowCounter()
+                # The file names include the export file and CSV file, so the rows of other exports (or
+                # a re-run of the same export) never collide with or append to each other's files.
+                pyarrow.dataset.write_dataset(rowCounter.count(itertools.chain([firstBatch], batches)),
+                    outputFolderPath, schema = firstBatch.schema, format = 'parquet',
+                    partitioning = partitioning, basename_template = f'{exportFileName}-{memberNumber}-{{i}}.parquet',
+                    existing_data_behavior = 'overwrite_or_ignore')
+                rowCount += rowCounter.rowCount
+    return rowCount
+
+# Returns the type of each column of a CSV file, based on the schema inferred from its first block
+# and widened so that the values of later blocks still fit: series columns (e.g. a node id that
+# looks like a number in the first block) and columns that were empty in the first block are read as
+# strings, and integer columns other than the time column are read as floating point numbers.
+def get_column_types(schema, exportType):
+    import pyarrow
+
+    columnTypes = {}
+    for field in schema:
+        columnName = normalize_column_name(field.name)
+        if columnName in seriesColumnNames[exportType] or pyarrow.types.is_null(field.type):
+            columnTypes[field.name] = pyarrow.string()
+        elif pyarrow.types.is_integer(field.type) and columnName not in timeColumnNames:
+            columnTypes[field.name] = pyarrow.float64()
+        else:
+            columnTypes[field.name] = field.type
+    return columnTypes
+
+# Yields the record batches read by a CSV reader with the series and day partition columns added.
+def add_partition_columns(reader, exportType, memberStem):
+    import pyarrow
+
+    columnNames = [normalize_column_name(name) for name in reader.schema.names]
+    seriesColumnIndex = find_column(columnNames, seriesColumnNames[exportType])
+    timeColumnIndex = find_column(columnNames, timeColumnNames)
+    for batch in reader:
+        if seriesColumnIndex is not None:
+            series = batch.column(seriesColumnIndex).cast(pyarrow.string())
+        else:
+            series = pyarrow.array([memberStem] * batch.num_rows, pyarrow.string())
+        if timeColumnIndex is not None:
+            day = get_utc_days(batch.column(timeColumnIndex))
+        else:
+            day = pyarrow.nulls(batch.num_rows, pyarrow.date32())
+        yield pyarrow.RecordBatch.from_arrays(batch.columns + [series, day], names = batch.schema.names + ['series', 'day'])
+
+# Converts a column of times to UTC dates. Integer columns are treated as milliseconds from the unix
+# epoch, and times without a time zone are treated as UTC. Times that cannot be converted become
+# null, and are written to a 'day=__HIVE_DEFAULT_PARTITION__' partition.
+def get_utc_days(times):
+    import pyarrow
+
+    if pyarrow.types.is_integer(times.type):
+        times = times.cast(pyarrow.timestamp('ms'))
+    elif pyarrow.types.is_string(times.type):
+        try:
+            times = times.cast(pyarrow.timestamp('ms'))
+        except pyarrow.ArrowInvalid:
+            try:
+                times = times.cast(pyarrow.timestamp('ms', tz = 'UTC'))
+            except pyarrow.ArrowInvalid:
+                return pyarrow.nulls(len(times), pyarrow.date32())
+    elif not pyarrow.types.is_timestamp(times.type) and not pyarrow.types.is_date(times.type):
+        return pyarrow.nulls(len(times), pyarrow.date32())
+    return times.cast(pyarrow.date32())
+
+# Returns the index of the first column whose normalized name is in candidateNames, in the order of
+# candidateNames, or None if there is no such column.
+def find_column(columnNames, candidateNames):
+    for candidateName in candidateNames:
+        if candidateName in columnNames:
+            return columnNames.index(candidateName)
+    return None
+
+def normalize_column_name(columnName):
+    return columnName.lower().replace(' ', '').replace('_', '')
+
+# Counts the rows of the record batches that pass through count.
+class RowCounter:
+    def __init__(self):
+        self.rowCount = 0
+
+    def count(self, batches):
+        for batch in batches:
+            self.rowCount += batch.num_rows
+            yield batch
@@ -0,0 +1,151 @@
+# Chooses the length of export windows for --shard-by auto in export-account-data.py and
+# export-group-data.py. Exports of windows that are too long take hours on the server or produce
+# huge files, and windows that are too short spend most of their time on the overhead of each
+# export. The planner records how long every export took on the server and how large its file was,
+# per account or group and per type of data, and sizes each new window so that its export is
+# expected to stay close to a target file size and a target duration. Because the estimates are
+# updated after every export, the windows shrink and grow as the density of the data changes (e.g.
+# periods with more frequent bursts) over a long backfill.
+#
+# The duration of an export is modelled as a fixed overhead (submitting the export, waiting in the
+# server's queue, polling) plus a time per hour of exported data, fitted by a linear regression of
+# the durations on the window lengths. Dividing the duration by the window length instead would
+# count the overhead as time per hour, and the windows would shrink further with every export.
+#
+# The history is kept in a JSON file with the structure:
+#
+#  {
+#    "<scope>/<exportType>": {
+#      # Moving average of the file size per hour of exported data.
+#      "bytesPerHour": Number,
+#      # Moving averages of the window length in hours and the server-side duration in seconds,
+#      # and the moving variance and covariance of the two, for the duration model.
+#      "meanHours": Number,
+#      "meanSeconds": Number,
+#      "hoursVariance": Number,
+#      "hoursSecondsCovariance": Number,
+#      # The length of the last window that was planned, in milliseconds.
+#      "windowMillis": Number,
+#      # The number of exports recorded.
+#      "exportCount": Number
+#    }, ...
+#  }
+#
+# where scope identifies the account (a hash of the API key) or the group.
+
+import json
+import os
+import threading
+
+hourMillis = 60 * 60 * 1000
+
+class ExportPlanner:
+    # Window length used while there is no history for a scope and type of data.
+    initialWindowMillis = 24 * hourMillis
+    # Bounds for the window length. Window lengths are rounded down to whole multiples of
+    # minWindowMillis.
+    minWindowMillis = 15 * 60 * 1000
+    maxWindowMillis = 31 * 24 * hourMillis
+    # Weight of the newest export in the moving averages.
+    smoothing = 0.3
+    # Largest factor by which a window can be longer than the previous one, so that a few windows
+    # without data do not make the next window huge.
+    maxGrowthFactor = 4
+    # Smallest spread of the recorded window lengths, relative to their mean, at which the fixed
+    # overhead and the time per hour can be told apart. Below it the duration is treated as
+    # proportional to the window length.
+    minRelativeHoursSpread = 0.05
+
+    #  - targetBytes: The export file size to aim for.
+    #  - targetSeconds: The server-side export duration to aim for.
+    def __init__(self, historyFilePath, targetBytes, targetSeconds):
+        self.historyFilePath = historyFilePath
+        self.targetBytes = targetBytes
+        self.targetSeconds = targetSeconds
+        # Exports are recorded from several download threads at once.
+        self.lock = threading.Lock()
+        self.history = {}
+        if os.path.exists(historyFilePath):
+            with open(historyFilePath, 'r') as historyFile:
+                self.history = json.load(historyFile)
+
+    # Returns the length in milliseconds of the next window to export.
+    def get_window_millis(self, scope, exportType):
+        with self.lock:
+            entry = self.history.get(f'{scope}/{exportType}')
+            if entry is None:
+                return self.initialWindowMillis
+            # The window length at which each target would be reached.
+            windowHours = []
+            if entry['bytesPerHour'] > 0:
+                windowHours.append(self.targetBytes / entry['bytesPerHour'])
+            secondsPerHour, overheadSeconds = self.get_duration_model(entry)
+            # When the overhead alone exceeds the target, shorter windows would not make the exports
+            # any faster, only more numerous, so only the other limits apply.
+            if secondsPerHour > 0 and overheadSeconds < self.targetSeconds:
+                windowHours.append((self.targetSeconds - overheadSeconds) / secondsPerHour)
+            windowMillis = min(windowHours) * hourMillis if windowHours else self.maxWindowMillis
+            windowMillis = min(windowMillis, entry['windowMillis'] * self.maxGrowthFactor, self.maxWindowMillis)
+            windowMillis = max(int(windowMillis // self.minWindowMillis) * self.minWindowMillis, self.minWindowMillis)
+            entry['windowMillis'] = windowMillis
+            return windowMillis
+
+    # Returns the time per hour of exported data and the fixed overhead of an export, in seconds,
+    # as a tuple.
+    def get_duration_model(self, entry):
+        if 'meanHours' not in entry:
+            return (0, 0)
+        if entry['hoursVariance'] > (self.minRelativeHoursSpread * entry['meanHours']) ** 2:
+            secondsPerHour = entry['hoursSecondsCovariance'] / entry['hoursVariance']
+            overheadSeconds = entry['meanSeconds'] - secondsPerHour * entry['meanHours']
+            if overheadSeconds >= 0:
+                return (secondsPerHour, overheadSeconds)
+        # The window lengths are too similar, or the fit is not meaningful (a negative overhead).
+        return (entry['meanSeconds'] / entry['meanHours'], 0)
+
+    # Splits the range between startMillis and endMillis into consecutive (start, end) windows. The
+    # length of each window is decided when it is requested from the generator, so windows that are
+    # requested after other exports have been recorded take those exports into account.
+    def plan_windows(self, scope, exportType, startMillis, endMillis):
+        windowStart = startMillis
+        while windowStart < endMillis:
+            windowEnd = min(windowStart + self.get_window_millis(scope, exportType), endMillis)
+            yield (windowStart, windowEnd)
+            windowStart = windowEnd
+
+    # Records a completed export and saves the history.
+    #  - windowMillis: The length of the exported window.
+    #  - seconds: The time from submitting the export until it was found to be complete, or 0 if no
+    #             export ran on the server (e.g. there was no data to export), in which case only the
+    #             file size is recorded.
+    #  - byteCount: The size of the export file, or 0 if the export had no data.
+    def record(self, scope, exportType, windowMillis, seconds, byteCount):
+        windowHours = windowMillis / hourMillis
+        if windowHours <= 0:
+            return
+        with self.lock:
+            entry = self.history.get(f'{scope}/{exportType}')
+            if entry is None:
+                entry = { 'bytesPerHour': byteCount / windowHours, 'windowMillis': int(windowMillis), 'exportCount': 0 }
+                self.history[f'{scope}/{exportType}'] = entry
+            else:
+                entry['bytesPerHour'] += self.smoothing * (byteCount / windowHours - entry['bytesPerHour'])
+            if seconds > 0:
+                self.record_duration(entry, windowHours, seconds)
+            entry['exportCount'] += 1
+            # Write to a temporary file first so that an interrupted run never leaves a corrupt file.
+            with open(self.historyFilePath + '.tmp', 'w') as historyFile:
+                json.dump(self.history, historyFile, indent = 2)
+            os.replace(self.historyFilePath + '.tmp', self.historyFilePath)
+
+    # Adds an export to the moving averages, variance and covariance of the duration model.
+    def record_duration(self, entry, windowHours, seconds):
+        if 'meanHours' not in entry:
+            entry.update({ 'meanHours': windowHours, 'meanSeconds': seconds, 'hoursVariance': 0, 'hoursSecondsCovariance': 0 })
+            return
+        hoursDelta = windowHours - entry['meanHours']
+        secondsDelta = seconds - entry['meanSeconds']
+        entry['meanHours'] += self.smoothing * hoursDelta
+        entry['meanSeconds'] += self.smoothing * secondsDelta
+        entry['hoursVariance'] = (1 - self.smoothing) * (entry['hoursVariance'] + self.smoothing * hoursDelta * hoursDelta)
+        entry['hoursSecondsCovariance'] = (1 - self.smoothing) * (entry['hoursSecondsCovariance'] + self.smoothing * hoursDelta * secondsDelta)
@@ -0,0 +1,571 @@
+# Imports general time series data points into SmartDiagnostics: reads the data points of an import
+# file (CSV, Parquet or a dead letter file of failed requests), optionally reduces them (refer to
+# import_reducer.py), and sends them to the web API in batches from a pool of workers (refer to
+# ImportPipeline). Used by import-general-time-series.py, and by sd-daemon.py to run import jobs
+# inside the daemon with its own client. The options of an import are defined by
+# add_import_arguments and passed to run_import as the dictionary parsed from them.
+
+from urllib.error import HTTPError
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import gzip
+import http.client
+import import_reducer
+import importlib.util
+import itertools
+import json
+import math
+import random
+import sd_client
+import threading
+import time
+
+# NumPy is optional. Without it, timestamps and values are converted one data point at a time.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Convenience method to convert a date-time string to a unix timestamp in milliseconds.
+# Accepts a date-time string of the format 'YYYY-MM-DD HH:mm:ssT±HHMM, where
+#
+#    YYYY = the 4-digit year
+#    MM = the 2-digit month
+#    DD = the 2-digit day of the month
+#    HH = the 2-digit hour of the day
+#    mm = the 2-digit minute of the hour
+#    ss = the 2-digit seconds in the minute
+#    ±HHMM = the timezone offset from UTC (e.g. -0400, +1030, +0000)
+def datetime_to_millis(dateTimeString):
+    dateTime = datetime.strptime(dateTimeString, '%Y-%m-%d %H:%M:%ST%z')
+    return (int)(dateTime.timestamp() * 1000)
+
+# Converts a timestamp read from an import file to a unix timestamp in milliseconds. The timestamp
+# can be a number of milliseconds since the unix epoch, a date-time string in the format accepted
+# by datetime_to_millis, or a datetime object (datetimes without a timezone are assumed to be UTC).
+def timestamp_to_millis(timestamp):
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo = timezone.utc)
+        return (int)(timestamp.timestamp() * 1000)
+    if isinstance(timestamp, (int, float)):
+        if not math.isfinite(timestamp) or not -2 ** 63 <= timestamp < 2 ** 63:
+            raise ValueError(f'{timestamp} is not a valid timestamp')
+        return (int)(timestamp)
+    try:
+        return timestamp_to_millis(float(timestamp))
+    except ValueError:
+        return datetime_to_millis(timestamp)
+
+# Converts a whole column of timestamps to unix timestamps in milliseconds at once. The column can
+# hold any of the timestamp types accepted by timestamp_to_millis, as well as numpy datetime64
+# values (which are assumed to be UTC). Returns a tuple with the converted timestamps and a list of
+# the indexes of the timestamps that could not be converted, including numbers that do not fit in a
+# 64-bit number of milliseconds; the converted value of those is 0.
+# Without NumPy the timestamps are converted one at a time.
+def timestamps_to_millis(timestamps):
+    if np is None:
+        return convert_one_at_a_time(timestamps, timestamp_to_millis)
+
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind == 'O' and len(timestamps) > 0 and isinstance(timestamps[0], str):
+        timestamps = timestamps.astype(str)
+
+    if timestamps.dtype.kind == 'i':
+        return (timestamps.astype(np.int64), [])
+    if timestamps.dtype.kind == 'u':
+        invalid = timestamps >= 2 ** 63
+        return (np.where(invalid, 0, timestamps).astype(np.int64), np.flatnonzero(invalid).tolist())
+    if timestamps.dtype.kind == 'f':
+        invalid = ~np.isfinite(timestamps) | (timestamps < -2.0 ** 63) | (timestamps >= 2.0 ** 63)
+        return (np.where(invalid, 0, timestamps).astype(np.int64), np.flatnonzero(invalid).tolist())
+    if timestamps.dtype.kind == 'M':
+        invalid = np.isnat(timestamps)
+        return (np.where(invalid, 0, timestamps.astype('datetime64[ms]').astype(np.int64)), np.flatnonzero(invalid).tolist())
+    if timestamps.dtype.kind == 'U':
+        # Columns of numbers are converted in one step. A column of date-time strings fails on its
+        # first value, so this costs next to nothing when it does not apply.
+        try:
+            return timestamps_to_millis(timestamps.astype(np.float64))
+        except ValueError:
+            pass
+        millis, invalid = datetime_strings_to_millis(timestamps)
+        invalidIndexes = np.flatnonzero(invalid)
+        if len(invalidIndexes) > 0:
+            # Numbers mixed in with date-time strings are handled one at a time.
+            retriedMillis, stillInvalid = convert_one_at_a_time(timestamps[invalidIndexes], timestamp_to_millis)
+            millis[invalidIndexes] = retriedMillis
+            invalidIndexes = invalidIndexes[stillInvalid]
+        return (millis, invalidIndexes.tolist())
+
+    millis, invalidIndexes = convert_one_at_a_time(timestamps, timestamp_to_millis)
+    return (np.array(millis, dtype = np.int64), invalidIndexes)
+
+# Character positions of the digits and separators in the 'YYYY-MM-DD HH:mm:ssT±HHMM' format.
+dateTimeDigitPositions = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18, 21, 22, 23, 24]
+dateTimeSeparators = { 4: '-', 7: '-', 10: ' ', 13: ':', 16: ':', 19: 'T' }
+daysInMonth = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+# Converts a numpy array of date-time strings in the format accepted by datetime_to_millis to unix
+# timestamps in milliseconds, using array arithmetic on the character codes instead of parsing each
+# string. Returns a tuple with the converted timestamps and a boolean array that is True for the
+# strings that are not valid date-times in that format.
+def datetime_strings_to_millis(dateTimeStrings):
+    # View each 25 character string as a row of 25 unicode code points.
+    characters = dateTimeStrings.astype('U25').view(np.uint32).reshape(-1, 25).astype(np.int64)
+    invalid = np.char.str_len(dateTimeStrings) != 25
+    for position, separator in dateTimeSeparators.items():
+        invalid |= characters[:, position] != ord(separator)
+    invalid |= (characters[:, 20] != ord('+')) & (characters[:, 20] != ord('-'))
+    digits = characters[:, dateTimeDigitPositions] - ord('0')
+    invalid |= ((digits < 0) | (digits > 9)).any(axis = 1)
+
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    hour = digits[:, 8] * 10 + digits[:, 9]
+    minute = digits[:, 10] * 10 + digits[:, 11]
+    second = digits[:, 12] * 10 + digits[:, 13]
+    offsetMinutes = (digits[:, 14] * 10 + digits[:, 15]) * 60 + digits[:, 16] * 10 + digits[:, 17]
+    offsetMinutes = np.where(characters[:, 20] == ord('-'), -offsetMinutes, offsetMinutes)
+
+    isLeapYear = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    monthLength = np.array(daysInMonth)[np.clip(month, 1, 12) - 1] + (isLeapYear & (month == 2))
+    invalid |= (year < 1) | (month < 1) | (month > 12) | (day < 1) | (day > monthLength)
+    invalid |= (hour > 23) | (minute > 59) | (second > 59) | (digits[:, 14] * 10 + digits[:, 15] > 23) | (digits[:, 16] * 10 + digits[:, 17] > 59)
+
+    # Number of days since 1970-01-01 (refer to the days_from_civil algorithm by Howard Hinnant).
+    shiftedYear = year - (month <= 2)
+    era = shiftedYear // 400
+    yearOfEra = shiftedYear - era * 400
+    dayOfYear = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    dayOfEra = yearOfEra * 365 + yearOfEra // 4 - yearOfEra // 100 + dayOfYear
+    days = era * 146097 + dayOfEra - 719468
+
+    millis = (((days * 24 + hour) * 60 + minute) * 60 + second - offsetMinutes * 60) * 1000
+    return (np.where(invalid, 0, millis), invalid)
+
+# Converts a whole column of data point values to floating-point numbers at once. Returns a tuple
+# with the converted values and a list of the indexes of the values that are not finite numbers.
+def values_to_floats(values):
+    if np is None:
+        return convert_one_at_a_time(values, parse_value)
+    try:
+        floats = np.asarray(values, dtype = np.float64)
+    except (ValueError, TypeError):
+        floats, invalidIndexes = convert_one_at_a_time(values, parse_value)
+        return (np.array(floats, dtype = np.float64), invalidIndexes)
+    invalid = ~np.isfinite(floats)
+    return (np.where(invalid, 0, floats), np.flatnonzero(invalid).tolist())
+
+# Converts a single data point value to a finite floating-point number.
+def parse_value(value):
+    floatValue = float(value)
+    if not math.isfinite(floatValue):
+        raise ValueError(f'{value} is not a finite number')
+    return floatValue
+
+# Applies convert to each item, and returns a tuple with the converted items and a list of the
+# indexes of the items that could not be converted (their converted value is 0).
+def convert_one_at_a_time(items, convert):
+    convertedItems = []
+    invalidIndexes = []
+    for index, item in enumerate(items):
+        try:
+            convertedItems.append(convert(item))
+        except (ValueError, TypeError, OverflowError):
+            convertedItems.append(0)
+            invalidIndexes.append(index)
+    return (convertedItems, invalidIndexes)
+
+# Number of rows that are read from an import file and converted at once.
+chunkRowCount = 100000
+
+# Converts the node id, sensor role, timestamp and value columns of a chunk of rows read from an
+# import file. Invalid rows are reported and left out. Returns the node ids and sensor roles as
+# lists, and the timestamps (in milliseconds) and values as numpy arrays, or as lists without NumPy.
+#  - firstRowNumber: The row number of the first row of the chunk in the import file, used to
+#                    report invalid rows.
+def convert_chunk(uniqueIds, sensorRoles, timestamps, values, filePath, firstRowNumber):
+    timesMillis, invalidTimeIndexes = timestamps_to_millis(timestamps)
+    floatValues, invalidValueIndexes = values_to_floats(values)
+
+    invalidIndexes = sorted(set(invalidTimeIndexes) | set(invalidValueIndexes))
+    if invalidIndexes:
+        for index in invalidIndexes[:10]:
+            print(f'Skipping row {firstRowNumber + index} of {filePath}: invalid timestamp "{timestamps[index]}" or value "{values[index]}"')
+        if len(invalidIndexes) > 10:
+            print(f'Skipping {len(invalidIndexes) - 10} more invalid rows between rows {firstRowNumber} and {firstRowNumber + len(uniqueIds) - 1} of {filePath}')
+        invalidIndexSet = set(invalidIndexes)
+        uniqueIds, sensorRoles = ([item for index, item in enumerate(column) if index not in invalidIndexSet] for column in (uniqueIds, sensorRoles))
+        if np is not None:
+            timesMillis = np.delete(timesMillis, invalidIndexes)
+            floatValues = np.delete(floatValues, invalidIndexes)
+        else:
+            timesMillis, floatValues = ([item for index, item in enumerate(column) if index not in invalidIndexSet] for column in (timesMillis, floatValues))
+    return [uniqueIds, sensorRoles, timesMillis, floatValues]
+
+# Reads the data points in a CSV file in chunks of chunkRowCount rows, so that files of any size
+# can be imported without loading them into memory. The first row of the file must contain the
+# column names. Yields a list of four columns (node ids, sensor roles, timestamps in milliseconds
+# and values) for each chunk.
+#  - columns: The names of the node id, sensor role, timestamp and value columns, in that order.
+def read_csv_chunks(filePath, columns):
+    with open(filePath, 'r', newline = '') as csvFile:
+        reader = csv.reader(csvFile)
+        header = next(reader)
+        missingColumns = [column for column in columns if column not in header]
+        if missingColumns:
+            raise ValueError(f'The file {filePath} has no column named {", ".join(missingColumns)}.')
+        columnIndexes = [header.index(column) for column in columns]
+        firstRowNumber = 2
+        while True:
+            rows = list(itertools.islice(reader, chunkRowCount))
+            if not rows:
+                break
+            try:
+                chunkColumns = [[row[columnIndex] for row in rows] for columnIndex in columnIndexes]
+            except IndexError:
+                # Rows that are missing columns are reported as invalid by convert_chunk.
+                chunkColumns = [[row[columnIndex] if columnIndex < len(row) else '' for row in rows] for columnIndex in columnIndexes]
+            yield convert_chunk(*chunkColumns, filePath, firstRowNumber)
+            firstRowNumber += len(rows)
+
+# Reads the data points in a Parquet file one batch of chunkRowCount rows at a time. Yields the
+# same columns as read_csv_chunks. Requires the pyarrow package (refer to get_import_arguments_error).
+def read_parquet_chunks(filePath, columns):
+    import pyarrow.parquet
+
+    parquetFile = pyarrow.parquet.ParquetFile(filePath)
+    firstRowNumber = 1
+    for batch in parquetFile.iter_batches(batch_size = chunkRowCount, columns = columns):
+        uniqueIds = [str(uniqueId) for uniqueId in batch.column(columns[0]).to_pylist()]
+        sensorRoles = [str(sensorRole) for sensorRole in batch.column(columns[1]).to_pylist()]
+        if np is not None:
+            timestamps = batch.column(columns[2]).to_numpy(zero_copy_only = False)
+            values = batch.column(columns[3]).to_numpy(zero_copy_only = False)
+        else:
+            timestamps = batch.column(columns[2]).to_pylist()
+            values = batch.column(columns[3]).to_pylist()
+        yield convert_chunk(uniqueIds, sensorRoles, timestamps, values, filePath, firstRowNumber)
+        firstRowNumber += batch.num_rows
+
+# Reads the data points of the import requests saved in a dead letter file (refer to
+# ImportPipeline), so that requests that failed in a previous run can be imported again. Yields
+# the same columns as read_csv_chunks, one chunk per saved request.
+def read_dead_letter_chunks(filePath):
+    with open(filePath, 'r') as deadLetterFile:
+        for lineNumber, line in enumerate(deadLetterFile, start = 1):
+            requestData = json.loads(line)
+            chunkColumns = [[], [], [], []]
+            for node in requestData["Nodes"]:
+                for sensor in node["Sensors"]:
+                    for dataPoint in sensor["DataPoints"]:
+                        chunkColumns[0].append(node["UniqueId"])
+                        chunkColumns[1].append(sensor["SensorRole"])
+                        chunkColumns[2].append(dataPoint["Time"])
+                        chunkColumns[3].append(dataPoint["Value"])
+            yield convert_chunk(*chunkColumns, f'{filePath} (request on line {lineNumber})', 1)
+
+# Returns True if filePath is a Parquet file, based on the file extension.
+def is_parquet_file(filePath):
+    return filePath.lower().endswith(('.parquet', '.pq'))
+
+# Reads the data points in a CSV, Parquet or dead letter file, based on the file extension.
+def read_import_chunks(filePath, columns):
+    if is_parquet_file(filePath):
+        return read_parquet_chunks(filePath, columns)
+    if filePath.lower().endswith('.jsonl'):
+        return read_dead_letter_chunks(filePath)
+    return read_csv_chunks(filePath, columns)
+
+# Approximate number of bytes that a data point adds to the JSON body of an import request, used
+# to limit the size of import requests.
+estimatedBytesPerDataPoint = 48
+
+# Groups the data points of a stream of chunks (refer to read_csv_chunks) by node and sensor, and
+# yields import batches that each hold at most maxPointsPerRequest data points and, if
+# maxBytesPerRequest is set, approximately at most that many bytes of JSON. Only the points of the
+# batch that is being built are kept in memory. An import batch maps each (uniqueId, sensorRole)
+# pair to a tuple with the times and values of its data points, and is converted to the body of
+# an import request by serialize_import_batch.
+def build_import_batches(chunks, maxPointsPerRequest, maxBytesPerRequest = None):
+    # Maps each (uniqueId, sensorRole) pair to the pieces of its times and values that are pending.
+    pendingPieces = {}
+    pendingPointCount = 0
+    pendingBytes = 0
+    for chunk in chunks:
+        for sensorKey, (times, values) in import_reducer.group_chunk_by_sensor(chunk).items():
+            offset = 0
+            while offset < len(times):
+                pointCount = min(len(times) - offset, maxPointsPerRequest - pendingPointCount)
+                if sensorKey not in pendingPieces:
+                    # Approximate size of the node and sensor properties that wrap the data points.
+                    pendingBytes += len(sensorKey[0]) + len(sensorKey[1]) + 60
+                    pendingPieces[sensorKey] = []
+                if maxBytesPerRequest is not None:
+                    pointCount = max(1, min(pointCount, (maxBytesPerRequest - pendingBytes) // estimatedBytesPerDataPoint))
+                pendingPieces[sensorKey].append((times[offset:offset + pointCount], values[offset:offset + pointCount]))
+                offset += pointCount
+                pendingPointCount += pointCount
+                pendingBytes += pointCount * estimatedBytesPerDataPoint
+                if pendingPointCount >= maxPointsPerRequest or (maxBytesPerRequest is not None and pendingBytes >= maxBytesPerRequest):
+                    yield build_import_batch(pendingPieces)
+                    pendingPieces = {}
+                    pendingPointCount = 0
+                    pendingBytes = 0
+    if pendingPointCount > 0:
+        yield build_import_batch(pendingPieces)
+
+# Joins the pending pieces of each (uniqueId, sensorRole) pair into an import batch.
+def build_import_batch(pendingPieces):
+    importBatch = {}
+    for sensorKey, pieces in pendingPieces.items():
+        if np is not None:
+            importBatch[sensorKey] = (np.concatenate([times for times, values in pieces]), np.concatenate([values for times, values in pieces]))
+        else:
+            importBatch[sensorKey] = ([timeMillis for times, values in pieces for timeMillis in times], [value for times, values in pieces for value in values])
+    return importBatch
+
+# Returns the number of data points in an import batch.
+def get_point_count(importBatch):
+    return sum(len(times) for times, values in importBatch.values())
+
+# JSON for a single data point. Each data point consists of a unix timestamp and an associated
+# floating-point value (the repr of a finite float is valid JSON).
+dataPointFormat = '{{"Time":{},"Value":{!r}}}'.format
+
+# Converts an import batch to the UTF-8 JSON body of an import request. The JSON is written
+# directly from the times and values of each sensor, without building a dictionary per data point.
+# The body has the structure:
+#
+#  {
+#    "Nodes": [{
+#      # Arbitrary node id. In the context of general time series data, a node is a
+#      # logical grouping of data sources, and this can represent a Pi system, for example.
+#      "UniqueId": "Pi System",
+#      "Sensors": [{
+#        # Arbitrary value that identifies a data source (e.g. a Pi item).
+#        "SensorRole": "my.item.id",
+#        # Array of time series data.
+#        "DataPoints": [{ "Time": 1564655472000, "Value": 3.61 }, ...]
+#      }]
+#    }]
+#  }
+def serialize_import_batch(importBatch):
+    # Group the sensors of the batch by node.
+    nodes = {}
+    for (uniqueId, sensorRole), (times, values) in importBatch.items():
+        nodes.setdefault(uniqueId, []).append((sensorRole, times, values))
+
+    nodeParts = []
+    for uniqueId, sensors in nodes.items():
+        sensorParts = []
+        for sensorRole, times, values in sensors:
+            if np is not None:
+                times = times.tolist()
+                values = values.tolist()
+            dataPoints = ','.join(map(dataPointFormat, times, values))
+            sensorParts.append(f'{{"SensorRole":{json.dumps(sensorRole)},"DataPoints":[{dataPoints}]}}')
+        nodeParts.append(f'{{"UniqueId":{json.dumps(uniqueId)},"Sensors":[{",".join(sensorParts)}]}}')
+    return f'{{"Nodes":[{",".join(nodeParts)}]}}'.encode('utf-8')
+
+# Sends import requests to the web API from a bounded pool of worker threads, through the connection
+# pool of an sd_client.SmartDiagnosticsClient. Requests that are throttled (HTTP 429) or that fail
+# with a server error (HTTP 5xx) are retried with an exponential backoff, and requests that still
+# fail after maxRetries retries are appended to a dead letter file, one JSON request per line. The
+# dead letter file can be imported again with --file to retry those requests later. If compress is
+# True, request bodies are sent gzip compressed. The time spent sending each request is recorded
+# with the metrics recorder of the client (refer to pipeline_metrics.py).
+#
+# A request that is rejected because the API key is invalid or not allowed to import (HTTP 401 or
+# 403) would fail the same way for every other request, so it stops the import instead of being
+# saved to the dead letter file: the remaining requests are not sent, and submit and close raise the
+# HTTPError.
+class ImportPipeline:
+    # Longest time to wait before retrying a request, in seconds.
+    maxRetryDelaySeconds = 60
+
+    def __init__(self, apiClient, workers, maxRetries, deadLetterFilePath, compress = False):
+        self.apiClient = apiClient
+        self.maxRetries = maxRetries
+        self.deadLetterFilePath = deadLetterFilePath
+        self.compress = compress
+        self.executor = ThreadPoolExecutor(max_workers = workers)
+        # Limits the number of requests waiting for a worker, so that reading the import file never
+        # gets far ahead of sending it.
+        self.pendingRequestSlots = threading.BoundedSemaphore(workers * 2)
+        self.lock = threading.Lock()
+        self.importedPointCount = 0
+        self.failedPointCount = 0
+        # The HTTPError of the first request that was rejected because of the API key, if any.
+        self.authenticationError = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exceptionInfo):
+        self.close()
+
+    # Waits for all submitted requests to be sent.
+    def close(self):
+        self.executor.shutdown(wait = True)
+        if self.authenticationError is not None:
+            raise self.authenticationError
+
+    # Queues an import batch to be sent by the next available worker. Blocks while all workers
+    # are busy and the queue is full.
+    def submit(self, importBatch):
+        self.pendingRequestSlots.acquire()
+        if self.authenticationError is not None:
+            self.pendingRequestSlots.release()
+            raise self.authenticationError
+        self.executor.submit(self.send, importBatch)
+
+    # Sends one import batch, and records whether it was imported or failed.
+    def send(self, importBatch):
+        try:
+            if self.authenticationError is not None:
+                return
+            pointCount = get_point_count(importBatch)
+            body = serialize_import_batch(importBatch)
+            try:
+                self.send_import_request(body)
+            except (http.client.HTTPException, OSError) as err:
+                if isinstance(err, HTTPError) and err.code in (401, 403):
+                    with self.lock:
+                        if self.authenticationError is None:
+                            self.authenticationError = err
+                    return
+                print(f'API POST failure: {err}')
+                with self.lock:
+                    self.failedPointCount += pointCount
+                    with open(self.deadLetterFilePath, 'ab') as deadLetterFile:
+                        deadLetterFile.write(body + b'\n')
+                return
+            with self.lock:
+                self.importedPointCount += pointCount
+                print(f'API POST success. {self.importedPointCount} data points imported so far.')
+        finally:
+            self.pendingRequestSlots.release()
+
+    # Sends the JSON body of an import request to the web API, retrying throttled and failed requests.
+    # The time, size and retries of each request are recorded as an import_post stage.
+    def send_import_request(self, body):
+        startTime = time.monotonic()
+        uncompressedByteCount = len(body)
+        headers = { 'content-type': 'application/json', 'Accept': 'application/json' }
+        if self.compress:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        throttledCount = 0
+        for attempt in range(self.maxRetries + 1):
+            retryDelaySeconds = min(2 ** attempt, self.maxRetryDelaySeconds)
+            try:
+                httpResponse = self.apiClient.post_import(body, headers)
+            except (http.client.HTTPException, OSError) as err:
+                if attempt == self.maxRetries:
+                    self.apiClient.metrics.record('import_post', time.monotonic() - startTime, len(body), attempt,
+                        status = type(err).__name__, throttled = throttledCount, uncompressedBytes = uncompressedByteCount)
+                    raise
+            else:
+                retryable = httpResponse.status == 429 or httpResponse.status >= 500
+                if httpResponse.status < 300 or not retryable or attempt == self.maxRetries:
+                    self.apiClient.metrics.record('import_post', time.monotonic() - startTime, len(body), attempt,
+                        status = httpResponse.status, throttled = throttledCount, uncompressedBytes = uncompressedByteCount)
+                if httpResponse.status < 300:
+                    return
+                if not retryable or attempt == self.maxRetries:
+                    raise sd_client.get_http_error(f'{sd_client.apiBaseUrl}/public/imports', httpResponse)
+                if httpResponse.status == 429:
+                    throttledCount += 1
+                retryAfter = httpResponse.headers.get('Retry-After')
+                if retryAfter is not None and retryAfter.isdigit():
+                    retryDelaySeconds = min(int(retryAfter), self.maxRetryDelaySeconds)
+            # Spread out the retries of requests that failed at the same time.
+            time.sleep(retryDelaySeconds * random.uniform(0.5, 1))
+
+# Adds the options of an import to the argparse.ArgumentParser ap: the import file, its columns, the
+# size of the import requests, the workers and retries, data point reduction and the dead letter
+# file. The options of the connection to the web API belong to the client and are not included.
+def add_import_arguments(ap):
+    ap.add_argument('-f', '--file', required = True,
+       help = 'The CSV or Parquet file that contains the data points to import. Each row holds the node id, sensor role, timestamp and value of one data point.')
+    ap.add_argument('--node-column', required = False, default = 'UniqueId',
+       help = 'The name of the column that holds the node id. Defaults to "UniqueId".')
+    ap.add_argument('--sensor-column', required = False, default = 'SensorRole',
+       help = 'The name of the column that holds the sensor role. Defaults to "SensorRole".')
+    ap.add_argument('--time-column', required = False, default = 'Time',
+       help = 'The name of the column that holds the timestamp, either in milliseconds from the unix epoch or in the format "YYYY-MM-DD HH:mm:ssT+HHMM". Defaults to "Time".')
+    ap.add_argument('--value-column', required = False, default = 'Value',
+       help = 'The name of the column that holds the data point value. Defaults to "Value".')
+    ap.add_argument('--max-points', required = False, type = int, default = 10000,
+       help = 'The maximum number of data points sent in each import request. Defaults to 10000.')
+    ap.add_argument('--max-bytes', required = False, type = int,
+       help = 'The approximate maximum size in bytes of each import request. By default requests are only limited by --max-points.')
+    ap.add_argument('--workers', required = False, type = int, default = 4,
+       help = 'The number of import requests sent in parallel. Defaults to 4.')
+    ap.add_argument('--retries', required = False, type = int, default = 5,
+       help = 'The number of times a throttled or failed import request is retried. Defaults to 5.')
+    ap.add_argument('--gzip', required = False, action='store_true',
+       help = 'Specify this flag to gzip compress the body of each import request.')
+    ap.add_argument('--dedupe', required = False, action='store_true',
+       help = 'Specify this flag to sort the data points of each sensor by time and drop data points with the same timestamp as a later row, before uploading them. Implied by --deadband, --swinging-door and --bucket-seconds.')
+    ap.add_argument('--deadband', required = False, type = float,
+       help = 'Only uploads the data points of each sensor whose value differs by more than the given amount from the last value uploaded.')
+    ap.add_argument('--swinging-door', required = False, type = float,
+       help = 'Compresses the data points of each sensor with swinging door trending, using the given compression deviation. Straight lines between the uploaded data points follow the original data points to within about this amount.')
+    ap.add_argument('--bucket-seconds', required = False, type = float,
+       help = 'Aggregates the data points of each sensor into one data point per time bucket of the given number of seconds (see --bucket-aggregate).')
+    ap.add_argument('--bucket-aggregate', required = False, default = 'mean', choices = ['mean', 'min', 'max', 'first', 'last'],
+       help = 'How the values in each time bucket are aggregated with --bucket-seconds. Defaults to "mean".')
+    ap.add_argument('--dead-letter', required = False, default = 'failed-imports.jsonl',
+       help = 'The file that import requests are saved to when they still fail after all retries. Defaults to "failed-imports.jsonl".')
+
+# Returns the error message for the options of an import in args (refer to add_import_arguments)
+# that cannot be used together or are out of range, or None if they are valid.
+def get_import_arguments_error(args):
+    if args['max_points'] < 1:
+        return '--max-points must be at least 1.'
+    if args['workers'] < 1:
+        return '--workers must be at least 1.'
+    if len(get_reduction_methods(args)) > 1:
+        return 'Only one of --deadband, --swinging-door and --bucket-seconds can be specified.'
+    if args['bucket_seconds'] is not None and args['bucket_seconds'] < 0.001:
+        return '--bucket-seconds must be at least 0.001.'
+    if is_parquet_file(args['file']) and importlib.util.find_spec('pyarrow') is None:
+        return 'Importing Parquet files requires the pyarrow package. Install it with "pip install pyarrow".'
+    return None
+
+# Returns the data point reduction methods chosen in args.
+def get_reduction_methods(args):
+    return [method for method, option in [('deadband', 'deadband'), ('swinging-door', 'swinging_door'), ('bucket', 'bucket_seconds')] if args[option] is not None]
+
+# Imports the data points of an import file through apiClient, an sd_client.SmartDiagnosticsClient.
+# args holds the options of the import (refer to add_import_arguments). Returns a tuple with the
+# number of data points that were imported and the number that failed to import.
+def run_import(apiClient, args):
+    columns = [args['node_column'], args['sensor_column'], args['time_column'], args['value_column']]
+    reductionMethods = get_reduction_methods(args)
+
+    chunks = read_import_chunks(args['file'], columns)
+    reducer = None
+    if reductionMethods or args['dedupe']:
+        tolerance = args['deadband'] if args['deadband'] is not None else args['swinging_door']
+        bucketMillis = round(args['bucket_seconds'] * 1000) if args['bucket_seconds'] is not None else None
+        reducer = import_reducer.DataPointReducer(reductionMethods[0] if reductionMethods else None, tolerance, bucketMillis, args['bucket_aggregate'])
+        chunks = reducer.reduce_chunks(chunks)
+
+    with ImportPipeline(apiClient, args['workers'], args['retries'], args['dead_letter'], args['gzip']) as pipeline:
+        for importBatch in build_import_batches(chunks, args['max_points'], args['max_bytes']):
+            pipeline.submit(importBatch)
+
+    if reducer is not None:
+        print(f'** Reduced {reducer.inputPointCount} data points to {reducer.outputPointCount} before uploading (compression ratio {reducer.get_compression_ratio():.1f}:1). **')
+        apiClient.metrics.record('reduce', reducer.seconds, method = reducer.method or 'dedupe', inputPoints = reducer.inputPointCount, outputPoints = reducer.outputPointCount)
+
+    print(f'** Imported {pipeline.importedPointCount} data points. {pipeline.failedPointCount} data points failed to import. **')
+    if pipeline.failedPointCount > 0:
+        print(f'** The failed requests were saved to {args["dead_letter"]}. Import that file with --file to retry them. **')
+    return (pipeline.importedPointCount, pipeline.failedPointCount)
@@ -0,0 +1,271 @@
+# Reduces the data points of a time series import before they are uploaded (refer to
+# DataPointReducer). Used by import_pipeline.py with --dedupe, --deadband, --swinging-door
+# or --bucket-seconds.
+#
+# The data points are passed around in chunks, the format read by import_pipeline.py: a
+# list with the unique ids, sensor roles, times (milliseconds from the unix epoch) and values of the
+# data points, where the times and values are NumPy arrays if NumPy is installed, and lists otherwise.
+
+import bisect
+import math
+import statistics
+import time
+
+# NumPy is optional. Without it, the data points are reduced one at a time.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Splits a chunk into the times and values of each (uniqueId, sensorRole) pair, keeping the order
+# of the data points within each pair. Returns a dictionary that maps each pair to a tuple with
+# its times and values.
+def group_chunk_by_sensor(chunk):
+    uniqueIds, sensorRoles, times, values = chunk
+    # Number the distinct pairs in the order they first appear in the chunk.
+    sensorIndexes = {}
+    sensorNumbers = [sensorIndexes.setdefault(sensorKey, len(sensorIndexes)) for sensorKey in zip(uniqueIds, sensorRoles)]
+    if np is None:
+        groups = { sensorKey: ([], []) for sensorKey in sensorIndexes }
+        sensorKeys = list(sensorIndexes)
+        for sensorNumber, timeMillis, value in zip(sensorNumbers, times, values):
+            groupTimes, groupValues = groups[sensorKeys[sensorNumber]]
+            groupTimes.append(timeMillis)
+            groupValues.append(value)
+        return groups
+
+    if len(sensorIndexes) == 1:
+        return { next(iter(sensorIndexes)): (times, values) }
+    # Sort the data points by pair, and slice the sorted arrays at the boundaries between pairs.
+    sensorNumbers = np.array(sensorNumbers)
+    order = np.argsort(sensorNumbers, kind = 'stable')
+    boundaries = np.searchsorted(sensorNumbers[order], np.arange(len(sensorIndexes) + 1))
+    times = times[order]
+    values = values[order]
+    return { sensorKey: (times[boundaries[number]:boundaries[number + 1]], values[boundaries[number]:boundaries[number + 1]]) for sensorKey, number in sensorIndexes.items() }
+
+# Reduces the data points of each (uniqueId, sensorRole) pair before they are uploaded, so that
+# signals that are sampled faster than they change are sent with fewer data points. The data points
+# of each pair are sorted by time and exact duplicate timestamps are dropped (the last value read
+# for a timestamp is kept). Then one of the following methods is optionally applied:
+#  - deadband: A data point is kept only if its value differs by more than tolerance from the last
+#              value kept.
+#  - swinging-door: Swinging door trending. A data point is kept only if no straight line from the
+#                   last point kept passes within tolerance of every point since then, in which case
+#                   the point before it is kept.
+#  - bucket: The data points in each bucketMillis long time bucket are aggregated into one data
+#            point at the start of the bucket, with bucketAggregate ('mean', 'min', 'max', 'first'
+#            or 'last') of their values.
+# Chunks are reduced one at a time, so data points are only sorted within each chunk. The points
+# whose fate depends on the next chunk are held back and reduced together with the next chunk: the
+# last point of each pair (a point of the next chunk with the same time replaces it), the point
+# before it while it can still end a swinging door, or the points of the last time bucket. The last
+# point of each pair is always uploaded. When the data points of each pair are in time order in the
+# import file, the result therefore does not depend on the size of the chunks. A point that is older
+# than points of earlier chunks that were already uploaded is reduced without them, e.g. it is
+# uploaded even if one of them has the same time (refer to the README). The sorting, deduplication
+# and bucket aggregation are done with NumPy array operations; deadband and swinging door
+# compression decide each point from the ones kept before it, so they loop over the points.
+class DataPointReducer:
+    def __init__(self, method = None, tolerance = 0, bucketMillis = None, bucketAggregate = 'mean'):
+        self.method = method
+        self.tolerance = tolerance
+        self.bucketMillis = bucketMillis
+        self.bucketAggregate = bucketAggregate
+        # Maps each (uniqueId, sensorRole) pair to the state of its reduction.
+        self.sensorStates = {}
+        self.inputPointCount = 0
+        self.outputPointCount = 0
+        self.seconds = 0
+
+    # Yields the reduced chunks of a stream of chunks, in the same format, followed by a last chunk
+    # with the data points that were held back.
+    def reduce_chunks(self, chunks):
+        for chunk in chunks:
+            startTime = time.monotonic()
+            self.inputPointCount += len(chunk[2])
+            reducedChunk = build_chunk({ sensorKey: self.reduce(sensorKey, times, values) for sensorKey, (times, values) in group_chunk_by_sensor(chunk).items() })
+            self.outputPointCount += len(reducedChunk[2])
+            self.seconds += time.monotonic() - startTime
+            yield reducedChunk
+        finalChunk = build_chunk({ sensorKey: self.flush(sensorKey) for sensorKey in self.sensorStates })
+        self.outputPointCount += len(finalChunk[2])
+        yield finalChunk
+
+    # Returns the number of data points read for each data point uploaded.
+    def get_compression_ratio(self):
+        return self.inputPointCount / self.outputPointCount if self.outputPointCount > 0 else 0
+
+    # Reduces the times and values of one pair in a chunk, and returns the times and values to upload.
+    def reduce(self, sensorKey, times, values):
+        state = self.sensorStates.setdefault(sensorKey, { 'heldTimes': times[:0], 'heldValues': values[:0] })
+        # The held back points come first, so a point of this chunk with the same time replaces them.
+        times, values = sort_and_dedupe(join_points(state['heldTimes'], times), join_points(state['heldValues'], values))
+        if self.method == 'bucket':
+            heldCount = count_last_bucket(times, self.bucketMillis)
+            uploadTimes, uploadValues = aggregate_buckets(times[:len(times) - heldCount], values[:len(values) - heldCount], self.bucketMillis, self.bucketAggregate)
+        else:
+            # The last point is decided only once the next chunk has shown that it is not replaced by
+            # a point with the same time.
+            decidedCount = max(len(times) - 1, 0)
+            keptIndexes = self.get_kept_indexes(times[:decidedCount], values[:decidedCount], state)
+            heldCount = len(times) - decidedCount
+            if state.get('doorEndIndex') is not None:
+                # The point that would end the open swinging door is kept if the door closes later.
+                heldCount += 1
+            uploadTimes, uploadValues = select_points(times, keptIndexes), select_points(values, keptIndexes)
+        state['heldTimes'], state['heldValues'] = times[len(times) - heldCount:], values[len(values) - heldCount:]
+        return (uploadTimes, uploadValues)
+
+    # Returns the times and values to upload for the data points of a pair that are still held back,
+    # once all chunks have been reduced. The last point of the pair is always uploaded.
+    def flush(self, sensorKey):
+        state = self.sensorStates[sensorKey]
+        times, values = state['heldTimes'], state['heldValues']
+        if self.method == 'bucket':
+            return aggregate_buckets(times, values, self.bucketMillis, self.bucketAggregate)
+        keptIndexes = list(self.get_kept_indexes(times, values, state))
+        if len(times) > 0 and (not keptIndexes or keptIndexes[-1] != len(times) - 1):
+            keptIndexes.append(len(times) - 1)
+        return (select_points(times, keptIndexes), select_points(values, keptIndexes))
+
+    # Returns the indexes of the data points (sorted by time) that the reduction method keeps.
+    def get_kept_indexes(self, times, values, state):
+        if self.method == 'deadband':
+            return get_deadband_indexes(values, self.tolerance, state)
+        if self.method == 'swinging-door':
+            return get_swinging_door_indexes(times, values, self.tolerance, state)
+        return range(len(times))
+
+# Joins two sequences of times or values.
+def join_points(first, second):
+    if np is not None:
+        return np.concatenate([first, second])
+    return list(first) + list(second)
+
+# Returns the items at the given indexes.
+def select_points(items, indexes):
+    if np is not None:
+        return items[np.asarray(indexes, dtype = np.int64)]
+    return [items[index] for index in indexes]
+
+# Sorts data points by time and drops the data points whose time equals the time of the next data
+# point, so that the last value read for each time is kept.
+def sort_and_dedupe(times, values):
+    if np is None:
+        points = dict(zip(times, values))
+        sortedTimes = sorted(points)
+        return (sortedTimes, [points[timeMillis] for timeMillis in sortedTimes])
+    order = np.argsort(times, kind = 'stable')
+    times = times[order]
+    values = values[order]
+    isLast = np.append(times[1:] != times[:-1], True) if len(times) > 0 else np.ones(0, dtype = bool)
+    return (times[isLast], values[isLast])
+
+# Returns the number of data points (sorted by time) in the last time bucket.
+def count_last_bucket(times, bucketMillis):
+    if len(times) == 0:
+        return 0
+    lastBucketStart = times[-1] // bucketMillis * bucketMillis
+    if np is not None:
+        return len(times) - int(np.searchsorted(times, lastBucketStart))
+    return len(times) - bisect.bisect_left(times, lastBucketStart)
+
+# Aggregates data points (sorted by time) into one data point per time bucket. Returns the start
+# times of the buckets and the aggregated values.
+def aggregate_buckets(times, values, bucketMillis, bucketAggregate):
+    if np is None:
+        buckets = {}
+        for timeMillis, value in zip(times, values):
+            buckets.setdefault(timeMillis // bucketMillis * bucketMillis, []).append(value)
+        aggregate = { 'mean': statistics.fmean, 'min': min, 'max': max, 'first': lambda bucketValues: bucketValues[0], 'last': lambda bucketValues: bucketValues[-1] }[bucketAggregate]
+        return (list(buckets), [aggregate(bucketValues) for bucketValues in buckets.values()])
+    if len(times) == 0:
+        return (times, values)
+    bucketStarts = times // bucketMillis * bucketMillis
+    firstIndexes = np.flatnonzero(np.append(True, bucketStarts[1:] != bucketStarts[:-1]))
+    if bucketAggregate == 'mean':
+        bucketValues = np.add.reduceat(values, firstIndexes) / np.diff(np.append(firstIndexes, len(values)))
+    elif bucketAggregate == 'min':
+        bucketValues = np.minimum.reduceat(values, firstIndexes)
+    elif bucketAggregate == 'max':
+        bucketValues = np.maximum.reduceat(values, firstIndexes)
+    elif bucketAggregate == 'first':
+        bucketValues = values[firstIndexes]
+    else:
+        bucketValues = values[np.append(firstIndexes[1:], len(values)) - 1]
+    return (bucketStarts[firstIndexes], bucketValues)
+
+# Returns the indexes of the data points (sorted by time) that deadband compression keeps. state
+# holds the last value kept from one chunk to the next.
+def get_deadband_indexes(values, tolerance, state):
+    if len(values) == 0:
+        return []
+    candidateIndexes = range(len(values))
+    if np is not None:
+        # A point with the same value as the point before it is never kept, so only the points where
+        # the value changes need to be checked one at a time.
+        candidateIndexes = np.flatnonzero(np.append(True, values[1:] != values[:-1])).tolist()
+        values = values.tolist()
+    keptIndexes = []
+    lastKeptValue = state.get('lastKeptValue')
+    for index in candidateIndexes:
+        if lastKeptValue is None or abs(values[index] - lastKeptValue) > tolerance:
+            keptIndexes.append(index)
+            lastKeptValue = values[index]
+    state['lastKeptValue'] = lastKeptValue
+    return keptIndexes
+
+# Returns the indexes of the data points (sorted by time) that swinging door compression keeps.
+# state holds the last point kept (the pivot of the door) and the slopes of the door from one chunk
+# to the next, and doorEndIndex, the index of the last point if it ends the open door and is kept
+# when the door closes, or None. That point is held back, so it is the first point of the next
+# chunk; checking it again leaves the door as it was.
+def get_swinging_door_indexes(times, values, tolerance, state):
+    if np is not None:
+        times = times.tolist()
+        values = values.tolist()
+    keptIndexes = []
+    pivot = state.get('pivot')
+    upperSlope, lowerSlope = state.get('slopes', (math.inf, -math.inf))
+    previousIndex = None
+    for index, (timeMillis, value) in enumerate(zip(times, values)):
+        if pivot is not None and timeMillis > pivot[0]:
+            elapsedMillis = timeMillis - pivot[0]
+            nextUpperSlope = min(upperSlope, (value + tolerance - pivot[1]) / elapsedMillis)
+            nextLowerSlope = max(lowerSlope, (value - tolerance - pivot[1]) / elapsedMillis)
+            if nextLowerSlope <= nextUpperSlope:
+                upperSlope, lowerSlope = nextUpperSlope, nextLowerSlope
+                previousIndex = index
+                continue
+            if previousIndex is not None:
+                # The door closed, so the point before this one becomes the new pivot.
+                keptIndexes.append(previousIndex)
+                pivot = (times[previousIndex], values[previousIndex])
+                elapsedMillis = timeMillis - pivot[0]
+                upperSlope = (value + tolerance - pivot[1]) / elapsedMillis
+                lowerSlope = (value - tolerance - pivot[1]) / elapsedMillis
+                previousIndex = index
+                continue
+        # The first point of the pair, or a point that is not after the pivot, starts a new door.
+        keptIndexes.append(index)
+        pivot = (timeMillis, value)
+        upperSlope, lowerSlope = math.inf, -math.inf
+        previousIndex = None
+    state['pivot'] = pivot
+    state['slopes'] = (upperSlope, lowerSlope)
+    state['doorEndIndex'] = previousIndex
+    return keptIndexes
+
+# Builds a chunk from a dictionary that maps each (uniqueId, sensorRole)
+# pair to a tuple with its times and values.
+def build_chunk(sensorPoints):
+    uniqueIds = [uniqueId for (uniqueId, sensorRole), (times, values) in sensorPoints.items() for _ in range(len(times))]
+    sensorRoles = [sensorRole for (uniqueId, sensorRole), (times, values) in sensorPoints.items() for _ in range(len(times))]
+    if np is not None:
+        times = np.concatenate([times for times, values in sensorPoints.values()] or [np.zeros(0, dtype = np.int64)]).astype(np.int64)
+        values = np.concatenate([values for times, values in sensorPoints.values()] or [np.zeros(0)]).astype(np.float64)
+    else:
+        times = [timeMillis for times, values in sensorPoints.values() for timeMillis in times]
+        values = [value for times, values in sensorPoints.values() for value in values]
+    return [uniqueIds, sensorRoles, times, values]
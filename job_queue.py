@@ -0,0 +1,98 @@
+# A durable queue of export and import jobs, used by sd-daemon.py. The queue is an SQLite database,
+# so jobs can be added by one process (sd-daemon.py enqueue-export / enqueue-import) while another
+# process (sd-daemon.py run) works through them, and no job is lost when the daemon is restarted.
+#
+# Each job moves through the states:
+#  - pending: Waiting to be started.
+#  - submitted: An export that is in progress on the server. Its export id is recorded as soon as
+#               the export is submitted, so that a restarted daemon polls the same export instead
+#               of submitting it again.
+#  - downloading: An export whose file is being downloaded.
+#  - running: An import that is being sent to the web API.
+#  - done / failed: Finished, with a short description of the result or error.
+
+import json
+import sqlite3
+import threading
+import time
+
+class JobQueue:
+    def __init__(self, databaseFilePath):
+        # The connection is shared by the daemon's download threads, so access to it is serialized.
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(databaseFilePath, timeout = 30, check_same_thread = False, isolation_level = None)
+        self.connection.row_factory = sqlite3.Row
+        # Write-ahead logging lets other processes add jobs while the daemon is reading the queue.
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            state TEXT NOT NULL,
+            params TEXT NOT NULL,
+            exportId TEXT,
+            result TEXT,
+            createdAt REAL NOT NULL,
+            updatedAt REAL NOT NULL)''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)')
+
+    def close(self):
+        self.connection.close()
+
+    # Adds a job to the end of the queue and returns its id.
+    #  - kind: Either 'export' or 'import'.
+    #  - params: A dictionary with the settings of the job, stored as JSON.
+    def enqueue(self, kind, params):
+        now = time.time()
+        with self.lock:
+            cursor = self.connection.execute('INSERT INTO jobs (kind, state, params, createdAt, updatedAt) VALUES (?, ?, ?, ?, ?)',
+                (kind, 'pending', json.dumps(params), now, now))
+            return cursor.lastrowid
+
+    # Returns the jobs in the given state, oldest first, as dictionaries. kind and limit optionally
+    # restrict the jobs returned.
+    def get_jobs(self, state, kind = None, limit = -1):
+        query = 'SELECT * FROM jobs WHERE state = ?'
+        parameters = [state]
+        if kind is not None:
+            query += ' AND kind = ?'
+            parameters.append(kind)
+        with self.lock:
+            rows = self.connection.execute(query + ' ORDER BY id LIMIT ?', parameters + [limit]).fetchall()
+        return [get_job(row) for row in rows]
+
+    # Returns every job, oldest first.
+    def get_all_jobs(self):
+        with self.lock:
+            rows = self.connection.execute('SELECT * FROM jobs ORDER BY id').fetchall()
+        return [get_job(row) for row in rows]
+
+    # Moves a job to a new state. exportId and result are only changed if they are given.
+    def update(self, jobId, state, exportId = None, result = None):
+        with self.lock:
+            self.connection.execute('UPDATE jobs SET state = ?, exportId = COALESCE(?, exportId), result = COALESCE(?, result), updatedAt = ? WHERE id = ?',
+                (state, exportId, result, time.time(), jobId))
+
+    # Prepares the queue for a daemon that is (re)starting. Downloads that were interrupted are
+    # started again by polling their exports, which returns a fresh download url, and imports that
+    # were interrupted are run again from the start.
+    def reset_interrupted_jobs(self):
+        with self.lock:
+            self.connection.execute("UPDATE jobs SET state = 'submitted' WHERE state = 'downloading'")
+            self.connection.execute("UPDATE jobs SET state = 'pending' WHERE state = 'running'")
+
+    # Moves failed jobs (or only the job jobId) back to pending, so that they are run again. Returns
+    # the number of jobs moved.
+    def retry_failed(self, jobId = None):
+        query = "UPDATE jobs SET state = 'pending', exportId = NULL, result = NULL, updatedAt = ? WHERE state = 'failed'"
+        parameters = [time.time()]
+        if jobId is not None:
+            query += ' AND id = ?'
+            parameters.append(jobId)
+        with self.lock:
+            return self.connection.execute(query, parameters).rowcount
+
+# Converts a row of the jobs table to a dictionary, with the params decoded.
+def get_job(row):
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    return job
@@ -0,0 +1,40 @@
+# Merges downloaded export files whose time ranges overlap into one zip archive that holds each
+# indicator value or burst only once (refer to export_merge.py). For example, to merge every
+# indicator export file in a folder:
+#
+#   python merge-exports.py --output merged_indicator.zip exports/*_indicator.zip
+#
+# With --index, the keys of the merged samples are kept in an index file that later runs add to, so
+# that merging the files of a later export only writes the samples that were not merged before.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+import export_merge
+
+ap = argparse.ArgumentParser()
+ap.add_argument('files', nargs = '+',
+   help = 'The export files (zip archives) to merge. Indicator and burst files are recognized by the "_indicator" or "_burst" at the end of their names.')
+ap.add_argument('-o', '--output', required = True,
+   help = 'The zip archive to write the merged data to.')
+ap.add_argument('--index', required = False,
+   help = 'An SQLite file that keeps the keys of the merged samples between runs. Samples already in the index are skipped. Defaults to a temporary file that is deleted after the merge.')
+args = vars(ap.parse_args())
+
+for exportFilePath in args['files']:
+    if not os.path.isfile(exportFilePath):
+        sys.exit(f'** The export file {exportFilePath} does not exist. **')
+
+startTime = time.monotonic()
+with tempfile.TemporaryDirectory() as indexFolderPath:
+    indexFilePath = args['index'] if args['index'] is not None else os.path.join(indexFolderPath, 'dedup-index.sqlite')
+    with export_merge.DedupIndex(indexFilePath) as dedupIndex:
+        try:
+            rowCount, duplicateCount = export_merge.merge_export_files(args['files'], args['output'], dedupIndex)
+        except zipfile.BadZipFile as err:
+            sys.exit(f'** An export file is not a valid zip archive ({err}). Nothing was merged. **')
+
+print(f'** Merged {len(args["files"])} export file(s) into {args["output"]} in {time.monotonic() - startTime:.1f} seconds: {rowCount} row(s) written, {duplicateCount} duplicate row(s) skipped. **')
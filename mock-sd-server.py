@@ -0,0 +1,274 @@
+# A local mock of the SmartDiagnostics web API, for testing and benchmarking the export and import
+# scripts without sending requests to sd.kcftech.com. Point the scripts at it with the
+# SD_API_BASE_URL environment variable, e.g.:
+#
+#   python mock-sd-server.py --port 8765 --job-seconds 5
+#   set SD_API_BASE_URL=http://127.0.0.1:8765     (export SD_API_BASE_URL=... on Linux/macOS)
+#   python export-account-data.py --apikey ANY_KEY --start "2019-11-19 00:00:00" --indicator
+#
+# The mock implements the account and group export endpoints, the export status endpoint, downloads
+# of export files (with HTTP range requests) and the general time series import endpoint. Every
+# API key is accepted. It also records how long each stage of every export and import took, which
+# can be read back as JSON from /stats (refer to run-benchmark.py).
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import argparse
+import gzip
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zipfile
+
+exportPathPattern = re.compile(r'^/public/exports(/group/[^/]+)?/(indicatorData|burstData)$')
+statusPathPattern = re.compile(r'^/public/exports/([^/]+)/status$')
+downloadPathPattern = re.compile(r'^/public/exports/([^/]+)/download$')
+
+# Size of each block that is written while sending an export file.
+sendBlockBytes = 256 * 1024
+
+# Records the exports submitted to the mock server and the timings of every stage.
+class MockState:
+    def __init__(self, settings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        # Maps each export id to its submission time, duration and download timings.
+        self.exports = {}
+        # Export file contents, built once per export type.
+        self.exportFiles = {}
+        self.stats = {
+            'submitCount': 0, 'statusCount': 0, 'completedExportCount': 0, 'downloadCount': 0,
+            'downloadedBytes': 0, 'importCount': 0, 'importedPointCount': 0, 'importedBytes': 0,
+            'failedRequestCount': 0, 'connectionCount': 0,
+            # Timings of each stage, in seconds:
+            #  - submitSeconds: Time to handle an export submission.
+            #  - completionLagSeconds: Time between an export job finishing and the client polling its
+            #                          status and finding it completed.
+            #  - downloadSeconds: Time to send a complete export file (or one byte range of it).
+            #  - exportSeconds: Time from an export submission to the end of its download.
+            #  - importSeconds: Time to handle an import request.
+            'submitSeconds': [], 'completionLagSeconds': [], 'downloadSeconds': [], 'exportSeconds': [],
+            'importSeconds': [],
+        }
+
+    def add_stat(self, name, value):
+        with self.lock:
+            if isinstance(self.stats[name], list):
+                self.stats[name].append(value)
+            else:
+                self.stats[name] += value
+
+    # Returns the contents of the export file of an export type, a zip archive with one CSV file that
+    # holds about exportBytes of data.
+    def get_export_file(self, exportType):
+        with self.lock:
+            if exportType not in self.exportFiles:
+                self.exportFiles[exportType] = build_export_file(exportType, self.settings['export_bytes'])
+            return self.exportFiles[exportType]
+
+# Builds an export zip file. The CSV file is stored without compression so that the size of the
+# zip file is close to exportBytes.
+def build_export_file(exportType, exportBytes):
+    rows = io.StringIO()
+    if exportType == 'burstData':
+        rows.write('NodeId,SensorType,Timestamp,Samples\n')
+        row = 0
+        while rows.tell() < exportBytes:
+            samples = ','.join(f'{random.uniform(-1, 1):.5f}' for sample in range(256))
+            rows.write(f'Node{row % 10},Accel,{1564655472000 + row * 60000},{samples}\n')
+            row += 1
+    else:
+        rows.write('Timestamp,IndicatorType,NodeId,Value\n')
+        row = 0
+        while rows.tell() < exportBytes:
+            rows.write(f'{1564655472000 + row * 1000},Temperature,Node{row % 10},{random.uniform(0, 100):.3f}\n')
+            row += 1
+    zipBuffer = io.BytesIO()
+    with zipfile.ZipFile(zipBuffer, 'w', zipfile.ZIP_STORED) as exportZipFile:
+        exportZipFile.writestr(f'{exportType}.csv', rows.getvalue())
+    return zipBuffer.getvalue()
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    # Keep connections alive, like the real web API.
+    protocol_version = 'HTTP/1.1'
+
+    # Counts the connections opened by the clients, to check that the scripts reuse them.
+    def setup(self):
+        super().setup()
+        self.server.state.add_stat('connectionCount', 1)
+
+    def log_message(self, format, *args):
+        if self.server.state.settings['verbose']:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        startTime = time.monotonic()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        path = urlsplit(self.path).path
+        self.simulate_latency()
+        if exportPathPattern.match(path):
+            self.handle_export_submission(path, body, startTime)
+        elif path == '/public/imports':
+            self.handle_import(body, startTime)
+        else:
+            self.send_body(404, b'')
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/stats':
+            with self.server.state.lock:
+                return self.send_body(200, json.dumps(self.server.state.stats).encode('utf-8'))
+        self.simulate_latency()
+        statusMatch = statusPathPattern.match(path)
+        downloadMatch = downloadPathPattern.match(path)
+        if statusMatch:
+            self.handle_status(statusMatch.group(1))
+        elif downloadMatch:
+            self.handle_download(downloadMatch.group(1))
+        else:
+            self.send_body(404, b'')
+
+    def handle_export_submission(self, path, body, startTime):
+        state = self.server.state
+        if self.should_fail():
+            return self.send_body(503, b'')
+        exportId = uuid.uuid4().hex
+        jobSeconds = max(0, random.gauss(state.settings['job_seconds'], state.settings['job_jitter_seconds']))
+        with state.lock:
+            state.exports[exportId] = { 'submittedAt': time.monotonic(), 'jobSeconds': jobSeconds, 'exportType': path.rsplit('/', 1)[1], 'reportedComplete': False }
+        state.add_stat('submitCount', 1)
+        self.send_body(200, json.dumps(exportId).encode('utf-8'))
+        state.add_stat('submitSeconds', time.monotonic() - startTime)
+
+    def handle_status(self, exportId):
+        state = self.server.state
+        state.add_stat('statusCount', 1)
+        export = state.exports.get(exportId)
+        if export is None:
+            return self.send_body(404, b'')
+        elapsedSeconds = time.monotonic() - export['submittedAt']
+        if elapsedSeconds < export['jobSeconds']:
+            statusResult = { 'exportCompleted': False, 'reportsProgress': True, 'progress': int(100 * elapsedSeconds / export['jobSeconds']) }
+        else:
+            with state.lock:
+                firstCompletedStatus = not export['reportedComplete']
+                export['reportedComplete'] = True
+            if firstCompletedStatus:
+                state.add_stat('completedExportCount', 1)
+                state.add_stat('completionLagSeconds', elapsedSeconds - export['jobSeconds'])
+            host = self.headers.get('Host')
+            statusResult = { 'exportCompleted': True, 'reportsProgress': True, 'progress': 100, 'downloadUrl': f'http://{host}/public/exports/{exportId}/download' }
+        self.send_body(200, json.dumps(statusResult).encode('utf-8'))
+
+    def handle_download(self, exportId):
+        state = self.server.state
+        export = state.exports.get(exportId)
+        if export is None:
+            return self.send_body(404, b'')
+        startTime = time.monotonic()
+        exportFile = state.get_export_file(export['exportType'])
+        status, firstByte, lastByte = 200, 0, len(exportFile) - 1
+        rangeMatch = re.match(r'^bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if rangeMatch:
+            status, firstByte = 206, int(rangeMatch.group(1))
+            if rangeMatch.group(2):
+                lastByte = min(int(rangeMatch.group(2)), lastByte)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Length', str(lastByte - firstByte + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {firstByte}-{lastByte}/{len(exportFile)}')
+        self.end_headers()
+        for blockStart in range(firstByte, lastByte + 1, sendBlockBytes):
+            self.wfile.write(exportFile[blockStart:min(blockStart + sendBlockBytes, lastByte + 1)])
+        sentBytes = lastByte - firstByte + 1
+        state.add_stat('downloadedBytes', sentBytes)
+        # Probe requests for a single byte are not counted as downloads.
+        if sentBytes > 1:
+            endTime = time.monotonic()
+            state.add_stat('downloadCount', 1)
+            state.add_stat('downloadSeconds', endTime - startTime)
+            if lastByte == len(exportFile) - 1:
+                state.add_stat('exportSeconds', endTime - export['submittedAt'])
+
+    def handle_import(self, body, startTime):
+        state = self.server.state
+        if self.should_fail():
+            return self.send_body(random.choice([429, 500, 503]), b'', { 'Retry-After': '1' })
+        state.add_stat('importedBytes', len(body))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        requestData = json.loads(body)
+        pointCount = sum(len(sensor['DataPoints']) for node in requestData['Nodes'] for sensor in node['Sensors'])
+        self.send_body(200, b'')
+        state.add_stat('importCount', 1)
+        state.add_stat('importedPointCount', pointCount)
+        state.add_stat('importSeconds', time.monotonic() - startTime)
+
+    def simulate_latency(self):
+        latencySeconds = self.server.state.settings['latency_ms'] / 1000
+        if latencySeconds > 0:
+            time.sleep(latencySeconds)
+
+    def should_fail(self):
+        if random.random() < self.server.state.settings['error_rate']:
+            self.server.state.add_stat('failedRequestCount', 1)
+            return True
+        return False
+
+    # Sends a JSON response body, gzip compressed if the client accepts it, like the real web API.
+    def send_body(self, status, body, headers = {}):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if body and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+# Starts a mock server on the given port with the given settings (the same settings as the
+# command-line arguments below). Returns the server, which is already serving requests on a
+# background thread; call shutdown() to stop it.
+def start_mock_server(port, settings):
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockRequestHandler)
+    server.daemon_threads = True
+    server.state = MockState(settings)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--port', required = False, type = int, default = 8765,
+       help = 'The port to listen on. Defaults to 8765.')
+    ap.add_argument('--latency-ms', required = False, type = float, default = 0,
+       help = 'Extra delay added to every API request, in milliseconds. Defaults to 0.')
+    ap.add_argument('--job-seconds', required = False, type = float, default = 5,
+       help = 'The average time each export job takes to complete, in seconds. Defaults to 5.')
+    ap.add_argument('--job-jitter-seconds', required = False, type = float, default = 0,
+       help = 'The standard deviation of the time each export job takes, in seconds. Defaults to 0.')
+    ap.add_argument('--export-mb', required = False, type = float, default = 1,
+       help = 'The size of each export file, in megabytes. Defaults to 1.')
+    ap.add_argument('--error-rate', required = False, type = float, default = 0,
+       help = 'The fraction of export submissions and import requests that fail with a 429 or 5xx error (e.g. 0.05). Defaults to 0.')
+    ap.add_argument('--verbose', required = False, action='store_true',
+       help = 'Specify this flag to log every request.')
+    args = vars(ap.parse_args())
+    args['export_bytes'] = int(args['export_mb'] * 1024 * 1024)
+
+    server = start_mock_server(args['port'], args)
+    print(f'** Mock SmartDiagnostics API listening on http://127.0.0.1:{args["port"]} (set SD_API_BASE_URL to this URL) **')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,104 @@
+# Records how long each stage of the export and import scripts takes, so that slow accounts,
+# throttling and the effect of tuning settings such as --max-concurrent or --workers can be seen
+# in real runs. Used by export-account-data.py, export-group-data.py and
+# import-general-time-series.py when they are run with --metrics-file or --prometheus-file.
+#
+# The stages are:
+#  - submit: Sending an export request to the web API.
+#  - queue_wait: The time between submitting an export and the server starting to work on it,
+#                estimated from the progress reported by the export status.
+#  - processing: The time the server spent working on an export, from the end of queue_wait until
+#                the export was found to be complete.
+#  - download: Downloading an export file.
+#  - verify: Checking the zip archive of a downloaded export file.
+#  - reduce: Sorting, deduplicating and compressing the data points of an import before they are
+#            uploaded (the total of the whole import).
+#  - import_post: Sending an import request to the web API, including any retries.
+#
+# Each recorded stage is written to the metrics file as one JSON object per line, with the
+# structure:
+#
+#  {
+#    "time": "2019-11-19T00:00:00.000000+00:00",
+#    "stage": "download",
+#    "seconds": 1.25,
+#    "bytes": 1048576,
+#    "retries": 0,
+#    # Any details of the stage, e.g. "exportId", "exportType", "file", "status" or "throttled".
+#    ...
+#  }
+#
+# The Prometheus file is written in the Prometheus text exposition format when the script ends
+# (e.g. for the node_exporter textfile collector), with the totals of every stage and export type.
+
+from datetime import datetime, timezone
+import json
+import os
+import threading
+
+# Upper bounds of the buckets of the stage duration histograms, in seconds.
+histogramBucketSeconds = [0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600]
+
+class MetricsRecorder:
+    # Both files are optional; without them, stages are only added up in memory.
+    def __init__(self, jsonLinesFilePath = None, prometheusFilePath = None):
+        self.jsonLinesFilePath = jsonLinesFilePath
+        self.prometheusFilePath = prometheusFilePath
+        self.lock = threading.Lock()
+        # Maps each (stage, exportType) pair to the totals of that stage.
+        self.totals = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exceptionInfo):
+        self.close()
+
+    # Records one occurrence of a stage.
+    #  - seconds: How long the stage took.
+    #  - byteCount: The number of bytes sent or received in the stage.
+    #  - retryCount: The number of times the stage was retried.
+    #  - details: Any other details of the stage, written to the metrics file as they are. An
+    #             exportType detail is also used as a label of the Prometheus metrics.
+    def record(self, stage, seconds, byteCount = 0, retryCount = 0, **details):
+        with self.lock:
+            totals = self.totals.setdefault((stage, details.get('exportType', '')), {
+                'count': 0, 'seconds': 0, 'bytes': 0, 'retries': 0, 'buckets': [0] * len(histogramBucketSeconds) })
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['bytes'] += byteCount
+            totals['retries'] += retryCount
+            for bucket, bucketSeconds in enumerate(histogramBucketSeconds):
+                if seconds <= bucketSeconds:
+                    totals['buckets'][bucket] += 1
+            if self.jsonLinesFilePath is not None:
+                line = { 'time': datetime.now(timezone.utc).isoformat(), 'stage': stage, 'seconds': round(seconds, 6), 'bytes': byteCount, 'retries': retryCount }
+                line.update(details)
+                with open(self.jsonLinesFilePath, 'a') as jsonLinesFile:
+                    jsonLinesFile.write(json.dumps(line) + '\n')
+
+    # Writes the Prometheus file, if one was requested.
+    def close(self):
+        if self.prometheusFilePath is None:
+            return
+        with self.lock:
+            lines = [
+                '# HELP sd_pipeline_stage_seconds Time spent in each stage of the SmartDiagnostics export and import scripts.',
+                '# TYPE sd_pipeline_stage_seconds histogram',
+            ]
+            for (stage, exportType), totals in sorted(self.totals.items()):
+                labels = f'stage="{stage}",export_type="{exportType}"'
+                for bucketSeconds, bucketCount in zip(histogramBucketSeconds, totals['buckets']):
+                    lines.append(f'sd_pipeline_stage_seconds_bucket{{{labels},le="{bucketSeconds}"}} {bucketCount}')
+                lines.append(f'sd_pipeline_stage_seconds_bucket{{{labels},le="+Inf"}} {totals["count"]}')
+                lines.append(f'sd_pipeline_stage_seconds_sum{{{labels}}} {totals["seconds"]}')
+                lines.append(f'sd_pipeline_stage_seconds_count{{{labels}}} {totals["count"]}')
+            for name, total, help in [('bytes', 'bytes', 'Bytes sent or received in each stage.'), ('retries', 'retries', 'Retries in each stage.')]:
+                lines.append(f'# HELP sd_pipeline_stage_{name}_total {help}')
+                lines.append(f'# TYPE sd_pipeline_stage_{name}_total counter')
+                for (stage, exportType), totals in sorted(self.totals.items()):
+                    lines.append(f'sd_pipeline_stage_{name}_total{{stage="{stage}",export_type="{exportType}"}} {totals[total]}')
+            # Write to a temporary file first so that a collector never reads a partial file.
+            with open(self.prometheusFilePath + '.tmp', 'w') as prometheusFile:
+                prometheusFile.write('\n'.join(lines) + '\n')
+            os.replace(self.prometheusFilePath + '.tmp', self.prometheusFilePath)
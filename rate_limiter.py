@@ -0,0 +1,144 @@
+# Paces the requests that the export and import scripts send to the web API, so that many parallel
+# exports or import workers stay close to the rate the API allows without getting the API key
+# throttled. Every request to the web API goes through one shared ApiGate, which combines:
+#  - An adaptive token bucket: requests are spread out to at most the current rate. The rate is
+#    halved when the API throttles a request (HTTP 429), and grows back slowly while requests
+#    succeed (additive increase, multiplicative decrease). A Retry-After header pauses all
+#    requests for the given time.
+#  - A circuit breaker: after several consecutive server errors or connection failures the API is
+#    considered unhealthy, and no requests are sent until a cool-down has passed. Then a single
+#    trial request is let through; if it succeeds requests resume, otherwise the cool-down doubles.
+
+import threading
+import time
+
+class ApiGate:
+    # Smallest rate the limiter slows down to, in requests per second.
+    minRequestsPerSecond = 0.2
+    # Requests per second added to the rate for every second of requests without throttling.
+    increasePerSecond = 0.5
+    # Number of consecutive failures after which the circuit breaker opens.
+    failureThreshold = 5
+    # Bounds for how long the circuit breaker stays open before a trial request, in seconds.
+    minOpenSeconds = 5
+    maxOpenSeconds = 300
+
+    #  - maxRequestsPerSecond: The highest rate at which requests are sent. The limiter starts at
+    #                          this rate and never goes above it.
+    def __init__(self, maxRequestsPerSecond):
+        self.maxRequestsPerSecond = maxRequestsPerSecond
+        self.requestsPerSecond = maxRequestsPerSecond
+        self.condition = threading.Condition()
+        # Token bucket state. At most one second's worth of requests can be sent in a burst.
+        self.tokens = 1
+        self.refilledAt = time.monotonic()
+        # Time until which all requests are paused after a Retry-After header.
+        self.pausedUntil = 0
+        self.decreasedAt = 0
+        # Circuit breaker state: 'closed' (healthy), 'open' (paused) or 'half-open' (one trial request).
+        self.circuitState = 'closed'
+        self.consecutiveFailures = 0
+        self.openSeconds = self.minOpenSeconds
+        self.openUntil = 0
+        self.trialInProgress = False
+
+    # Blocks until a request may be sent.
+    def acquire(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                waitSeconds = self.get_circuit_wait_seconds(now)
+                if waitSeconds is None:
+                    # A trial request is in progress; wait for its outcome.
+                    self.condition.wait()
+                    continue
+                waitSeconds = max(waitSeconds, self.pausedUntil - now)
+                if waitSeconds <= 0:
+                    self.tokens = min(max(self.requestsPerSecond, 1), self.tokens + (now - self.refilledAt) * self.requestsPerSecond)
+                    self.refilledAt = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        if self.circuitState == 'half-open':
+                            self.trialInProgress = True
+                        return
+                    waitSeconds = (1 - self.tokens) / self.requestsPerSecond
+                self.condition.wait(waitSeconds)
+
+    # Returns how long to wait before the circuit breaker lets a request through, or None if the
+    # request must wait for a trial request to finish.
+    def get_circuit_wait_seconds(self, now):
+        if self.circuitState == 'open':
+            if now < self.openUntil:
+                return self.openUntil - now
+            self.circuitState = 'half-open'
+            self.trialInProgress = False
+        if self.circuitState == 'half-open' and self.trialInProgress:
+            return None
+        return 0
+
+    # Reports that a request succeeded (or failed in a way that says nothing about the health of
+    # the API, e.g. an HTTP 404).
+    def report_success(self):
+        with self.condition:
+            if self.circuitState != 'closed':
+                print('** The API is responding again. Resuming requests. **')
+            self.circuitState = 'closed'
+            self.consecutiveFailures = 0
+            self.openSeconds = self.minOpenSeconds
+            self.trialInProgress = False
+            # Grow the rate by about increasePerSecond for every second of successful requests.
+            self.requestsPerSecond = min(self.maxRequestsPerSecond, self.requestsPerSecond + self.increasePerSecond / self.requestsPerSecond)
+            self.condition.notify_all()
+
+    # Reports that a request was throttled (HTTP 429).
+    #  - retryAfterSeconds: The delay from the Retry-After header of the response, or None.
+    def report_throttled(self, retryAfterSeconds = None):
+        with self.condition:
+            now = time.monotonic()
+            # Requests that were already in flight when the rate was lowered are often throttled
+            # too; only lower the rate once per second.
+            if now - self.decreasedAt >= 1:
+                self.requestsPerSecond = max(self.minRequestsPerSecond, self.requestsPerSecond / 2)
+                self.tokens = min(self.tokens, 0)
+                self.decreasedAt = now
+                print(f'** The API is throttling requests. Slowing down to {self.requestsPerSecond:.2g} requests per second. **')
+            if retryAfterSeconds is not None:
+                self.pausedUntil = max(self.pausedUntil, now + retryAfterSeconds)
+            if self.circuitState == 'half-open':
+                self.trialInProgress = False
+            self.condition.notify_all()
+
+    # Reports that a request failed with a server error (HTTP 5xx) or a connection failure.
+    def report_failure(self):
+        with self.condition:
+            now = time.monotonic()
+            self.consecutiveFailures += 1
+            if self.circuitState == 'half-open':
+                # The trial request failed; stay paused for longer.
+                self.openSeconds = min(self.openSeconds * 2, self.maxOpenSeconds)
+                self.open_circuit(now)
+            elif self.circuitState == 'closed' and self.consecutiveFailures >= self.failureThreshold:
+                self.open_circuit(now)
+            self.condition.notify_all()
+
+    def open_circuit(self, now):
+        self.circuitState = 'open'
+        self.openUntil = now + self.openSeconds
+        self.trialInProgress = False
+        print(f'** The API appears to be unavailable. Pausing requests for {self.openSeconds} seconds. **')
+
+    # Reports the outcome of a request from its HTTP status code and Retry-After header.
+    def report_status(self, status, retryAfter = None):
+        if status == 429:
+            self.report_throttled(parse_retry_after(retryAfter))
+        elif status >= 500:
+            self.report_failure()
+        else:
+            self.report_success()
+
+# Converts the value of a Retry-After header to seconds. Returns None if the header is missing or
+# is not a number of seconds.
+def parse_retry_after(retryAfter):
+    if retryAfter is None or not retryAfter.strip().isdigit():
+        return None
+    return int(retryAfter.strip())
@@ -0,0 +1,185 @@
+# Measures the throughput of the export and import scripts against the local mock server in
+# mock-sd-server.py, so that concurrency settings can be sized and performance regressions caught
+# without sending requests to sd.kcftech.com. Each scenario starts its own mock server, runs one of
+# the scripts against it, and reports:
+#  - exports/hour: Export files downloaded per hour of wall-clock time.
+#  - MB/s: Megabytes of export files downloaded per second of wall-clock time.
+#  - points/s: Data points imported per second of wall-clock time.
+#  - p50/p99 of each stage recorded by the mock server (refer to MockState in mock-sd-server.py).
+#
+# Results can be saved with --output and compared with a previous run with --baseline, which
+# reports every metric that got more than --tolerance worse.
+
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+scriptFolderPath = Path(__file__).resolve().parent
+
+# Metrics for which a larger value is better. For all other metrics (timings), smaller is better.
+throughputMetrics = ['exportsPerHour', 'downloadMBPerSecond', 'pointsPerSecond']
+
+# Runs one benchmark scenario and returns its metrics.
+#  - mockArguments: Command-line arguments for mock-sd-server.py.
+#  - scriptArguments: The script to benchmark and its command-line arguments.
+#  - workFolderPath: The folder the script is run in.
+def run_scenario(name, mockArguments, scriptArguments, workFolderPath):
+    port = get_free_port()
+    mockServer = subprocess.Popen([sys.executable, str(scriptFolderPath / 'mock-sd-server.py'), '--port', str(port)] + mockArguments,
+        stdout = subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        environment = dict(os.environ, SD_API_BASE_URL = f'http://127.0.0.1:{port}')
+        print(f'** Running scenario "{name}" **')
+        startTime = time.monotonic()
+        scriptResult = subprocess.run([sys.executable, str(scriptFolderPath / scriptArguments[0])] + scriptArguments[1:],
+            cwd = workFolderPath, env = environment, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True)
+        wallSeconds = time.monotonic() - startTime
+        if scriptResult.returncode != 0:
+            print(scriptResult.stdout)
+            sys.exit(f'** Scenario "{name}" failed with exit code {scriptResult.returncode}. **')
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/stats') as httpResponse:
+            stats = json.loads(httpResponse.read().decode('utf-8'))
+    finally:
+        mockServer.terminate()
+        mockServer.wait()
+
+    metrics = {
+        'wallSeconds': wallSeconds,
+        'submitCount': stats['submitCount'],
+        'statusCount': stats['statusCount'],
+        'failedRequestCount': stats['failedRequestCount'],
+        'connectionCount': stats['connectionCount'],
+    }
+    if stats['submitCount'] > 0:
+        metrics['exportsPerHour'] = len(stats['exportSeconds']) / wallSeconds * 3600
+        metrics['downloadMBPerSecond'] = stats['downloadedBytes'] / 1048576 / wallSeconds
+    if stats['importCount'] > 0:
+        metrics['pointsPerSecond'] = stats['importedPointCount'] / wallSeconds
+    for stage in ['submitSeconds', 'completionLagSeconds', 'downloadSeconds', 'exportSeconds', 'importSeconds']:
+        if stats[stage]:
+            metrics[f'{stage}P50'] = get_percentile(stats[stage], 50)
+            metrics[f'{stage}P99'] = get_percentile(stats[stage], 99)
+    return metrics
+
+# Returns the given percentile of a list of numbers, using the nearest-rank method.
+def get_percentile(values, percentile):
+    sortedValues = sorted(values)
+    rank = max(1, -(-len(sortedValues) * percentile // 100))
+    return sortedValues[rank - 1]
+
+def get_free_port():
+    with socket.socket() as freeSocket:
+        freeSocket.bind(('127.0.0.1', 0))
+        return freeSocket.getsockname()[1]
+
+# Waits until the mock server accepts connections.
+def wait_for_port(port):
+    for attempt in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout = 1).close()
+            return
+        except ConnectionError:
+            time.sleep(0.1)
+    sys.exit(f'** The mock server did not start on port {port}. **')
+
+# Writes a CSV file of general time series data to import, with pointCount data points spread over
+# 10 nodes with 10 sensors each.
+def write_import_file(filePath, pointCount):
+    with open(filePath, 'w') as importFile:
+        importFile.write('UniqueId,SensorRole,Time,Value\n')
+        for point in range(pointCount):
+            importFile.write(f'Node{point % 10},sensor.{point // 10 % 10},{1564655472000 + point * 1000},{random.uniform(0, 100):.3f}\n')
+
+# Prints the metrics of every scenario.
+def print_results(results):
+    for name, metrics in results.items():
+        print(f'** {name} **')
+        for metric, value in metrics.items():
+            print(f'  {metric}: {value:.4g}')
+
+# Compares results with the results of a previous run. Returns the list of metrics that are more
+# than tolerance (a fraction, e.g. 0.2 for 20%) worse than in the previous run.
+def compare_results(results, baselineResults, tolerance):
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            baselineValue = baselineResults.get(name, {}).get(metric)
+            if not baselineValue or metric in ['wallSeconds', 'submitCount', 'statusCount', 'failedRequestCount', 'connectionCount']:
+                continue
+            if metric in throughputMetrics:
+                worse = value < baselineValue * (1 - tolerance)
+            else:
+                worse = value > baselineValue * (1 + tolerance)
+            if worse:
+                regressions.append(f'{name} {metric}: {value:.4g} (baseline {baselineValue:.4g})')
+    return regressions
+
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument('--exports', required = False, type = int, default = 24,
+   help = 'The number of export shards (hours) and groups to export in the export scenarios. Defaults to 24.')
+ap.add_argument('--max-concurrent', required = False, type = int, default = 8,
+   help = 'The --max-concurrent setting of the export scripts. Defaults to 8.')
+ap.add_argument('--download-connections', required = False, type = int, default = 1,
+   help = 'The --download-connections setting of the export scripts. Defaults to 1.')
+ap.add_argument('--points', required = False, type = int, default = 200000,
+   help = 'The number of data points to import in the import scenario. Defaults to 200000.')
+ap.add_argument('--workers', required = False, type = int, default = 4,
+   help = 'The --workers setting of the import script. Defaults to 4.')
+ap.add_argument('--job-seconds', required = False, type = float, default = 2,
+   help = 'The average time each mock export job takes, in seconds. Defaults to 2.')
+ap.add_argument('--latency-ms', required = False, type = float, default = 20,
+   help = 'The latency of each mock API request, in milliseconds. Defaults to 20.')
+ap.add_argument('--export-mb', required = False, type = float, default = 5,
+   help = 'The size of each mock export file, in megabytes. Defaults to 5.')
+ap.add_argument('--error-rate', required = False, type = float, default = 0,
+   help = 'The fraction of mock export submissions and import requests that fail. Defaults to 0.')
+ap.add_argument('--output', required = False,
+   help = 'A JSON file to save the results to.')
+ap.add_argument('--baseline', required = False,
+   help = 'A JSON file saved with --output by a previous run, to compare the results with.')
+ap.add_argument('--tolerance', required = False, type = float, default = 0.2,
+   help = 'How much worse than the baseline a metric can be before it is reported as a regression, as a fraction. Defaults to 0.2.')
+args = vars(ap.parse_args())
+
+mockArguments = ['--job-seconds', str(args['job_seconds']), '--job-jitter-seconds', str(args['job_seconds'] / 4),
+    '--latency-ms', str(args['latency_ms']), '--export-mb', str(args['export_mb']), '--error-rate', str(args['error_rate'])]
+exportArguments = ['--apikey', 'benchmark', '--indicator', '--max-concurrent', str(args['max_concurrent']),
+    '--download-connections', str(args['download_connections'])]
+endTime = f'2019-11-{1 + args["exports"] // 24:02d} {args["exports"] % 24:02d}:00:00'
+
+results = {}
+with tempfile.TemporaryDirectory() as workFolderPath:
+    results['account export'] = run_scenario('account export', mockArguments,
+        ['export-account-data.py', '--start', '2019-11-01 00:00:00', '--end', endTime, '--shard-by', 'hour'] + exportArguments, workFolderPath)
+    groupIds = [str(groupId) for groupId in range(1, args['exports'] + 1)]
+    results['group export'] = run_scenario('group export', mockArguments,
+        ['export-group-data.py', '--start', '2019-11-01 00:00:00', '--end', '2019-11-02 00:00:00', '--groupId'] + groupIds + exportArguments, workFolderPath)
+    importFilePath = os.path.join(workFolderPath, 'benchmark-import.csv')
+    write_import_file(importFilePath, args['points'])
+    results['import'] = run_scenario('import', mockArguments,
+        ['import-general-time-series.py', '--apikey', 'benchmark', '--file', importFilePath, '--workers', str(args['workers'])], workFolderPath)
+
+print_results(results)
+if args['output'] is not None:
+    with open(args['output'], 'w') as outputFile:
+        json.dump(results, outputFile, indent = 2)
+if args['baseline'] is not None:
+    with open(args['baseline'], 'r') as baselineFile:
+        regressions = compare_results(results, json.load(baselineFile), args['tolerance'])
+    if regressions:
+        print(f'** {len(regressions)} metric(s) regressed by more than {args["tolerance"]:.0%}: **')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
+    print(f'** No metric regressed by more than {args["tolerance"]:.0%}. **')
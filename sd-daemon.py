@@ -0,0 +1,262 @@
+# Runs exports and imports from a durable job queue (refer to job_queue.py) in one long-running
+# process, instead of starting export-account-data.py, export-group-data.py or
+# import-general-time-series.py for every scheduled run. Imports run inside the daemon through
+# import_pipeline.py. The daemon keeps its connections to the web API open between jobs, and shares
+# them between exports and imports, and because the id of every submitted export is stored in the queue, a
+# daemon that is stopped and started again resumes polling the exports that were already running on
+# the server instead of submitting them again.
+#
+# Jobs are added to the queue with the enqueue commands, which can be run at any time, including
+# while the daemon is running:
+#
+#   python sd-daemon.py enqueue-export --type indicator --start "2019-11-19 00:00:00" --end "2019-11-20 00:00:00"
+#   python sd-daemon.py enqueue-export --type burst --groupId GROUP_ID --start "2019-11-19 00:00:00"
+#   python sd-daemon.py enqueue-import --file historian-extract.csv --import-options="--gzip --workers 8"
+#   python sd-daemon.py run --apikey ACCOUNT_API_KEY
+#   python sd-daemon.py status
+
+from urllib.error import HTTPError
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import http.client
+import os
+import shlex
+import time
+import export_common
+import import_pipeline
+import job_queue
+import pipeline_metrics
+import sd_client
+
+# Runs the jobs in the queue until the daemon is stopped (e.g. with Ctrl+C). Up to maxConcurrent
+# exports are in progress on the server at once, and their files are downloaded in the background
+# while the remaining exports keep running. Imports are run one at a time in the background, next to
+# the exports, with the same apiClient. Stopping the daemon waits for the running import to finish.
+#  - pollSeconds: How often the queue is checked for new jobs.
+def run_daemon(jobQueue, apiClient, maxConcurrent, downloadConnections, pollSeconds):
+    jobQueue.reset_interrupted_jobs()
+    poller = sd_client.ExportStatusPoller(apiClient)
+    # Maps the id of each export that is in progress on the server to its job.
+    exportJobs = {}
+    for job in jobQueue.get_jobs('submitted', 'export'):
+        print(f'** Resuming export job {job["id"]} (export {job["exportId"]}) **')
+        exportJobs[job['exportId']] = job
+        poller.track(job['exportId'], job['params']['exportType'])
+    importRun = None
+
+    with ThreadPoolExecutor(max_workers = maxConcurrent) as downloadExecutor, ThreadPoolExecutor(max_workers = 1) as importExecutor:
+        while True:
+            try:
+                submit_pending_exports(jobQueue, apiClient, poller, exportJobs, maxConcurrent - len(exportJobs))
+                importRun = run_next_import(jobQueue, apiClient, importExecutor, importRun)
+                completedExport = poller.wait_for_next_completion(pollSeconds)
+            except (http.client.HTTPException, OSError) as err:
+                if isinstance(err, HTTPError) and err.code == 401:
+                    raise
+                # The queue keeps every job's state, so nothing is lost by trying again later.
+                print(f'** Request to the web API failed ({err}), retrying in {pollSeconds} seconds... **')
+                time.sleep(pollSeconds)
+                continue
+            if completedExport is None:
+                if not exportJobs:
+                    time.sleep(pollSeconds)
+                continue
+            exportId, exportStatusResult = completedExport
+            job = exportJobs.pop(exportId)
+            jobQueue.update(job['id'], 'downloading')
+            downloadExecutor.submit(download_export_job, jobQueue, apiClient, job, exportStatusResult, downloadConnections)
+
+# Submits pending export jobs until count exports have been submitted or no jobs are left. The
+# export id of each job is stored in the queue before the export is tracked.
+def submit_pending_exports(jobQueue, apiClient, poller, exportJobs, count):
+    if count <= 0:
+        return
+    for job in jobQueue.get_jobs('pending', 'export', count):
+        params = job['params']
+        try:
+            exportId = apiClient.submit_export(sd_client.get_export_request(params['exportType'], params['startMillis'], params['endMillis'], params['groupId']))
+        except HTTPError as err:
+            if err.code == 404:
+                print(f'** No data exists for export job {job["id"]}. **')
+                jobQueue.update(job['id'], 'done', result = 'no data for the time frame')
+            elif err.code == 401:
+                raise
+            else:
+                print(f'** Export job {job["id"]} could not be started: {err} **')
+                jobQueue.update(job['id'], 'failed', result = f'could not be started ({err})')
+            continue
+        jobQueue.update(job['id'], 'submitted', exportId = exportId)
+        print(f'** Export job {job["id"]} submitted (export {exportId}) **')
+        job['exportId'] = exportId
+        exportJobs[exportId] = job
+        poller.track(exportId, params['exportType'])
+
+# Downloads the file of a completed export and records the result in the queue.
+def download_export_job(jobQueue, apiClient, job, exportStatusResult, downloadConnections):
+    params = job['params']
+    if 'downloadUrl' not in exportStatusResult:
+        if exportStatusResult['error'] == 'No data to export.':
+            print(f'** Export job {job["id"]} completed with an empty data set. **')
+            jobQueue.update(job['id'], 'done', result = 'no data to export')
+        else:
+            print(f'** Export job {job["id"]} failed: "{exportStatusResult["error"]}" **')
+            jobQueue.update(job['id'], 'failed', result = exportStatusResult['error'])
+        return
+    exportFilePath = export_common.get_export_file_path(params['folder'], params['startMillis'], params['endMillis'], params['exportType'])
+    try:
+        os.makedirs(params['folder'], exist_ok = True)
+        apiClient.download_export_file(exportStatusResult['downloadUrl'], exportFilePath, downloadConnections)
+    except (http.client.HTTPException, OSError) as err:
+        print(f'** The file of export job {job["id"]} could not be downloaded: {err} **')
+        jobQueue.update(job['id'], 'failed', result = f'download failed ({err})')
+        return
+    print(f'** Export job {job["id"]} downloaded to {exportFilePath} **')
+    jobQueue.update(job['id'], 'done', result = exportFilePath)
+
+# Checks on the import that is running, and starts the next pending import once it has finished.
+# Returns the running import as a (job, future) tuple, or None if no import is running.
+def run_next_import(jobQueue, apiClient, importExecutor, importRun):
+    if importRun is not None:
+        job, importFuture = importRun
+        if not importFuture.done():
+            return importRun
+        try:
+            importedPointCount, failedPointCount = importFuture.result()
+        except Exception as err:
+            if isinstance(err, HTTPError) and err.code == 401:
+                raise
+            print(f'** Import job {job["id"]} failed: {err} **')
+            jobQueue.update(job['id'], 'failed', result = str(err))
+        else:
+            result = f'imported {importedPointCount} data points'
+            if failedPointCount > 0:
+                result += f', {failedPointCount} failed (saved to {parse_import_options(job["params"])["dead_letter"]})'
+            print(f'** Import job {job["id"]} finished: {result} **')
+            jobQueue.update(job['id'], 'done', result = result)
+    jobs = jobQueue.get_jobs('pending', 'import', 1)
+    if not jobs:
+        return None
+    job = jobs[0]
+    jobQueue.update(job['id'], 'running')
+    print(f'** Starting import job {job["id"]} ({job["params"]["file"]}) **')
+    return (job, importExecutor.submit(import_pipeline.run_import, apiClient, parse_import_options(job['params'])))
+
+# Returns the options of an import job, parsed the same way as the command line of
+# import-general-time-series.py (refer to import_pipeline.add_import_arguments).
+def parse_import_options(params):
+    importParser = argparse.ArgumentParser(prog = 'sd-daemon.py enqueue-import --import-options')
+    import_pipeline.add_import_arguments(importParser)
+    importArgs = vars(importParser.parse_args(['--file', params['file']] + params['options']))
+    # Relative paths (e.g. of the dead letter file) are relative to the folder that the job was
+    # enqueued from, the same as when the import script is run from that folder.
+    importArgs['file'] = os.path.join(params['folder'], importArgs['file'])
+    importArgs['dead_letter'] = os.path.join(params['folder'], importArgs['dead_letter'])
+    return importArgs
+
+# Prints every job in the queue.
+def print_jobs(jobQueue):
+    jobs = jobQueue.get_all_jobs()
+    if not jobs:
+        print('** The job queue is empty. **')
+    for job in jobs:
+        params = job['params']
+        if job['kind'] == 'export':
+            scope = 'account' if params['groupId'] is None else f'group {params["groupId"]}'
+            description = f'{params["exportType"]} export of {scope} between "{export_common.get_filename_friendly_date(params["startMillis"])}" and "{export_common.get_filename_friendly_date(params["endMillis"])}"'
+        else:
+            description = f'import of {params["file"]}'
+        updatedAt = datetime.fromtimestamp(job['updatedAt']).strftime('%Y-%m-%d %H:%M:%S')
+        print(f'  {job["id"]}: {job["state"]} ({updatedAt}) - {description}' + (f': {job["result"]}' if job['result'] else ''))
+
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument('--queue', required = False, default = 'sd-jobs.sqlite',
+   help = 'The SQLite file that holds the job queue. Defaults to "sd-jobs.sqlite".')
+commands = ap.add_subparsers(dest = 'command', required = True)
+
+exportCommand = commands.add_parser('enqueue-export', help = 'Adds an export job to the queue.')
+exportCommand.add_argument('-t', '--type', required = True, choices = ['indicator', 'burst'],
+   help = 'The type of data to export.')
+exportCommand.add_argument('-s', '--start', required = True,
+   help = 'The start date/time of the export range in the format "YYYY-MM-DD HH:mm:ss" (e.g. "2018-09-25 00:00:00").')
+exportCommand.add_argument('-e', '--end', required = False,
+   help = 'The end date/time of the export range in the format "YYYY-MM-DD HH:mm:ss". Defaults to the current date/time if omitted.')
+exportCommand.add_argument('-g', '--groupId', required = False,
+   help = 'The Group ID containing the data to be exported. Exports the whole account if omitted.')
+exportCommand.add_argument('--folder', required = False, default = '.',
+   help = 'The folder to download the export file to. Defaults to the current folder.')
+
+importCommand = commands.add_parser('enqueue-import', help = 'Adds an import job to the queue.')
+importCommand.add_argument('-f', '--file', required = True,
+   help = 'The CSV or Parquet file to import.')
+importCommand.add_argument('--import-options', required = False, default = '',
+   help = 'Other options of the import, as for import-general-time-series.py, e.g. "--gzip --workers 8". The API key, timeout, rate and metrics options of the daemon are used.')
+
+runCommand = commands.add_parser('run', help = 'Runs the queued jobs until stopped.')
+runCommand.add_argument('-a', '--apikey', required = True,
+   help = 'Your account API Key.')
+runCommand.add_argument('--max-concurrent', required = False, type = int, default = 4,
+   help = 'The maximum number of exports that are in progress on the server at once. Defaults to 4.')
+runCommand.add_argument('--download-connections', required = False, type = int, default = 1,
+   help = 'The number of parallel connections used to download each export file. Defaults to 1.')
+runCommand.add_argument('--poll-seconds', required = False, type = float, default = 5,
+   help = 'How often the queue is checked for new jobs, in seconds. Defaults to 5.')
+runCommand.add_argument('--timeout', required = False, type = float, default = 60,
+   help = 'The number of seconds to wait for the web API to respond before a request fails. Defaults to 60.')
+runCommand.add_argument('--max-requests-per-second', required = False, type = float, default = 10,
+   help = 'The maximum rate of requests to the web API. Defaults to 10.')
+runCommand.add_argument('--metrics-file', required = False,
+   help = 'A file to append the timing, size and retry count of every export stage to, as JSON lines.')
+runCommand.add_argument('--prometheus-file', required = False,
+   help = 'A file to write the totals of every export stage to when the daemon stops, in the Prometheus text format.')
+
+statusCommand = commands.add_parser('status', help = 'Lists the jobs in the queue.')
+
+retryCommand = commands.add_parser('retry', help = 'Moves failed jobs back to the queue.')
+retryCommand.add_argument('jobId', nargs = '?', type = int,
+   help = 'The id of the failed job to retry. Retries every failed job if omitted.')
+args = vars(ap.parse_args())
+
+jobQueue = job_queue.JobQueue(args['queue'])
+
+if args['command'] == 'enqueue-export':
+    startMillis = export_common.datetime_string_to_millis(args['start'])
+    endMillis = export_common.get_current_millis()
+    if args['end'] is not None:
+        endMillis = export_common.datetime_string_to_millis(args['end'])
+    jobId = jobQueue.enqueue('export', { 'exportType': args['type'], 'groupId': args['groupId'], 'startMillis': startMillis,
+        'endMillis': endMillis, 'folder': os.path.abspath(args['folder']) })
+    print(f'** Added export job {jobId} to the queue. **')
+elif args['command'] == 'enqueue-import':
+    importParams = { 'file': os.path.abspath(args['file']), 'options': shlex.split(args['import_options']),
+        'folder': os.path.abspath('.') }
+    # Check the options now, rather than when the daemon runs the job.
+    importArgumentsError = import_pipeline.get_import_arguments_error(parse_import_options(importParams))
+    if importArgumentsError is not None:
+        importCommand.error(importArgumentsError)
+    jobId = jobQueue.enqueue('import', importParams)
+    print(f'** Added import job {jobId} to the queue. **')
+elif args['command'] == 'status':
+    print_jobs(jobQueue)
+elif args['command'] == 'retry':
+    print(f'** Moved {jobQueue.retry_failed(args["jobId"])} failed job(s) back to the queue. **')
+else:
+    if args['max_concurrent'] < 1:
+        ap.error('--max-concurrent must be at least 1.')
+    pipelineMetrics = pipeline_metrics.MetricsRecorder(args['metrics_file'], args['prometheus_file'])
+    apiClient = sd_client.SmartDiagnosticsClient(args['apikey'], args['timeout'], args['max_requests_per_second'], pipelineMetrics)
+    print(f'** Running the jobs in {args["queue"]}. Press Ctrl+C to stop; unfinished jobs resume on the next run. **')
+    try:
+        run_daemon(jobQueue, apiClient, args['max_concurrent'], args['download_connections'], args['poll_seconds'])
+    except KeyboardInterrupt:
+        print('** Stopping. **')
+    except HTTPError as err:
+        if err.code != 401:
+            raise
+        print(f'** The specified API key is invalid. **')
+    apiClient.close()
+    pipelineMetrics.close()
+
+jobQueue.close()
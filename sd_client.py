@@ -0,0 +1,623 @@
+# Client for the SmartDiagnostics web API, shared by export-account-data.py, export-group-data.py
+# and import-general-time-series.py. A SmartDiagnosticsClient wraps everything the scripts send to
+# the API:
+#  - Export requests (account and group, indicator and burst data), export status requests and
+#    downloads of export files, with retries of throttled and failed requests.
+#  - General time series import requests.
+#
+# All requests go through one ConnectionPool, which keeps the connections to each host open
+# (keep-alive) and reuses them for later requests instead of opening a new connection, and a new
+# TLS session, per request. Responses of the API are requested gzip compressed, and every request is
+# paced by the client's ApiGate (refer to rate_limiter.py).
+
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import http.client
+import json
+import os
+import threading
+import time
+import zipfile
+import zlib
+import pipeline_metrics
+import rate_limiter
+
+# Base URL of the SmartDiagnostics web API. Set the SD_API_BASE_URL environment variable to use a
+# different server, such as the local mock server in mock-sd-server.py.
+apiBaseUrl = os.environ.get('SD_API_BASE_URL', 'https://sd.kcftech.com').rstrip('/')
+
+# Size of each chunk that is read from the network and written to disk while downloading.
+downloadChunkBytes = 8 * 1024 * 1024
+# Number of times a byte range is requested again after the connection fails before giving up.
+downloadRetries = 5
+# Number of times a downloaded zip archive that fails verification is downloaded again from the
+# start before giving up.
+verifyRetries = 1
+
+# Returns the path of the export endpoint for a type of data ('indicator' or 'burst'), either for
+# the whole account or, if groupId is given, for one group.
+def get_export_endpoint_path(exportType, groupId = None):
+    dataPath = 'indicatorData' if exportType == 'indicator' else 'burstData'
+    if groupId is None:
+        return f'/public/exports/{dataPath}'
+    return f'/public/exports/group/{groupId}/{dataPath}'
+
+# Returns the export endpoint and the request data of a burst data export, as a tuple.
+#  - startMillis: Indicates the start date, represented as milliseconds from the unix epoch,
+#                 within which export data will be included.
+#  - endMillis: Indicates the end date, represented as milliseconds from the unix epoch,
+#                 within which export data will be included.
+#  - groupId: The group to include in the export, or None to export the whole account.
+def get_burst_export_request(startMillis, endMillis, groupId = None):
+    requestData = {
+        "StartTime": startMillis,
+        "EndTime": endMillis,
+        # Number of chronological burst samples, starting from earliest date, to include in the export
+        # within the specified time range. If set to 0, all samples in the time range are included.
+        "SampleSize": 0,
+        # Set to True to include the node id and the sensor type in the first two columns, respectively,
+        # of the exported data set files.
+        "EmbedMetadata": False
+    }
+    if groupId is None:
+        # Specific node serial numbers for which export data will be included in the export. If this is
+        # empty, the export will include all nodes for the account associated with the API key.
+        requestData["NodeSerialNumbers"] = []
+
+    return (get_export_endpoint_path('burst', groupId), requestData)
+
+# Returns the export endpoint and the request data of an indicator data export, as a tuple. Refer to
+# get_burst_export_request for a description of the parameters.
+def get_indicator_export_request(startMillis, endMillis, groupId = None):
+    requestData = {
+        "StartTime": startMillis,
+        "EndTime": endMillis,
+        # Set to True to include the parent group hierarchy ids and names in the first two columns
+        # of the exported data set files. Default value is False.
+        "EmbedMetadata": False,
+        # Specific indicator types that should be either included or excluded from the exported data
+        # set files. If not specified, all indicator types are included. Valid types are:
+        #
+        #   "Voltage","DamageAccumulationAccel","Temperature","VibrationOverallCrestFactorAccel",
+        #   "VibrationOverallPeakAccel","VibrationOverallRmsAccel","VibrationBandMax","VibrationOverall",
+        #   "VibrationOverallPeak","VibrationOverallRms","RunningSpeed","SignalStrength","Pressure",
+        #   "Flow","Humidity","Power","DifferentialPressure","GeneralizedAtoD","VibrationBandRms",
+        #   "VibrationOverallSkewness","VibrationOverallKurtosis","VibrationOverallCrestFactor",
+        #   "DamageAccumulation","VibrationBandRmsAccel","VibrationBandMaxAccel",
+        #   "VibrationOverallSkewnessAccel", "VibrationOverallKurtosisAccel","VibrationOverallAccel",
+        #   "GeneralTimeSeries","Math","OnStatistics", "OffStatistics","AlarmStatistics",
+        #   "WarningStatistics","PositivePeakPressure","NegativePeakPressure", "RmsPressure",
+        #   "BandPressure","OnPercentStatistics","OffPercentStatistics","AlarmPercentStatistics",
+        #   "WarningPercentStatistics","DamageAccumulationPressure","OilHumidity","OilTemperature",
+        #   "DamageAccumulationAccelRaw","MultiSensorDifferentialPressure","Group"
+        "FilteredIndicatorTypes": [],
+        # If True, the indicator types specified in the FilteredIndicatorTypes property will be excluded
+        # from the exported data. If False (default), the types will be included in the exported data.
+        "FilterExclude": False
+    }
+    if groupId is None:
+        # Specific indicator ids for which data will be included in the export. If this is empty (default),
+        # the request will include all indicators for the account associated with the API key.
+        requestData["IndicatorIds"] = []
+
+    return (get_export_endpoint_path('indicator', groupId), requestData)
+
+# Returns the export request of a type of data ('indicator' or 'burst').
+def get_export_request(exportType, startMillis, endMillis, groupId = None):
+    getExportRequest = get_indicator_export_request if exportType == 'indicator' else get_burst_export_request
+    return getExportRequest(startMillis, endMillis, groupId)
+
+class SmartDiagnosticsClient:
+    # Number of times an export request is sent again after it is throttled or fails with a server
+    # error.
+    submitRetries = 5
+
+    #  - apiKey: The api key for the account.
+    #  - timeoutSeconds: How long to wait for the server to accept a connection or send data before
+    #                    a request fails.
+    #  - maxRequestsPerSecond: The highest rate of requests to the web API (refer to
+    #                          rate_limiter.ApiGate). Downloads of export files are not paced.
+    #  - metrics: The pipeline_metrics.MetricsRecorder that the export stages are recorded with.
+    def __init__(self, apiKey, timeoutSeconds = 60, maxRequestsPerSecond = 10, metrics = None):
+        self.apiKey = apiKey
+        self.pool = ConnectionPool(timeoutSeconds)
+        self.apiGate = rate_limiter.ApiGate(maxRequestsPerSecond)
+        self.metrics = metrics if metrics is not None else pipeline_metrics.MetricsRecorder()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exceptionInfo):
+        self.close()
+
+    # Closes every open connection.
+    def close(self):
+        self.pool.close()
+
+    # Sends a request to the web API and returns the response, whose body has already been read.
+    # The outcome of the request is reported to the ApiGate, but the status of the response is not
+    # checked.
+    #  - path: The path of the endpoint, without the apiKey query parameter.
+    def send_api_request(self, method, path, body = None, headers = {}):
+        headers = dict(headers, **{ 'Accept-Encoding': 'gzip' })
+        self.apiGate.acquire()
+        try:
+            with self.pool.open(method, f'{apiBaseUrl}{path}?apiKey={self.apiKey}', body, headers) as httpResponse:
+                httpResponse.read_body()
+        except (http.client.HTTPException, OSError):
+            self.apiGate.report_failure()
+            raise
+        self.apiGate.report_status(httpResponse.status, httpResponse.headers.get('Retry-After'))
+        return httpResponse
+
+    # Submits a burst data export of the whole account and returns the id of the new export. Refer
+    # to get_burst_export_request for a description of the parameters.
+    def submit_account_burst_export(self, startMillis, endMillis):
+        return self.submit_export(get_burst_export_request(startMillis, endMillis))
+
+    # Submits an indicator data export of the whole account and returns the id of the new export.
+    # Refer to get_indicator_export_request for a description of the parameters.
+    def submit_account_indicator_export(self, startMillis, endMillis):
+        return self.submit_export(get_indicator_export_request(startMillis, endMillis))
+
+    # Submits a burst data export of a group and returns the id of the new export. Refer to
+    # get_burst_export_request for a description of the parameters.
+    def submit_group_burst_export(self, groupId, startMillis, endMillis):
+        return self.submit_export(get_burst_export_request(startMillis, endMillis, groupId))
+
+    # Submits an indicator data export of a group and returns the id of the new export. Refer to
+    # get_indicator_export_request for a description of the parameters.
+    def submit_group_indicator_export(self, groupId, startMillis, endMillis):
+        return self.submit_export(get_indicator_export_request(startMillis, endMillis, groupId))
+
+    # Submits an export request to the web API and returns the id of the new export.
+    #  - exportRequest: A tuple with the path of the export endpoint and the request data.
+    def submit_export(self, exportRequest):
+        endpointPath, requestData = exportRequest
+        startTime = time.monotonic()
+        # Convert the requestData dictionary to a JSON string that is represented as an array of bytes
+        # that is suitable for sending in this http request.
+        body = json.dumps(requestData).encode('utf-8')
+        headers = { 'content-type': 'application/json', 'Accept': 'application/json' }
+        for attempt in range(self.submitRetries + 1):
+            try:
+                httpResponse = self.send_api_request('POST', endpointPath, body, headers)
+            except (http.client.HTTPException, OSError) as err:
+                if attempt == self.submitRetries:
+                    raise
+                print(f'Export request failed ({err}), retrying...')
+                continue
+            if httpResponse.status < 300:
+                break
+            err = get_http_error(f'{apiBaseUrl}{endpointPath}', httpResponse)
+            if (httpResponse.status != 429 and httpResponse.status < 500) or attempt == self.submitRetries:
+                raise err
+            print(f'Export request failed ({err}), retrying...')
+        # Read the export id from the http response.
+        exportId = httpResponse.body.decode('UTF-8').strip('"')
+        self.metrics.record('submit', time.monotonic() - startTime, len(body), attempt, exportId = exportId,
+            exportType = 'indicator' if endpointPath.endswith('indicatorData') else 'burst', endpoint = endpointPath)
+        return exportId
+
+    # Returns an object that describes the current status of a given export.
+    # This object structure is:
+    #
+    #  {
+    #    "downloadUrl": "String",
+    #    "exportCompleted": Boolean,
+    #    "reportsProgress": Boolean,
+    #    "progress": Integer,
+    #    "error": "String"
+    #  }
+    def get_export_status(self, exportId):
+        path = f'/public/exports/{exportId}/status'
+        httpResponse = self.send_api_request('GET', path, headers = { 'content-type': 'application/json', 'Accept': 'application/json' })
+        if httpResponse.status != 200:
+            raise get_http_error(f'{apiBaseUrl}{path}', httpResponse)
+        # Convert and return the export status JSON string as an object.
+        return json.loads(httpResponse.body.decode('UTF-8'))
+
+    # Polls the export status API until the export has completed. Once the export has completed,
+    # this method returns an object describing whether the final state of the export process. Refer
+    # to get_export_status for the definition of this object.
+    # exportType ('indicator' or 'burst') is only used to label the recorded metrics.
+    def wait_for_export_completion(self, exportId, exportType = ''):
+        poller = ExportStatusPoller(self)
+        poller.track(exportId, exportType)
+        completedExportId, exportStatusResult = poller.wait_for_next_completion()
+        return exportStatusResult
+
+    # Posts the JSON body of a general time series import request and returns the response, without
+    # retrying it. Refer to ImportPipeline in import_pipeline.py.
+    def post_import(self, body, headers):
+        return self.send_api_request('POST', '/public/imports', body, headers)
+
+    # Streams the file at url to localFilePath. The data is written to a temporary '.part' file that
+    # is renamed to localFilePath only once the download has completed, so localFilePath never holds
+    # a partially written file. If the server supports HTTP range requests, a dropped connection is
+    # resumed from the last byte received instead of from the start of the file, and the file can be
+    # split into downloadConnections byte ranges that are downloaded in parallel. Before the rename, a
+    # zip archive is checked with verify_zip_file, and downloaded again if it is damaged.
+    def download_export_file(self, url, localFilePath, downloadConnections = 1):
+        startTime = time.monotonic()
+        partFilePath = localFilePath + '.part'
+        exportType = 'burst' if localFilePath.endswith('_burst.zip') else 'indicator'
+        totalBytes = self.get_ranged_download_size(url)
+        progress = DownloadProgress(localFilePath, totalBytes)
+
+        for attempt in range(verifyRetries + 1):
+            self.download_part_file(url, partFilePath, totalBytes, downloadConnections, progress)
+            if not localFilePath.lower().endswith('.zip'):
+                break
+            verifyStartTime = time.monotonic()
+            try:
+                verify_zip_file(partFilePath)
+                break
+            except CorruptDownloadError as err:
+                if attempt == verifyRetries:
+                    os.remove(partFilePath)
+                    raise
+                print(f'** {err} Downloading it again... **')
+                progress.restart()
+            finally:
+                self.metrics.record('verify', time.monotonic() - verifyStartTime, progress.receivedBytes, exportType = exportType, file = localFilePath)
+
+        os.replace(partFilePath, localFilePath)
+        self.metrics.record('download', time.monotonic() - startTime, progress.receivedBytes, progress.retryCount,
+            exportType = exportType, file = localFilePath, connections = downloadConnections)
+
+    # Downloads the whole file at url into partFilePath, in downloadConnections byte ranges if the
+    # server supports range requests (totalBytes is not None).
+    def download_part_file(self, url, partFilePath, totalBytes, downloadConnections, progress):
+        if totalBytes is None:
+            # The server does not support range requests, so the file can only be streamed in one piece.
+            self.download_byte_range(url, partFilePath, None, progress)
+        else:
+            # Preallocate the file so that each byte range can be written in place.
+            with open(partFilePath, 'wb') as partFile:
+                partFile.truncate(totalBytes)
+            rangeBytes = -(-totalBytes // max(downloadConnections, 1))
+            byteRanges = [(firstByte, min(firstByte + rangeBytes, totalBytes) - 1) for firstByte in range(0, totalBytes, rangeBytes)]
+            if len(byteRanges) == 1:
+                self.download_byte_range(url, partFilePath, byteRanges[0], progress)
+            else:
+                with ThreadPoolExecutor(max_workers = len(byteRanges)) as rangeExecutor:
+                    rangeResults = [rangeExecutor.submit(self.download_byte_range, url, partFilePath, byteRange, progress) for byteRange in byteRanges]
+                    for rangeResult in rangeResults:
+                        rangeResult.result()
+
+    # Returns the size in bytes of the file at url if the server supports HTTP range requests for it,
+    # or None if it does not.
+    def get_ranged_download_size(self, url):
+        with self.pool.open('GET', url, headers = { 'Range': 'bytes=0-0' }) as httpResponse:
+            if httpResponse.status >= 400:
+                raise get_http_error(url, httpResponse)
+            # A server that ignores the Range header answers with the whole file, which is closed
+            # unread instead of being downloaded here.
+            if httpResponse.status != 206:
+                return None
+            httpResponse.read_body()
+            contentRange = httpResponse.headers.get('Content-Range')
+            if contentRange is None:
+                return None
+            # The Content-Range header has the format "bytes 0-0/<total size>".
+            totalBytes = contentRange.rpartition('/')[2]
+            return int(totalBytes) if totalBytes.isdigit() else None
+
+    # Downloads one byte range of the file at url into partFilePath, in chunks of downloadChunkBytes.
+    # byteRange is a tuple with the first and last byte (inclusive) of the range, or None to download
+    # the whole file without range requests. After a connection failure the request is sent again,
+    # asking only for the bytes that have not been received yet.
+    def download_byte_range(self, url, partFilePath, byteRange, progress):
+        receivedBytes = 0
+        for attempt in range(downloadRetries + 1):
+            headers = {}
+            if byteRange is not None:
+                headers['Range'] = f'bytes={byteRange[0] + receivedBytes}-{byteRange[1]}'
+            elif receivedBytes > 0:
+                # Without range support the download has to start over from the first byte.
+                progress.add(-receivedBytes)
+                receivedBytes = 0
+            try:
+                with self.pool.open('GET', url, headers = headers) as httpResponse:
+                    if httpResponse.status >= 400:
+                        raise get_http_error(url, httpResponse)
+                    with open(partFilePath, 'r+b' if byteRange is not None else 'wb') as partFile:
+                        if byteRange is not None:
+                            if httpResponse.status != 206:
+                                raise http.client.HTTPException(f'Expected a partial response for bytes {headers["Range"]} but got status {httpResponse.status}')
+                            expectedBytes = byteRange[1] - byteRange[0] + 1
+                            partFile.seek(byteRange[0] + receivedBytes)
+                        else:
+                            contentLength = httpResponse.headers.get('Content-Length')
+                            expectedBytes = int(contentLength) if contentLength is not None else None
+                        while True:
+                            chunk = httpResponse.read(downloadChunkBytes)
+                            if not chunk:
+                                break
+                            partFile.write(chunk)
+                            receivedBytes += len(chunk)
+                            progress.add(len(chunk))
+                # A connection that is closed early can look like the end of the response, so check that
+                # every expected byte has actually been received.
+                if expectedBytes is None or receivedBytes >= expectedBytes:
+                    return
+                raise http.client.IncompleteRead(b'', expectedBytes - receivedBytes)
+            except (http.client.HTTPException, OSError) as err:
+                if isinstance(err, HTTPError) and err.code < 500 or attempt == downloadRetries:
+                    raise
+                print(f'Download interrupted ({err}), resuming...')
+                progress.add_retry()
+                time.sleep(2 ** attempt)
+
+# Raised when a downloaded file is not a valid zip archive. It is an OSError so that the scripts
+# handle it like any other failed download.
+class CorruptDownloadError(OSError):
+    pass
+
+# Checks the zip archive at filePath by reading every file in it to the end, which makes zipfile
+# compare the CRC-32 checksum of each file with the one stored in the archive. The files are read a
+# chunk of downloadChunkBytes at a time, so the memory used does not depend on the size of the
+# archive. Raises CorruptDownloadError if the archive is damaged.
+def verify_zip_file(filePath):
+    try:
+        with zipfile.ZipFile(filePath) as zipFile:
+            for memberInfo in zipFile.infolist():
+                with zipFile.open(memberInfo) as memberFile:
+                    while memberFile.read(downloadChunkBytes):
+                        pass
+    except (zipfile.BadZipFile, EOFError, zlib.error) as err:
+        raise CorruptDownloadError(f'The downloaded file {filePath} is not a valid zip archive ({err}).')
+
+# Returns an HTTPError for a response with an error status, which the scripts handle the same way as
+# errors raised by urllib.
+def get_http_error(url, httpResponse):
+    return HTTPError(url, httpResponse.status, httpResponse.reason, httpResponse.headers, None)
+
+# Keeps idle connections to each host open so that later requests can reuse them. Connections are
+# taken from the pool for one request at a time, so the pool can be shared by any number of threads;
+# a new connection is opened whenever no idle one is available.
+class ConnectionPool:
+    # Idle connections kept open per host. Connections returned while this many are idle are closed.
+    maxIdlePerHost = 16
+
+    def __init__(self, timeoutSeconds):
+        self.timeoutSeconds = timeoutSeconds
+        self.lock = threading.Lock()
+        # Maps each (scheme, host) pair to a list of its idle connections.
+        self.idleConnections = {}
+
+    # Closes every idle connection. Connections that are in use are closed when they are returned.
+    def close(self):
+        with self.lock:
+            for connections in self.idleConnections.values():
+                for connection in connections:
+                    connection.close()
+            self.idleConnections = {}
+
+    # Sends a request to url and returns a PooledResponse once the response headers have been read.
+    # A reused connection may have been closed by the server while it was idle, in which case the
+    # request is sent once more over a new connection.
+    def open(self, method, url, body = None, headers = {}):
+        splitUrl = urlsplit(url)
+        host = (splitUrl.scheme, splitUrl.netloc)
+        path = splitUrl.path + ('?' + splitUrl.query if splitUrl.query else '')
+        while True:
+            connection, reused = self.take_connection(host)
+            try:
+                connection.request(method, path, body = body, headers = headers)
+                return PooledResponse(self, host, connection, connection.getresponse())
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                if not reused:
+                    raise
+            except Exception:
+                connection.close()
+                raise
+
+    # Returns a tuple with an idle connection to host, or a new one, and whether it was idle.
+    def take_connection(self, host):
+        with self.lock:
+            connections = self.idleConnections.get(host)
+            if connections:
+                return (connections.pop(), True)
+        scheme, netloc = host
+        if scheme == 'http':
+            return (http.client.HTTPConnection(netloc, timeout = self.timeoutSeconds), False)
+        return (http.client.HTTPSConnection(netloc, timeout = self.timeoutSeconds), False)
+
+    # Returns a connection whose response has been read completely to the pool.
+    def return_connection(self, host, connection):
+        with self.lock:
+            connections = self.idleConnections.setdefault(host, [])
+            if len(connections) < self.maxIdlePerHost:
+                connections.append(connection)
+                return
+        connection.close()
+
+# A response to a request sent through a ConnectionPool. The connection goes back to the pool when
+# the response is closed after its body has been read completely; otherwise it is closed.
+class PooledResponse:
+    def __init__(self, pool, host, connection, httpResponse):
+        self.pool = pool
+        self.host = host
+        self.connection = connection
+        self.httpResponse = httpResponse
+        self.status = httpResponse.status
+        self.reason = httpResponse.reason
+        self.headers = httpResponse.headers
+        # The decoded body, once read with read_body.
+        self.body = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exceptionInfo):
+        self.close()
+
+    def read(self, byteCount = None):
+        return self.httpResponse.read(byteCount)
+
+    # Reads the whole body of the response, decompressing it if the server sent it gzip compressed.
+    def read_body(self):
+        self.body = self.httpResponse.read()
+        if self.headers.get('Content-Encoding') == 'gzip':
+            self.body = gzip.decompress(self.body)
+        return self.body
+
+    def close(self):
+        if self.connection is None:
+            return
+        if self.httpResponse.isclosed() and not self.httpResponse.will_close:
+            self.pool.return_connection(self.host, self.connection)
+        else:
+            self.connection.close()
+        self.connection = None
+
+# Tracks the status of any number of in-progress exports from a single polling loop. Each export is
+# polled on its own schedule: exports that report progress are polled again around the time they
+# are expected to finish based on their progress so far, and exports that do not report progress
+# are polled with an exponential backoff.
+class ExportStatusPoller:
+    # Bounds for the time between two status requests for the same export, in seconds.
+    minPollSeconds = 1
+    maxPollSeconds = 30
+    backoffFactor = 1.5
+
+    def __init__(self, apiClient):
+        self.apiClient = apiClient
+        # Maps the id of each tracked export to its polling schedule.
+        self.exports = {}
+
+    # Starts tracking the status of the given export. The first status request is sent right away.
+    # exportType ('indicator' or 'burst') is only used to label the recorded metrics.
+    def track(self, exportId, exportType = ''):
+        now = time.monotonic()
+        self.exports[exportId] = { 'trackedAt': now, 'nextPollAt': now, 'interval': self.minPollSeconds,
+            'exportType': exportType, 'pollCount': 0, 'lastIdlePollAt': now, 'startedAt': None }
+
+    # Returns the number of tracked exports that have not completed yet.
+    def pending_count(self):
+        return len(self.exports)
+
+    # Blocks until one of the tracked exports has completed, and returns a tuple with its export id
+    # and final status result. The completed export is no longer tracked. Returns None if no exports
+    # are being tracked, or if maxWaitSeconds is given and no export completed within that time.
+    def wait_for_next_completion(self, maxWaitSeconds = None):
+        deadline = None if maxWaitSeconds is None else time.monotonic() + maxWaitSeconds
+        while self.exports:
+            # Poll whichever export is due next.
+            exportId = min(self.exports, key = lambda trackedExportId: self.exports[trackedExportId]['nextPollAt'])
+            schedule = self.exports[exportId]
+            if deadline is not None and schedule['nextPollAt'] > deadline:
+                time.sleep(max(deadline - time.monotonic(), 0))
+                return None
+            delay = schedule['nextPollAt'] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            try:
+                exportStatusResult = self.apiClient.get_export_status(exportId)
+            except HTTPError as err:
+                if err.code == 404:
+                    # The export no longer exists on the server, e.g. because it expired while
+                    # sd-daemon.py was stopped. Report it as a failed export.
+                    del self.exports[exportId]
+                    return (exportId, { 'exportCompleted': True, 'error': 'The export was not found on the server.' })
+                if err.code == 401:
+                    raise
+                if err.code != 429 and err.code < 500:
+                    # Any other client error (e.g. 403) is not going to go away by polling again, so
+                    # the export is reported as failed instead of being polled before every other export.
+                    del self.exports[exportId]
+                    return (exportId, { 'exportCompleted': True, 'error': f'The export status could not be requested ({err}).' })
+                # The API is throttling or unavailable; ApiGate slows down or pauses all requests,
+                # and this export is polled again later.
+                print(f'Export status request failed ({err}), retrying...')
+                self.schedule_next_poll(schedule, {})
+                continue
+            except (http.client.HTTPException, OSError) as err:
+                # The connection failed or timed out; the export is polled again later, the same as
+                # when the API is unavailable, instead of ending the run with every other tracked export.
+                print(f'Export status request failed ({err}), retrying...')
+                self.schedule_next_poll(schedule, {})
+                continue
+            self.record_progress(schedule, exportStatusResult)
+            if exportStatusResult['exportCompleted']:
+                del self.exports[exportId]
+                self.record_completion(exportId, schedule)
+                return (exportId, exportStatusResult)
+
+            if exportStatusResult.get('reportsProgress'):
+                print(f'Export still in progress ({exportStatusResult.get("progress", 0)}% complete)...')
+            else:
+                print('Export still in progress...')
+            self.schedule_next_poll(schedule, exportStatusResult)
+        return None
+
+    # Estimates when the server started working on an export: between the last status request that
+    # reported no progress and the first one that reported some.
+    def record_progress(self, schedule, exportStatusResult):
+        now = time.monotonic()
+        schedule['pollCount'] += 1
+        if schedule['startedAt'] is not None:
+            return
+        if exportStatusResult['exportCompleted'] or (exportStatusResult.get('progress') or 0) > 0:
+            schedule['startedAt'] = (schedule['lastIdlePollAt'] + now) / 2
+        else:
+            schedule['lastIdlePollAt'] = now
+
+    # Records the queue wait and processing time of a completed export.
+    def record_completion(self, exportId, schedule):
+        now = time.monotonic()
+        details = { 'exportId': exportId, 'exportType': schedule['exportType'], 'statusPolls': schedule['pollCount'] }
+        self.apiClient.metrics.record('queue_wait', schedule['startedAt'] - schedule['trackedAt'], **details)
+        self.apiClient.metrics.record('processing', now - schedule['startedAt'], **details)
+
+    # Decides when the status of an in-progress export should be requested again.
+    def schedule_next_poll(self, schedule, exportStatusResult):
+        now = time.monotonic()
+        progress = exportStatusResult.get('progress') or 0
+        if exportStatusResult.get('reportsProgress') and 0 < progress < 100:
+            # Estimate the remaining time from the average rate of progress since the export was
+            # submitted, and check back around the time the export is expected to finish.
+            elapsedSeconds = now - schedule['trackedAt']
+            interval = elapsedSeconds * (100 - progress) / progress
+        else:
+            interval = schedule['interval'] * self.backoffFactor
+        schedule['interval'] = min(max(interval, self.minPollSeconds), self.maxPollSeconds)
+        schedule['nextPollAt'] = now + schedule['interval']
+
+# Keeps track of the number of bytes downloaded for a file across all of its byte ranges, and
+# prints the download progress every 10 percent.
+class DownloadProgress:
+    def __init__(self, localFilePath, totalBytes):
+        self.localFilePath = localFilePath
+        self.totalBytes = totalBytes
+        self.receivedBytes = 0
+        self.reportedPercent = 0
+        self.retryCount = 0
+        self.lock = threading.Lock()
+
+    def add_retry(self):
+        with self.lock:
+            self.retryCount += 1
+
+    # Starts the progress over for a file that is downloaded again from the start.
+    def restart(self):
+        with self.lock:
+            self.receivedBytes = 0
+            self.reportedPercent = 0
+            self.retryCount += 1
+
+    def add(self, byteCount):
+        with self.lock:
+            self.receivedBytes += byteCount
+            if not self.totalBytes:
+                return
+            percent = self.receivedBytes * 100 // self.totalBytes
+            if percent >= self.reportedPercent + 10:
+                self.reportedPercent = percent - percent % 10
+                print(f'Downloading {self.localFilePath}: {self.reportedPercent}% of {self.totalBytes / 1048576:.1f} MB')
@@ -0,0 +1,93 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import import_reducer
+
+# Builds chunks in the format read by import_pipeline.py from (uniqueId, sensorRole,
+# time, value) tuples, chunkSize data points per chunk.
+def build_chunks(points, chunkSize):
+    for start in range(0, len(points), chunkSize):
+        chunkPoints = points[start:start + chunkSize]
+        times = [timeMillis for uniqueId, sensorRole, timeMillis, value in chunkPoints]
+        values = [float(value) for uniqueId, sensorRole, timeMillis, value in chunkPoints]
+        if import_reducer.np is not None:
+            times = import_reducer.np.array(times, dtype = import_reducer.np.int64)
+            values = import_reducer.np.array(values, dtype = import_reducer.np.float64)
+        yield [[point[0] for point in chunkPoints], [point[1] for point in chunkPoints], times, values]
+
+# Reduces points in chunks of chunkSize and returns the uploaded points, sorted.
+def reduce_points(points, chunkSize, *reducerArgs):
+    reducer = import_reducer.DataPointReducer(*reducerArgs)
+    reducedPoints = []
+    for uniqueIds, sensorRoles, times, values in reducer.reduce_chunks(build_chunks(points, chunkSize)):
+        reducedPoints += zip(uniqueIds, sensorRoles, [int(timeMillis) for timeMillis in times], [float(value) for value in values])
+    return sorted(reducedPoints)
+
+reducerArgsList = [
+    (None,),
+    ('deadband', 0.5),
+    ('swinging-door', 0.5),
+    ('bucket', 0, 10000, 'mean'),
+    ('bucket', 0, 10000, 'last'),
+]
+
+class DataPointReducerTests:
+    def test_duplicate_time_across_chunks_keeps_last_value(self):
+        points = [('n', 's', 1000, 1), ('n', 's', 2000, 1), ('n', 's', 3000, 1), ('n', 's', 3000, 7), ('n', 's', 4000, 7)]
+        for reducerArgs in [(None,), ('deadband', 0.5), ('swinging-door', 0.5)]:
+            with self.subTest(reducerArgs = reducerArgs):
+                reducedPoints = reduce_points(points, 3, *reducerArgs)
+                self.assertIn(('n', 's', 3000, 7.0), reducedPoints)
+                self.assertNotIn(('n', 's', 3000, 1.0), reducedPoints)
+
+    def test_chunk_of_only_a_duplicate_time(self):
+        points = [('n', 's', 1000, 1), ('n', 's', 2000, 5), ('n', 's', 2000, 6)]
+        for reducerArgs in reducerArgsList:
+            with self.subTest(reducerArgs = reducerArgs):
+                self.assertEqual(reduce_points(points, 2, *reducerArgs), reduce_points(points, len(points), *reducerArgs))
+
+    def test_result_does_not_depend_on_chunk_size(self):
+        randomGenerator = random.Random(1)
+        points = []
+        for sensorRole in ['a', 'b']:
+            value = 0.0
+            for index in range(500):
+                if randomGenerator.random() < 0.2:
+                    value = round(value + randomGenerator.gauss(0, 1), 3)
+                points.append(('n', sensorRole, index * 1000, value))
+                if randomGenerator.random() < 0.05:
+                    points.append(('n', sensorRole, index * 1000, value + 5))
+        for reducerArgs in reducerArgsList:
+            expectedPoints = reduce_points(points, len(points), *reducerArgs)
+            for chunkSize in [1, 2, 7, 100]:
+                with self.subTest(reducerArgs = reducerArgs, chunkSize = chunkSize):
+                    reducedPoints = reduce_points(points, chunkSize, *reducerArgs)
+                    self.assertEqual([point[:3] for point in reducedPoints], [point[:3] for point in expectedPoints])
+                    for reducedPoint, expectedPoint in zip(reducedPoints, expectedPoints):
+                        self.assertAlmostEqual(reducedPoint[3], expectedPoint[3])
+
+    def test_last_point_of_each_pair_is_uploaded(self):
+        points = [('n', 'a', 1000, 1), ('n', 'a', 2000, 1), ('n', 'a', 3000, 1.1), ('n', 'b', 1000, 2)]
+        for reducerArgs in [('deadband', 0.5), ('swinging-door', 0.5)]:
+            with self.subTest(reducerArgs = reducerArgs):
+                reducedPoints = reduce_points(points, 2, *reducerArgs)
+                self.assertEqual(reducedPoints, [('n', 'a', 1000, 1.0), ('n', 'a', 3000, 1.1), ('n', 'b', 1000, 2.0)])
+
+@unittest.skipIf(import_reducer.np is None, 'NumPy is not installed')
+class NumPyDataPointReducerTests(DataPointReducerTests, unittest.TestCase):
+    pass
+
+class PurePythonDataPointReducerTests(DataPointReducerTests, unittest.TestCase):
+    def setUp(self):
+        self.np = import_reducer.np
+        import_reducer.np = None
+
+    def tearDown(self):
+        import_reducer.np = self.np
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import import_pipeline
+
+# Returns random date-time strings in the format accepted by import_pipeline.datetime_to_millis,
+# with some fields out of range (e.g. February 30 or hour 24) and some strings malformed.
+def build_datetime_strings(count):
+    randomGenerator = random.Random(1)
+    dateTimeStrings = []
+    for index in range(count):
+        dateTimeString = '{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}T{}{:02d}{:02d}'.format(
+            randomGenerator.choice([1, 1970, 2000, 2019, 2024, 2100, 9999, randomGenerator.randint(0, 9999)]),
+            randomGenerator.randint(0, 13), randomGenerator.randint(0, 32), randomGenerator.randint(0, 24),
+            randomGenerator.randint(0, 60), randomGenerator.randint(0, 60), randomGenerator.choice('+-'),
+            randomGenerator.randint(0, 24), randomGenerator.randint(0, 60))
+        if randomGenerator.random() < 0.05:
+            position = randomGenerator.randrange(len(dateTimeString))
+            dateTimeString = dateTimeString[:position] + randomGenerator.choice(['', 'x', ' ', '1']) + dateTimeString[position + 1:]
+        dateTimeStrings.append(dateTimeString)
+    return dateTimeStrings
+
+# Converts each timestamp with timestamp_to_millis, which parses date-time strings with strptime.
+# Returns the same tuple as timestamps_to_millis.
+def convert_one_at_a_time(timestamps):
+    millis, invalidIndexes = import_pipeline.convert_one_at_a_time(timestamps, import_pipeline.timestamp_to_millis)
+    return ([int(timeMillis) for timeMillis in millis], invalidIndexes)
+
+class TimestampConversionTests:
+    def assertConvertedLikeStrptime(self, timestamps):
+        millis, invalidIndexes = import_pipeline.timestamps_to_millis(timestamps)
+        expectedMillis, expectedInvalidIndexes = convert_one_at_a_time(timestamps)
+        self.assertEqual(list(invalidIndexes), expectedInvalidIndexes)
+        self.assertEqual([int(timeMillis) for timeMillis in millis], expectedMillis)
+
+    def test_datetime_strings_match_strptime(self):
+        self.assertConvertedLikeStrptime(build_datetime_strings(20000))
+
+    def test_leap_days(self):
+        self.assertConvertedLikeStrptime(['2000-02-29 12:00:00T+0000', '1900-02-29 12:00:00T+0000',
+            '2024-02-29 23:59:59T-2359', '2023-02-29 00:00:00T+0000', '0001-01-01 00:00:00T+0100'])
+
+    def test_numbers_mixed_with_datetime_strings(self):
+        self.assertConvertedLikeStrptime(['1574121600000', '2019-11-19 00:00:00T+0000', '1.5e12', 'nan', ''])
+
+    def test_epochs_outside_the_int64_range_are_invalid(self):
+        for timestamps, expectedInvalidIndexes in [([1e30, 1574121600000.0], [0]), (['1e30', '1574121600000'], [0]),
+                ([-1e30, 1574121600000.0], [0]), (['2019-11-19 00:00:00T+0000', '9223372036854775808'], [1]),
+                ([2 ** 63, 1574121600000], [0]), ([float('inf'), 0.0], [0])]:
+            with self.subTest(timestamps = timestamps):
+                millis, invalidIndexes = import_pipeline.timestamps_to_millis(timestamps)
+                self.assertEqual(list(invalidIndexes), expectedInvalidIndexes)
+                self.assertConvertedLikeStrptime(timestamps)
+
+@unittest.skipIf(import_pipeline.np is None, 'NumPy is not installed')
+class NumPyTimestampConversionTests(TimestampConversionTests, unittest.TestCase):
+    def test_unsigned_epochs_outside_the_int64_range_are_invalid(self):
+        np = import_pipeline.np
+        millis, invalidIndexes = import_pipeline.timestamps_to_millis(np.array([2 ** 64 - 1, 1574121600000], dtype = np.uint64))
+        self.assertEqual(invalidIndexes, [0])
+        self.assertEqual(millis.tolist(), [0, 1574121600000])
+
+class PurePythonTimestampConversionTests(TimestampConversionTests, unittest.TestCase):
+    def setUp(self):
+        self.np = import_pipeline.np
+        import_pipeline.np = None
+
+    def tearDown(self):
+        import_pipeline.np = self.np
+
+if __name__ == '__main__':
+    unittest.main()